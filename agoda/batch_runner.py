@@ -0,0 +1,103 @@
+"""Run a range of batches inside one Scrapy process.
+
+One browser, one DB connection and one parse of proxies/UAs/headers are shared by every batch,
+while logs and stats are still written per batch as logs/<timestamp>/batch_N.log (+ batch_N.stats.json,
+batch_N.metrics.json).
+
+Usage:
+    python -m agoda.batch_runner --start 0 --end 254 [--log-dir logs/<timestamp>]
+"""
+import os
+import json
+import time
+import logging
+import argparse
+import datetime
+from .metrics import get_metrics, CrawlMetrics
+
+
+class BatchRecorder:
+    """Switches the per-batch log file and dumps per-batch stat and metric deltas when a batch finishes."""
+
+    def __init__(self, crawler, log_dir):
+        self.crawler = crawler
+        self.log_dir = log_dir
+        self.handler = None
+        self.stats_before = {}
+        self.metrics = get_metrics(crawler)
+        self.metrics_before = None
+        self.started_at = None
+        os.makedirs(log_dir, exist_ok=True)
+
+    def log_path(self, batch_index):
+        return os.path.join(self.log_dir, f"batch_{batch_index}.log")
+
+    def begin(self, batch_index):
+        self.started_at = time.monotonic()
+        self.stats_before = dict(self.crawler.stats.get_stats())
+        self.metrics_before = self.metrics.snapshot()
+
+        # The process-wide LOG_FILE already captures single-batch runs, don't write the same lines twice
+        path = self.log_path(batch_index)
+        log_file = self.crawler.settings.get("LOG_FILE")
+        if log_file and os.path.abspath(log_file) == os.path.abspath(path):
+            return
+
+        settings = self.crawler.settings
+        self.handler = logging.FileHandler(path, encoding=settings.get("LOG_ENCODING", "utf-8"))
+        self.handler.setFormatter(logging.Formatter(
+            fmt=settings.get("LOG_FORMAT"), datefmt=settings.get("LOG_DATEFORMAT")
+        ))
+        self.handler.setLevel(settings.get("LOG_LEVEL"))
+        logging.root.addHandler(self.handler)
+
+    def end(self, batch_index, rows_scheduled):
+        stats = {"batch_index": batch_index, "rows_scheduled": rows_scheduled,
+                 "elapsed_seconds": round(time.monotonic() - self.started_at, 3)}
+        # Only numeric counters make sense as a per-batch delta
+        for key, value in self.crawler.stats.get_stats().items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                delta = value - self.stats_before.get(key, 0)
+                if delta:
+                    stats[key] = delta
+
+        with open(os.path.join(self.log_dir, f"batch_{batch_index}.stats.json"), "w") as f:
+            json.dump(stats, f, indent=2, sort_keys=True)
+
+        # Stage histograms, hotel outcomes, per-proxy outcomes and gauges for this batch (agoda/metrics.py)
+        metrics = CrawlMetrics.delta(self.metrics_before, self.metrics.snapshot())
+        metrics.update(batch_index=batch_index, elapsed_seconds=stats["elapsed_seconds"])
+        with open(os.path.join(self.log_dir, f"batch_{batch_index}.metrics.json"), "w") as f:
+            json.dump(metrics, f, indent=2)
+
+        if self.handler:
+            logging.root.removeHandler(self.handler)
+            self.handler.close()
+            self.handler = None
+
+
+def main():
+    # Imported lazily so `--help` works without a configured .env / HOTELS_FILE
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    parser = argparse.ArgumentParser(description="Run a range of batches in one long-running crawl.")
+    parser.add_argument("--start", type=int, required=True, help="first batch index")
+    parser.add_argument("--end", type=int, required=True, help="last batch index (inclusive)")
+    parser.add_argument("--log-dir", default=None, help="defaults to logs/<timestamp>")
+    args = parser.parse_args()
+
+    log_dir = args.log_dir or os.path.join("logs", datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S"))
+    os.makedirs(log_dir, exist_ok=True)
+
+    settings = get_project_settings()
+    settings.set("BATCH_LOG_DIR", log_dir)
+    settings.set("LOG_FILE", os.path.join(log_dir, f"job_{args.start}-{args.end}.log"))
+
+    process = CrawlerProcess(settings)
+    process.crawl("agoda_search_browser", batch_start=args.start, batch_end=args.end)
+    process.start()
+
+
+if __name__ == "__main__":
+    main()
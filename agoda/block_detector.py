@@ -0,0 +1,74 @@
+import re
+import json
+
+OK = "ok"
+SOFT_BLOCK = "soft_block"
+CAPTCHA = "captcha"
+MARKER_OVERLAP = 256  # bytes; longer than any body marker
+
+
+class BlockDetector:
+    """Classifies a response as hard CAPTCHA, soft block or OK.
+
+    Cheapest checks first: status code, then URL, then a bounded case-insensitive scan of the first
+    `head_bytes` of the raw body for specific markers (CAPTCHA widgets, block page titles), plus the
+    first `head_bytes` after `</head>`: Agoda's <head> alone (inline scripts, preloaded state) can be
+    larger than the scan window, and an interstitial injected into the <body> must still be seen.
+    The body is never decoded or copied in full. Rules live in block_rules.json.
+    """
+
+    def __init__(self, rules):
+        self.head_bytes = int(rules.get("head_bytes", 32768))
+        self.head_limit = int(rules.get("head_limit_bytes", 1048576))  # how far to look for </head>
+        self.status = {int(code): verdict for code, verdict in rules.get("status", {}).items()}
+        self.url_patterns = self.compile(rules.get("url_patterns", {}), str)
+        self.body_markers = self.compile(rules.get("body_markers", {}), bytes)
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def compile(groups, kind):
+        # One alternation per verdict; CAPTCHA is checked before soft block
+        compiled = []
+        for verdict in (CAPTCHA, SOFT_BLOCK):
+            markers = groups.get(verdict)
+            if markers:
+                alternation = "|".join(re.escape(m) for m in markers)
+                pattern = alternation.encode("utf-8") if kind is bytes else alternation
+                compiled.append((verdict, re.compile(pattern, re.IGNORECASE)))
+        return compiled
+
+    def classify(self, status, url, body):
+        """Return (verdict, reason)."""
+        verdict = self.status.get(status)
+        if verdict:
+            return verdict, f"status {status}"
+
+        for verdict, pattern in self.url_patterns:
+            match = pattern.search(url)
+            if match:
+                return verdict, f"url {match.group(0)}"
+
+        windows = self.scan_windows(body)
+        for verdict, pattern in self.body_markers:
+            for start, end in windows:
+                match = pattern.search(body, start, end)  # pos/endpos bound the scan without slicing
+                if match:
+                    return verdict, f"marker {match.group(0).decode('utf-8', 'replace')}"
+
+        return OK, None
+
+    def scan_windows(self, body):
+        """[(start, end)] byte ranges to scan: the first head_bytes, then head_bytes from the end of <head>."""
+        windows = [(0, self.head_bytes)]
+        head_end = body.find(b"</head>", 0, self.head_limit)
+        if head_end < 0:
+            head_end = body.find(b"</HEAD>", 0, self.head_limit)
+        if head_end >= 0:
+            # Continue where the first window stopped (a little overlap for a marker cut at the boundary)
+            start = max(head_end, self.head_bytes - MARKER_OVERLAP)
+            windows.append((start, start + self.head_bytes))
+        return windows
@@ -0,0 +1,235 @@
+import os
+import re
+import asyncio
+import logging
+from scrapy import signals
+from twisted.internet import task
+from .metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+GENERATION_SUFFIX = re.compile(r"-gen-\d+$")
+
+
+# ----------- MEMORY -------------
+def process_tree_rss():
+    """RSS (bytes) summed over this process's descendants: the Playwright driver and every Chromium
+    process. Shared pages are counted once per process, so this overstates a bit, but it tracks growth.
+    Returns None where neither psutil nor /proc is available."""
+    try:
+        import psutil  # optional dependency
+    except ImportError:
+        return proc_tree_rss()
+    total = 0
+    for child in psutil.Process().children(recursive=True):
+        try:
+            total += child.memory_info().rss
+        except psutil.Error:
+            pass  # exited between listing and reading
+    return total
+
+
+def proc_tree_rss():
+    # /proc fallback (Linux): parent map from /proc/<pid>/stat, RSS pages from /proc/<pid>/statm
+    if not os.path.isdir("/proc"):
+        return None
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    total, stack = 0, list(children.get(os.getpid(), []))
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            pass
+    return total
+
+
+# ----------- LIFECYCLE -------------
+class BrowserLifecycle:
+    """Bounds Chromium memory over long runs.
+
+    Every browser context is retired after `max_pages` pages: the next request for it goes to a new
+    generation of the context ("<name>-gen-<n>") and the old one is closed as soon as its last page is.
+    Browser memory is sampled every `sample_interval` seconds into stats; above `rss_limit_mb` all
+    contexts are recycled, above `restart_rss_mb` (a leak recycling didn't fix) the engine is paused, the
+    browser closed once idle, and scrapy-playwright launches a fresh one for the next request. A browser
+    whose pages don't drain in time is left running and the restart is tried again on a later sample.
+    """
+
+    def __init__(self, crawler, max_pages=100, rss_limit_mb=1500, restart_rss_mb=2500, sample_interval=15.0):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.max_pages = max_pages
+        self.rss_limit_mb = rss_limit_mb
+        self.restart_rss_mb = restart_rss_mb
+        self.sample_interval = sample_interval
+        self.generations = {}  # base context name → current generation
+        self.contexts = {}     # context name → BrowserContext
+        self.pages = {}        # context name → pages opened in it
+        self.open_pages = {}   # context name → pages still open
+        self.retired = set()   # context names waiting for their last page before closing
+        self.browser = None
+        self.restarting = False
+        self.rss_mb = None
+        self.sampler = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        lifecycle = cls(
+            crawler,
+            max_pages=settings.getint("BROWSER_CONTEXT_MAX_PAGES", 100),
+            rss_limit_mb=settings.getfloat("BROWSER_RSS_LIMIT_MB", 1500),
+            restart_rss_mb=settings.getfloat("BROWSER_RESTART_RSS_MB", 2500),
+            sample_interval=settings.getfloat("BROWSER_MEMORY_SAMPLE_INTERVAL", 15.0),
+        )
+        get_metrics(crawler).gauge("browser_rss_mb", "Browser process tree RSS (MB)", lambda: lifecycle.rss_mb or 0)
+        crawler.signals.connect(lifecycle.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(lifecycle.spider_closed, signal=signals.spider_closed)
+        return lifecycle
+
+    def spider_opened(self, spider):
+        if self.sample_interval > 0:
+            self.sampler = task.LoopingCall(self.sample)
+            self.sampler.start(self.sample_interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.sampler and self.sampler.running:
+            self.sampler.stop()
+
+    # ----------- CONTEXT NAMES -------------
+    def context_name(self, base):
+        generation = self.generations.get(base, 0)
+        return f"{base}-gen-{generation}" if generation else base
+
+    @staticmethod
+    def base_name(name):
+        return GENERATION_SUFFIX.sub("", name)
+
+    # ----------- PAGES -------------
+    def track(self, page, request):
+        """Count a new page against its context (called from the page init coroutine)."""
+        name = request.meta.get("playwright_context", "default")
+        context = page.context
+        self.contexts[name] = context
+        self.pages[name] = self.pages.get(name, 0) + 1
+        self.open_pages[name] = self.open_pages.get(name, 0) + 1
+        page.once("close", lambda _: self.page_closed(name))
+
+        if context.browser is not None and context.browser is not self.browser:
+            self.browser = context.browser
+            self.browser.once("disconnected", lambda _: self.browser_disconnected())
+
+        if self.max_pages and self.pages[name] >= self.max_pages:
+            self.retire(name)
+
+    def page_closed(self, name):
+        if name not in self.open_pages:
+            return  # context already closed / browser gone
+        self.open_pages[name] = max(self.open_pages.get(name, 0) - 1, 0)
+        self.maybe_close(name)
+
+    def open_page_count(self):
+        return sum(self.open_pages.values())
+
+    # ----------- RECYCLING -------------
+    def retire(self, name):
+        base = self.base_name(name)
+        if self.context_name(base) != name:
+            return  # already replaced by a newer generation
+        self.generations[base] = self.generations.get(base, 0) + 1
+        self.retired.add(name)
+        self.stats.inc_value("browser/contexts_recycled")
+        self.maybe_close(name)
+
+    def maybe_close(self, name):
+        if name in self.retired and not self.open_pages.get(name):
+            self.retired.discard(name)
+            context = self.contexts.pop(name, None)
+            self.pages.pop(name, None)
+            self.open_pages.pop(name, None)
+            if context is not None:
+                self.stats.inc_value("browser/contexts_closed")
+                asyncio.ensure_future(self.close_context(context))
+
+    @staticmethod
+    async def close_context(context):
+        try:
+            await context.close()  # scrapy-playwright drops its reference on the context's "close" event
+        except Exception as e:
+            logger.debug(f"[BROWSER] Context already closed: {e}")
+
+    def browser_disconnected(self):
+        # Crash or our own restart: every context went with the browser, scrapy-playwright relaunches it
+        self.stats.inc_value("browser/disconnected")
+        self.stats.inc_value("browser/contexts_closed", len(self.contexts))
+        self.browser = None
+        self.contexts.clear()
+        self.pages.clear()
+        self.open_pages.clear()
+        self.retired.clear()
+
+    # ----------- MEMORY -------------
+    def sample(self):
+        rss = process_tree_rss()
+        if rss is None:
+            return
+        self.rss_mb = rss / 2 ** 20
+        self.stats.set_value("browser/rss_mb", round(self.rss_mb))
+        self.stats.max_value("browser/rss_mb_max", round(self.rss_mb))
+        if self.restarting:
+            return
+        if self.restart_rss_mb and self.rss_mb > self.restart_rss_mb and self.browser is not None:
+            logger.warning(f"[BROWSER] Browser memory at {self.rss_mb:.0f} MB — restarting the browser")
+            asyncio.ensure_future(self.restart())
+        elif self.rss_limit_mb and self.rss_mb > self.rss_limit_mb and not self.retired:
+            # Wait for the previous round to close before recycling again, so contexts aren't churned
+            logger.info(f"[BROWSER] Browser memory at {self.rss_mb:.0f} MB — recycling {len(self.contexts)} contexts")
+            self.stats.inc_value("browser/memory_recycles")
+            for name in list(self.contexts):
+                self.retire(name)
+
+    async def restart(self, drain_timeout=120):
+        self.restarting = True
+        engine = self.crawler.engine
+        engine.pause()  # no new pages while the browser drains
+        try:
+            waited = 0.0
+            while self.open_page_count() and waited < drain_timeout:
+                await asyncio.sleep(0.5)
+                waited += 0.5
+            if self.open_page_count():
+                # Closing now would fail those requests; let them finish and retry on a later sample
+                logger.warning(f"[BROWSER] {self.open_page_count()} pages still open after {drain_timeout}s "
+                               f"— restart postponed")
+                self.stats.inc_value("browser/restarts_postponed")
+                for name in list(self.contexts):
+                    self.retire(name)  # meanwhile, close what can be closed as its pages finish
+            elif self.browser is not None:
+                self.stats.inc_value("browser/restarts")
+                await self.browser.close()
+        except Exception as e:
+            logger.error(f"[BROWSER] Restart failed: {e}")
+        finally:
+            self.restarting = False
+            engine.unpause()
+
+
+def get_browser_lifecycle(crawler):
+    """The crawler's BrowserLifecycle, shared by the proxy middleware (context names) and the page coroutine."""
+    lifecycle = getattr(crawler, "agoda_browser_lifecycle", None)
+    if lifecycle is None:
+        lifecycle = crawler.agoda_browser_lifecycle = BrowserLifecycle.from_crawler(crawler)
+    return lifecycle
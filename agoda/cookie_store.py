@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import datetime
+import threading
+import http.cookies
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+STATE_VERSION = 2
+
+
+def cookie_domain(url):
+    # Domain for cookies whose origin isn't recorded (legacy jar): "www.agoda.com" → ".agoda.com"
+    host = urlsplit(url).hostname or ""
+    return "." + host[4:] if host.startswith("www.") else host
+
+
+def domain_matches(host, domain):
+    domain = domain.lstrip(".")
+    return host == domain or host.endswith("." + domain)
+
+
+def parse_set_cookie(header, default_domain):
+    """Set-Cookie header → Playwright-style cookie dicts (name, value, domain, path, expires, ...)."""
+    simple_cookie = http.cookies.SimpleCookie()
+    try:
+        simple_cookie.load(header.decode("latin-1") if isinstance(header, bytes) else header)
+    except http.cookies.CookieError:
+        return []
+    cookies = []
+    for name, morsel in simple_cookie.items():
+        expires = -1  # session cookie
+        if morsel["max-age"]:
+            try:
+                expires = time.time() + int(morsel["max-age"])
+            except ValueError:
+                pass
+        elif morsel["expires"]:
+            try:
+                expires = parsedate_to_datetime(morsel["expires"]).timestamp()
+            except (TypeError, ValueError):
+                pass
+        samesite = (morsel["samesite"] or "Lax").capitalize()
+        cookies.append({
+            "name": name,
+            "value": morsel.value,
+            "domain": morsel["domain"] or default_domain,
+            "path": morsel["path"] or "/",
+            "expires": expires,
+            "httpOnly": bool(morsel["httponly"]),
+            "secure": bool(morsel["secure"]),
+            "sameSite": samesite if samesite in ("Strict", "Lax", "None") else "Lax",
+        })
+    return cookies
+
+
+class CookieStore:
+    """Per-proxy cookie sessions kept in memory, in Playwright `storage_state` shape.
+
+    Every change bumps the proxy's revision (so browser contexts know when to re-sync) and schedules
+    one debounced save: at most one write per `save_interval`, done off the reactor thread, via temp
+    file + rename so a crash never leaves a half-written jar. Writes are serialised by a lock and
+    numbered, so an older snapshot never lands on top of a newer one. Reads the old cookies.json layout
+    ({proxy: {"cookies": {name: value}, "last_updated": iso}}) as well.
+
+    Session age and cookie expiry are checked against monotonic deadlines (wall-clock time is only
+    what gets saved), and Cookie headers are cached per proxy + host until the jar changes or the
+    first of their cookies expires.
+    """
+
+    def __init__(self, path, default_url, max_age=86400, save_interval=5.0, stats=None):
+        self.path = path
+        self.default_domain = cookie_domain(default_url)
+        self.max_age = max_age
+        self.save_interval = save_interval
+        self.stats = stats
+        self.revisions = {}
+        self.save_call = None
+        self.write_lock = threading.Lock()  # background saves and flush() share the temp file
+        self.snapshots_taken = 0
+        self.snapshot_written = 0
+        self.sessions = self.load()
+        self.deadlines = {proxy: self.deadline(session["updated_at"]) for proxy, session in self.sessions.items()}
+        self.header_cache = {}  # proxy → {host: (valid_until, header)}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            settings.get("COOKIE_JAR_FILE", "cookies.json"),
+            settings.get("AGODA_BASE_URL", "https://www.agoda.com/"),
+            max_age=settings.getfloat("COOKIE_MAX_AGE", 86400),
+            save_interval=settings.getfloat("COOKIE_SAVE_INTERVAL", 5.0),
+            stats=crawler.stats,
+        )
+
+    # ----------- STATE -------------
+    def load(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            print(f"[COOKIES] '{self.path}' unreadable — starting with fresh jar.")
+            return {}
+        if saved.get("version") == STATE_VERSION:
+            return saved.get("proxies", {})
+
+        sessions = {}
+        for proxy, data in saved.items():  # legacy layout
+            try:
+                updated_at = datetime.datetime.fromisoformat(data["last_updated"]).replace(
+                    tzinfo=datetime.timezone.utc).timestamp()
+                cookies = [{"name": k, "value": v, "domain": self.default_domain, "path": "/", "expires": -1,
+                            "httpOnly": False, "secure": False, "sameSite": "Lax"}
+                           for k, v in data["cookies"].items()]
+            except (KeyError, TypeError, ValueError, AttributeError):
+                continue
+            sessions[proxy] = {"cookies": cookies, "origins": [], "updated_at": updated_at}
+        return sessions
+
+    def snapshot(self):
+        """(sequence, payload), taken on the reactor thread."""
+        self.snapshots_taken += 1
+        return self.snapshots_taken, json.dumps({"version": STATE_VERSION, "proxies": self.sessions})
+
+    def write(self, snapshot):
+        sequence, payload = snapshot
+        with self.write_lock:
+            if sequence <= self.snapshot_written:
+                return  # a newer snapshot is already on disk
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+            self.snapshot_written = sequence
+
+    def schedule_save(self):
+        if self.save_call is not None:
+            return  # a save is already pending and will include this change
+        from twisted.internet import reactor, threads  # the reactor must already be installed by Scrapy
+
+        def save():
+            self.save_call = None
+            # Serialise on the reactor thread (consistent copy), write on a worker thread
+            threads.deferToThread(self.write, self.snapshot())
+            if self.stats:
+                self.stats.inc_value("cookies/saves")
+
+        self.save_call = reactor.callLater(self.save_interval, save)
+
+    def flush(self):
+        """Write pending changes now (spider close); waits for a background write still in progress."""
+        if self.save_call is not None and self.save_call.active():
+            self.save_call.cancel()
+        self.save_call = None
+        self.write(self.snapshot())
+
+    def deadline(self, updated_at):
+        # Monotonic time at which a session saved at wall-clock `updated_at` gets too old
+        return time.monotonic() + self.max_age - (time.time() - updated_at)
+
+    def changed(self, proxy):
+        self.revisions[proxy] = self.revisions.get(proxy, 0) + 1
+        self.header_cache.pop(proxy, None)
+        self.schedule_save()
+        return self.revisions[proxy]
+
+    # ----------- READ -------------
+    def session(self, proxy):
+        """The proxy's live session, or None (sessions older than `max_age` are dropped)."""
+        session = self.sessions.get(proxy)
+        if session is None:
+            return None
+        if time.monotonic() >= self.deadlines[proxy]:
+            self.clear(proxy)
+            if self.stats:
+                self.stats.inc_value("cookies/expired")
+            return None
+        return session
+
+    def revision(self, proxy):
+        return self.revisions.get(proxy, 0)
+
+    def cookies(self, proxy):
+        session = self.session(proxy)
+        if not session:
+            return []
+        now = time.time()
+        return [c for c in session["cookies"] if c.get("expires", -1) in (-1, None) or c["expires"] > now]
+
+    def cookie_header(self, proxy, url):
+        host = urlsplit(url).hostname or ""
+        cached = self.header_cache.get(proxy, {}).get(host)
+        now = time.monotonic()
+        if cached is not None and now < cached[0]:
+            return cached[1]
+
+        cookies = [c for c in self.cookies(proxy) if domain_matches(host, c["domain"])]
+        header = "; ".join(f"{c['name']}={c['value']}" for c in cookies)
+        # Valid until the session gets too old or its first cookie expires, whichever comes first
+        valid_until = self.deadlines.get(proxy, now)
+        expiries = [c["expires"] for c in cookies if c.get("expires", -1) not in (-1, None)]
+        if expiries:
+            valid_until = min(valid_until, now + min(expiries) - time.time())
+        self.header_cache.setdefault(proxy, {})[host] = (valid_until, header)
+        return header
+
+    def storage_state(self, proxy):
+        """Playwright storage_state for a new context bound to this proxy (None if there's no session)."""
+        session = self.session(proxy)
+        if not session:
+            return None
+        return {"cookies": self.cookies(proxy), "origins": session.get("origins", [])}
+
+    # ----------- WRITE -------------
+    def update_from_headers(self, proxy, set_cookie_headers, url):
+        """Merge Set-Cookie headers of a response into the proxy's session."""
+        default_domain = urlsplit(url).hostname or self.default_domain
+        cookies = [c for header in set_cookie_headers for c in parse_set_cookie(header, default_domain)]
+        if not cookies:
+            return self.revision(proxy)
+        session = self.session(proxy) or {"cookies": [], "origins": []}
+        merged = {(c["name"], c["domain"], c["path"]): c for c in session["cookies"]}
+        merged.update({(c["name"], c["domain"], c["path"]): c for c in cookies})
+        self.sessions[proxy] = {**session, "cookies": list(merged.values()), "updated_at": time.time()}
+        self.deadlines[proxy] = time.monotonic() + self.max_age
+        return self.changed(proxy)
+
+    def update_from_storage_state(self, proxy, state):
+        """Replace the proxy's session with what the browser context holds (the browser is authoritative)."""
+        self.sessions[proxy] = {
+            "cookies": state.get("cookies", []),
+            "origins": state.get("origins", []),
+            "updated_at": time.time(),
+        }
+        self.deadlines[proxy] = time.monotonic() + self.max_age
+        return self.changed(proxy)
+
+    def clear(self, proxy):
+        self.deadlines.pop(proxy, None)
+        if self.sessions.pop(proxy, None) is not None:
+            self.changed(proxy)
+
+
+def get_cookie_store(crawler):
+    """The crawler's CookieStore, shared by the downloader middleware and the page coroutine."""
+    store = getattr(crawler, "agoda_cookie_store", None)
+    if store is None:
+        store = crawler.agoda_cookie_store = CookieStore.from_crawler(crawler)
+    return store
@@ -0,0 +1,296 @@
+"""Hotel page extraction: one DOM parse per page, precompiled selectors, proper srcset handling.
+
+Two interchangeable backends, chosen with HOTEL_EXTRACTOR: "lxml" (always available, lxml ships with
+Scrapy) and "selectolax" (faster, optional dependency). Both return the same dict.
+
+`extract_embedded_state` reads the same fields from the page's embedded JSON (schema.org JSON-LD and
+the serialized app state), for hotel pages fetched over plain HTTP without rendering.
+"""
+import re
+import json
+from urllib.parse import urljoin, urlsplit
+import lxml.html
+from lxml import etree
+from cssselect import GenericTranslator
+
+IMAGE_SOURCES = (
+    "pix8.agoda.net/hotelImages",
+    "pix8.agoda.net/property",
+    "bstatic.com/xdata/images/hotel/"
+)
+IMAGE_SOURCE_PATTERN = re.compile("|".join(re.escape(s) for s in IMAGE_SOURCES))
+
+NAME = "h1[data-selenium='hotel-header-name']"
+ADDRESS = "span[data-selenium='hotel-address-map']"
+DESCRIPTION = "span[data-element-name='property-short-description']"
+FACILITIES = "div[data-element-name='atf-top-amenities-item'] p"
+SRCSET_ATTRIBUTES = ("srcset", "data-srcset")
+SRC_ATTRIBUTES = ("data-src", "data-original", "data-lazy-src", "src")
+EMPTY_RESULT = {"name": None, "address": None, "description": None, "facilities": [], "image_urls": []}
+
+JSON_LD_SCRIPT = re.compile(r'<script[^>]+type=["\']application/ld\+json["\'][^>]*>(.*?)</script>', re.S | re.I)
+# Serialized client state: `window.__INITIAL_STATE__ = {...}` / Next.js style JSON script
+STATE_ASSIGNMENT = re.compile(r"(?:window\.)?__(?:INITIAL_STATE|NEXT_DATA|APOLLO_STATE)__\s*=\s*", re.S)
+STATE_SCRIPT = re.compile(r'<script[^>]+id=["\']__NEXT_DATA__["\'][^>]*>(.*?)</script>', re.S | re.I)
+LODGING_TYPES = {"Hotel", "LodgingBusiness", "Resort", "Hostel", "Motel", "BedAndBreakfast", "Apartment"}
+RESIZE_QUERY = re.compile(r"[?&]s=(\d+)x")
+AGODA_SHARD = re.compile(r"^pix\d*\.agoda\.net$")
+# Booking CDN size segment: /max1024x768/, /max500/, /square60/, /max1280x900_ao/
+BSTATIC_SIZE = re.compile(r"/(?:max|min|square)\d+(?:x\d+)?(?:_\w+)?/")
+# One srcset candidate: a whitespace-free URL (commas inside it stay) and everything up to the next comma as
+# its descriptor. Trailing commas aren't part of the URL: the lookbehind backs the URL off them, which leaves
+# an empty descriptor, so a trailing comma ends a descriptor-less candidate.
+SRCSET_CANDIDATE = re.compile(r"([^\s,]\S*)(?<!,)([^,]*)")
+# Plain http(s)://host/path URLs (nearly every image URL) split without urlsplit; anything else takes urlsplit
+SIMPLE_URL = re.compile(r"https?://([A-Za-z0-9.-]+)((?:/[^?#\t\r\n]*)?)(?=[?#]|$)")
+HAS_SCHEME = re.compile(r"[a-zA-Z][a-zA-Z0-9+.-]*:")
+
+
+# ----------- SRCSET -------------
+def parse_srcset(srcset):
+    """Parse a srcset into [(url, width_or_None, density_or_None)], following the HTML candidate rules
+    (URLs may contain commas; a trailing comma ends a descriptor-less candidate)."""
+    candidates = []
+    for match in SRCSET_CANDIDATE.finditer(srcset):
+        url, descriptor = match.groups()
+        width = density = None
+        if descriptor:
+            for token in descriptor.split():
+                try:
+                    if token.endswith("w"):
+                        width = int(token[:-1])
+                    elif token.endswith("x"):
+                        density = float(token[:-1])
+                except ValueError:
+                    pass  # malformed descriptor, keep the URL without it
+        candidates.append((url, width, density))
+    return candidates
+
+
+def largest_candidate(candidates):
+    """Largest candidate by `w` descriptor, else by `x` density (a bare URL counts as 1x)."""
+    if not candidates:
+        return None, None
+    with_width = [c for c in candidates if c[1] is not None]
+    if with_width:
+        url, width, _ = max(with_width, key=lambda c: c[1])
+        return url, width
+    url, _, density = max(candidates, key=lambda c: c[2] or 1.0)
+    return url, None
+
+
+def image_key(url):
+    """Size/shard/query independent identity of an image URL ("pix.agoda.net/hotelImages/.../x.jpg").
+    Dedupes a page's variants here and is `hotel_images.image_key` (agoda/images.py)."""
+    simple = SIMPLE_URL.match(url)
+    if simple:
+        host, path = simple.group(1).lower(), simple.group(2)
+    else:
+        parts = urlsplit(url)
+        host = (parts.hostname or "").lower()
+        path = parts.path
+    if AGODA_SHARD.match(host):
+        host = "pix.agoda.net"
+    elif host == "bstatic.com" or host.endswith(".bstatic.com"):
+        host = "bstatic.com"
+        path = BSTATIC_SIZE.sub("/", path, count=1)
+    return host + path
+
+
+def collect_image_urls(images, base_url):
+    """`images` yields attribute dicts; returns hotel image URLs, deduped, largest variant kept, page order."""
+    best = {}  # key → (width, url)
+    scheme = urlsplit(base_url).scheme
+    for attrs in images:
+        candidates = []
+        for name in SRCSET_ATTRIBUTES:
+            value = attrs.get(name)
+            if value and IMAGE_SOURCE_PATTERN.search(value):
+                candidates.extend(parse_srcset(value))
+        if candidates:
+            url, width = largest_candidate(candidates)
+        else:
+            # No srcset (lazy-loaded or plain <img>): fall back to the single-URL attributes
+            for name in SRC_ATTRIBUTES:
+                url = attrs.get(name)
+                if url and IMAGE_SOURCE_PATTERN.search(url):
+                    width = None
+                    break
+            else:
+                continue
+        if scheme and url.startswith("//"):
+            url = f"{scheme}:{url}"  # protocol-relative (common on the CDN): only the scheme to borrow
+        elif not HAS_SCHEME.match(url):
+            url = urljoin(base_url, url)  # relative; absolute URLs skip the join
+        key = image_key(url)
+        width = width or 0
+        if key not in best or width > best[key][0]:
+            best[key] = (width, url)
+    return [url for _, url in best.values()]
+
+
+# ----------- EMBEDDED STATE -------------
+def iter_json(value):
+    """Every dict/list/string inside a decoded JSON document, breadth first."""
+    queue = [value]
+    while queue:
+        node = queue.pop(0)
+        yield node
+        if isinstance(node, dict):
+            queue.extend(node.values())
+        elif isinstance(node, list):
+            queue.extend(node)
+
+
+def json_documents(text):
+    for match in JSON_LD_SCRIPT.finditer(text):
+        try:
+            yield "ld", json.loads(match.group(1))
+        except ValueError:
+            continue
+    for match in STATE_SCRIPT.finditer(text):
+        try:
+            yield "state", json.loads(match.group(1))
+        except ValueError:
+            continue
+    decoder = json.JSONDecoder()
+    for match in STATE_ASSIGNMENT.finditer(text):
+        try:
+            yield "state", decoder.raw_decode(text, match.end())[0]  # stops at the end of the object literal
+        except ValueError:
+            continue
+
+
+def lodging_entity(document):
+    for node in iter_json(document):
+        if isinstance(node, dict):
+            types = node.get("@type")
+            types = types if isinstance(types, list) else [types]
+            if LODGING_TYPES.intersection(t for t in types if isinstance(t, str)):
+                return node
+    return None
+
+
+def format_address(address):
+    if isinstance(address, dict):
+        parts = (address.get(k) for k in ("streetAddress", "addressLocality", "addressRegion", "postalCode"))
+        country = address.get("addressCountry")
+        if isinstance(country, dict):
+            country = country.get("name")
+        return ", ".join(p for p in (*parts, country) if isinstance(p, str) and p.strip()) or None
+    return address if isinstance(address, str) else None
+
+
+def state_image_urls(urls, base_url):
+    """Hotel image URLs found in JSON, deduped by image_key; an unresized URL (or the widest `s=WxH`) wins."""
+    best = {}  # key → (width, url)
+    for url in urls:
+        if not IMAGE_SOURCE_PATTERN.search(url) or url.startswith("data:"):
+            continue
+        url = urljoin(base_url, url)  # protocol-relative //pix8... URLs are common in state
+        size = RESIZE_QUERY.search(url)
+        width = int(size.group(1)) if size else float("inf")
+        key = image_key(url)
+        if key not in best or width > best[key][0]:
+            best[key] = (width, url)
+    return [url for _, url in best.values()]
+
+
+def extract_embedded_state(body, base_url):
+    """Hotel fields from embedded JSON, same dict shape as the DOM extractors (missing → None / [])."""
+    text = body.decode("utf-8", "replace") if isinstance(body, bytes) else (body or "")
+    result = dict(EMPTY_RESULT, facilities=[], image_urls=[])
+    strings = []
+    for kind, document in json_documents(text):
+        hotel = lodging_entity(document) if kind == "ld" else None
+        if hotel and not result["name"]:
+            result["name"] = hotel.get("name") if isinstance(hotel.get("name"), str) else None
+            result["address"] = format_address(hotel.get("address"))
+            result["description"] = clean(hotel.get("description")) if isinstance(hotel.get("description"), str) else None
+            result["facilities"] = [a["name"] for a in hotel.get("amenityFeature") or []
+                                    if isinstance(a, dict) and isinstance(a.get("name"), str)]
+        # Image URLs can sit anywhere (photo gallery arrays in the app state, JSON-LD `image`)
+        strings.extend(node for node in iter_json(document) if isinstance(node, str))
+    result["image_urls"] = state_image_urls(strings, base_url)
+    return result
+
+
+def merge_results(primary, fallback):
+    """Field-wise: the primary value when present, else the fallback; image URLs are unioned."""
+    merged = {key: primary.get(key) or fallback.get(key) for key in EMPTY_RESULT}
+    merged["image_urls"] = state_image_urls(
+        (primary.get("image_urls") or []) + (fallback.get("image_urls") or []), "")
+    return merged
+
+
+def clean(text):
+    return text.strip() if text else text
+
+
+# ----------- BACKENDS -------------
+def _text_xpath(css):
+    # Same semantics as parsel's `selector::text`: direct text children of the matched elements
+    return etree.XPath(GenericTranslator().css_to_xpath(css) + "/text()")
+
+
+class LxmlExtractor:
+    name_xpath = _text_xpath(NAME)
+    address_xpath = _text_xpath(ADDRESS)
+    description_xpath = _text_xpath(DESCRIPTION)
+    facilities_xpath = _text_xpath(FACILITIES)
+    images_xpath = etree.XPath("//img")
+
+    def extract(self, body, base_url):
+        if not body or not body.strip():
+            return dict(EMPTY_RESULT)
+        root = lxml.html.fromstring(body)
+
+        def first(xpath):
+            found = xpath(root)
+            return str(found[0]) if found else None
+
+        return {
+            "name": first(self.name_xpath),
+            "address": first(self.address_xpath),
+            "description": clean(first(self.description_xpath)),
+            "facilities": [str(t) for t in self.facilities_xpath(root)],
+            "image_urls": collect_image_urls((img.attrib for img in self.images_xpath(root)), base_url),
+        }
+
+
+class SelectolaxExtractor:
+    def __init__(self):
+        try:
+            from selectolax.lexbor import LexborHTMLParser as HTMLParser  # optional dependency
+        except ImportError:
+            from selectolax.parser import HTMLParser  # selectolax < 0.3.13, before the Lexbor backend
+        self.parser = HTMLParser
+
+    def extract(self, body, base_url):
+        tree = self.parser(body)
+
+        def first(css):
+            node = tree.css_first(css)
+            return node.text(deep=False) if node else None
+
+        return {
+            "name": first(NAME),
+            "address": first(ADDRESS),
+            "description": clean(first(DESCRIPTION)),
+            "facilities": [n.text(deep=False) for n in tree.css(FACILITIES)],
+            "image_urls": collect_image_urls((n.attributes for n in tree.css("img")), base_url),
+        }
+
+
+EXTRACTORS = {
+    "lxml": LxmlExtractor,
+    "selectolax": SelectolaxExtractor,
+}
+
+
+def get_extractor(name="lxml"):
+    try:
+        return EXTRACTORS[name]()
+    except ImportError:
+        # selectolax not installed → lxml does the same job, just slower
+        return LxmlExtractor()
@@ -0,0 +1,163 @@
+"""Persistent record of hotels that failed, keyed by input row, with a classified reason.
+
+`scrapy crawl agoda_search_browser -a mode=retry-failed` (./launch.sh --retry-failed) re-runs only the
+rows whose retry is due, so a recovery pass costs as much as the failures, not the batch. Each reason
+has its own attempt limit and (exponential) backoff, see FAILURE_RETRY_POLICY.
+
+Summary / export:
+    python -m agoda.failure_store [--path output/failures.sqlite] [--csv failed_hotels.csv]
+"""
+import os
+import csv
+import time
+import sqlite3
+import argparse
+
+TIMEOUT = "timeout"
+CAPTCHA = "captcha"
+NO_LISTING = "no_listing"
+SELECTOR_MISSING = "selector_missing"
+DB_ERROR = "db_error"
+ERROR = "error"  # anything else (connection refused, browser crash, ...)
+
+FAILED = "failed"
+GIVEN_UP = "given_up"
+
+# max_attempts counts every failure of the row; backoff (seconds) doubles after each failed attempt
+RETRY_POLICY = {
+    TIMEOUT: {"max_attempts": 3, "backoff": 600},
+    CAPTCHA: {"max_attempts": 5, "backoff": 1800},
+    NO_LISTING: {"max_attempts": 2, "backoff": 7 * 86400},
+    SELECTOR_MISSING: {"max_attempts": 2, "backoff": 3600},
+    DB_ERROR: {"max_attempts": 5, "backoff": 300},
+    ERROR: {"max_attempts": 3, "backoff": 900},
+}
+
+
+class FailureStore:
+    def __init__(self, path, input_name, policy=None):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.input_name = input_name
+        self.policy = {**RETRY_POLICY, **(policy or {})}
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS failed_hotels (
+                input TEXT NOT NULL,
+                row_index INTEGER NOT NULL,
+                hotel_name TEXT,
+                reason TEXT NOT NULL,
+                detail TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL,
+                first_failed_at REAL NOT NULL,
+                last_failed_at REAL NOT NULL,
+                next_retry_at REAL,
+                PRIMARY KEY (input, row_index)
+            )
+        """)
+        self.connection.commit()
+        # Rows with an open failure, so a success only touches the DB when it clears one
+        self.failed_rows = {row for (row,) in self.connection.execute(
+            "SELECT row_index FROM failed_hotels WHERE input = ?", (input_name,))}
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            settings.get("FAILURE_STORE_PATH", "output/failures.sqlite"),
+            os.path.basename(settings.get("HOTELS_FILE", "hotels.csv")),
+            settings.getdict("FAILURE_RETRY_POLICY"),
+        )
+
+    def record(self, row_index, reason, hotel_name=None, detail=None):
+        """Record one failed attempt; returns the row's status (FAILED = will be retried, GIVEN_UP)."""
+        if row_index is None:
+            return None
+        now = time.time()
+        row = self.connection.execute(
+            "SELECT attempts, first_failed_at FROM failed_hotels WHERE input = ? AND row_index = ?",
+            (self.input_name, row_index),
+        ).fetchone()
+        attempts = (row[0] if row else 0) + 1
+        policy = self.policy.get(reason, self.policy[ERROR])
+        if attempts < policy["max_attempts"]:
+            status, next_retry_at = FAILED, now + policy["backoff"] * 2 ** (attempts - 1)
+        else:
+            status, next_retry_at = GIVEN_UP, None
+        self.connection.execute("""
+            INSERT OR REPLACE INTO failed_hotels
+                (input, row_index, hotel_name, reason, detail, attempts, status, first_failed_at, last_failed_at, next_retry_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, (self.input_name, row_index, hotel_name, reason, detail, attempts, status,
+              row[1] if row else now, now, next_retry_at))
+        self.connection.commit()
+        self.failed_rows.add(row_index)
+        return status
+
+    def resolve(self, row_index):
+        """The row succeeded: forget its failure."""
+        if row_index not in self.failed_rows:
+            return
+        self.connection.execute("DELETE FROM failed_hotels WHERE input = ? AND row_index = ?",
+                                (self.input_name, row_index))
+        self.connection.commit()
+        self.failed_rows.discard(row_index)
+
+    def due(self, now=None):
+        """Row indices whose retry is due, in input order."""
+        rows = self.connection.execute("""
+            SELECT row_index FROM failed_hotels
+            WHERE input = ? AND status = ? AND next_retry_at <= ?
+            ORDER BY row_index
+        """, (self.input_name, FAILED, now or time.time()))
+        return [row for (row,) in rows]
+
+    def pending_retries(self, row_start, row_end, now=None):
+        """{row_index: next_retry_at} for rows in [row_start, row_end) that will be retried, but not yet."""
+        rows = self.connection.execute("""
+            SELECT row_index, next_retry_at FROM failed_hotels
+            WHERE input = ? AND status = ? AND row_index >= ? AND row_index < ? AND next_retry_at > ?
+        """, (self.input_name, FAILED, row_start, row_end, now or time.time()))
+        return dict(rows.fetchall())
+
+    def summary(self):
+        rows = self.connection.execute("""
+            SELECT reason, status, count(*) FROM failed_hotels WHERE input = ? GROUP BY reason, status
+        """, (self.input_name,))
+        return {f"{reason}/{status}": count for reason, status, count in rows}
+
+    def close(self):
+        self.connection.close()
+
+
+def get_failure_store(crawler):
+    """The crawler's FailureStore, shared by the spider and the DB pipeline (DB errors)."""
+    store = getattr(crawler, "agoda_failure_store", None)
+    if store is None:
+        store = crawler.agoda_failure_store = FailureStore.from_settings(crawler.settings)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise (and export) recorded hotel failures.")
+    parser.add_argument("--path", default="output/failures.sqlite")
+    parser.add_argument("--csv", default=None, help="export every failure to this CSV file")
+    args = parser.parse_args()
+
+    connection = sqlite3.connect(args.path)
+    for input_name, reason, status, count in connection.execute("""
+        SELECT input, reason, status, count(*) FROM failed_hotels GROUP BY input, reason, status ORDER BY 1, 2, 3
+    """):
+        print(f"{input_name:<24} {reason:<18} {status:<10} {count}")
+
+    if args.csv:
+        cursor = connection.execute("SELECT * FROM failed_hotels ORDER BY input, row_index")
+        with open(args.csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow([column[0] for column in cursor.description])
+            writer.writerows(cursor)
+        print(f"Exported → {args.csv}")
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import os
+import csv
+import json
+
+INDEX_STRIDE = 100  # Record the byte offset of every Nth row in the index
+
+
+class HotelInputReader:
+    """Streams hotel rows from the input CSV, seeking straight to a batch via a persisted byte-offset index."""
+
+    def __init__(self, path, index_stride=INDEX_STRIDE):
+        self.path = path
+        self.index_path = f"{path}.idx.json"
+        self.index_stride = index_stride
+        self.index = self.load_index()
+
+    # ----------- INDEX -------------
+    def file_signature(self):
+        stat = os.stat(self.path)
+        return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    def load_index(self):
+        """Reuse the index on disk if it still matches the CSV, otherwise rebuild it."""
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, "r") as f:
+                    index = json.load(f)
+                if (index.get("signature") == self.file_signature()
+                        and index.get("stride") == self.index_stride):
+                    return index
+            except (OSError, ValueError):
+                pass  # unreadable index → rebuild below
+        return self.build_index()
+
+    def build_index(self):
+        """Scan the CSV once and persist the offset of every `index_stride`-th row next to the file."""
+        offsets = []
+        with open(self.path, "rb") as f:
+            rows = self._records(f)
+            header = next(rows, None)
+            fieldnames = header[0] if header else []
+            offset = header[1] if header else 0
+            row_count = 0
+            for _, end in rows:
+                # Only every Nth offset is kept, so the index stays small for 255k-row files
+                if row_count % self.index_stride == 0:
+                    offsets.append(offset)
+                offset = end
+                row_count += 1
+
+        index = {
+            "signature": self.file_signature(),
+            "stride": self.index_stride,
+            "fieldnames": fieldnames,
+            "row_count": row_count,
+            "offsets": offsets,
+        }
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+        return index
+
+    @staticmethod
+    def _records(f):
+        """Yield (parsed_row, end_offset) for each CSV record, handling quoted multi-line fields."""
+        position = [f.tell()]
+
+        def lines():
+            for raw in iter(f.readline, b""):
+                position[0] += len(raw)
+                yield raw.decode("utf-8-sig" if position[0] == len(raw) else "utf-8")
+
+        reader = csv.reader(lines(), delimiter=",")
+        for row in reader:
+            if not row:
+                continue  # blank line, skipped the same way csv.DictReader does
+            # csv.reader pulls lines lazily, so the position is exactly the end of this record
+            yield row, position[0]
+
+    @property
+    def row_count(self):
+        return self.index["row_count"]
+
+    # ----------- READ -------------
+    def iter_rows(self, start, end, skip=()):
+        """Lazily yield (row_index, row_dict) for rows in [start, end), skipping indices in `skip`."""
+        end = min(end, self.row_count)
+        if start >= end:
+            return
+
+        fieldnames = self.index["fieldnames"]
+        block = start // self.index_stride
+        row_index = block * self.index_stride
+
+        with open(self.path, "rb") as f:
+            f.seek(self.index["offsets"][block])
+            for values, _ in self._records(f):
+                if row_index >= end:
+                    break
+                if row_index >= start and row_index not in skip:
+                    yield row_index, dict(zip(fieldnames, values))
+                row_index += 1
+
+    def iter_indices(self, indices):
+        """Lazily yield (row_index, row_dict) for specific rows only, seeking once per index block."""
+        wanted = sorted(i for i in set(indices) if 0 <= i < self.row_count)
+        fieldnames = self.index["fieldnames"]
+        with open(self.path, "rb") as f:
+            position = 0
+            while position < len(wanted):
+                block = wanted[position] // self.index_stride
+                block_end = (block + 1) * self.index_stride
+                targets = []
+                while position < len(wanted) and wanted[position] < block_end:
+                    targets.append(wanted[position])
+                    position += 1
+
+                f.seek(self.index["offsets"][block])
+                row_index = block * self.index_stride
+                pending = iter(targets)
+                target = next(pending)
+                for values, _ in self._records(f):
+                    if row_index == target:
+                        yield row_index, dict(zip(fieldnames, values))
+                        target = next(pending, None)
+                        if target is None:
+                            break
+                    row_index += 1
+
+    def iter_batch(self, batch_index, batch_size, skip=()):
+        start = batch_index * batch_size
+        return self.iter_rows(start, start + batch_size, skip=skip)
+
+
+class BatchCheckpoint:
+    """Append-only record of completed row indices for one batch, so a crashed batch resumes where it stopped."""
+
+    def __init__(self, checkpoint_dir, batch_index):
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        self.path = os.path.join(checkpoint_dir, f"batch_{batch_index}.done")
+        self.completed = self.load()
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def load(self):
+        completed = set()
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line.isdigit():  # ignore a half-written last line after a crash
+                        completed.add(int(line))
+        return completed
+
+    def mark_done(self, row_index):
+        if row_index is None or row_index in self.completed:
+            return
+        self.completed.add(row_index)
+        self.file.write(f"{row_index}\n")
+        self.file.flush()
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
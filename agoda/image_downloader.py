@@ -0,0 +1,230 @@
+"""Bulk image downloader for the manifests written by the crawl (output/image_manifests/*.ndjson).
+
+Files are stored content-addressed (<out>/<sha256[:2]>/<sha256>.<ext>), so the tree can be synced to an
+object store as is and identical photos under different URLs are kept once. Progress lives in a SQLite
+state file keyed by canonical image key: re-running skips everything already downloaded and retries
+failures up to --max-attempts, so an interrupted run simply resumes.
+
+    python -m agoda.image_downloader output/image_manifests/*.ndjson [--out output/images] [--concurrency 16]
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+import http.client
+import mimetypes
+from urllib.parse import urlsplit, urljoin
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+USER_AGENT = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+              "Chrome/124.0.0.0 Safari/537.36")
+MAX_REDIRECTS = 3
+
+
+class DownloadState:
+    """SQLite record of every manifest image and whether it's been fetched (main thread only)."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS image_downloads (
+                image_key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                status TEXT NOT NULL,
+                sha256 TEXT,
+                path TEXT,
+                bytes INTEGER,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self.connection.commit()
+
+    def add(self, entries):
+        """Queue manifest entries; keys already known (downloaded or pending) are left alone."""
+        cursor = self.connection.executemany(
+            "INSERT OR IGNORE INTO image_downloads (image_key, url, status, updated_at) VALUES (?, ?, ?, ?)",
+            ((entry["key"], entry["url"], PENDING, time.time()) for entry in entries),
+        )
+        self.connection.commit()
+        return cursor.rowcount
+
+    def todo(self, max_attempts):
+        return self.connection.execute("""
+            SELECT image_key, url FROM image_downloads
+            WHERE status = ? OR (status = ? AND attempts < ?)
+            ORDER BY rowid
+        """, (PENDING, FAILED, max_attempts)).fetchall()
+
+    def done(self, key, sha256, path, size):
+        self.connection.execute("""
+            UPDATE image_downloads SET status = ?, sha256 = ?, path = ?, bytes = ?, attempts = attempts + 1,
+                error = NULL, updated_at = ?
+            WHERE image_key = ?
+        """, (DONE, sha256, path, size, time.time(), key))
+
+    def failed(self, key, error):
+        self.connection.execute("""
+            UPDATE image_downloads SET status = ?, attempts = attempts + 1, error = ?, updated_at = ?
+            WHERE image_key = ?
+        """, (FAILED, error, time.time(), key))
+
+    def commit(self):
+        self.connection.commit()
+
+    def summary(self):
+        return dict(self.connection.execute("SELECT status, count(*) FROM image_downloads GROUP BY status"))
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+class ImageFetcher:
+    """Downloads into a content-addressed tree over keep-alive connections (one per host and thread)."""
+
+    def __init__(self, out_dir, timeout=30):
+        self.out_dir = out_dir
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def connection(self, scheme, host):
+        connections = getattr(self.local, "connections", None)
+        if connections is None:
+            connections = self.local.connections = {}
+        conn = connections.get((scheme, host))
+        if conn is None:
+            cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+            conn = connections[(scheme, host)] = cls(host, timeout=self.timeout)
+        return conn
+
+    def drop(self, scheme, host):
+        conn = self.local.connections.pop((scheme, host), None)
+        if conn is not None:
+            conn.close()
+
+    def get(self, url):
+        """→ (body, content_type); follows a few redirects, retries once on a stale keep-alive connection."""
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            target = parts.path or "/"
+            if parts.query:
+                target += "?" + parts.query
+            for attempt in range(2):
+                conn = self.connection(parts.scheme, parts.netloc)
+                try:
+                    conn.request("GET", target, headers={"User-Agent": USER_AGENT, "Accept": "image/*,*/*;q=0.8"})
+                    response = conn.getresponse()
+                    body = response.read()  # always drain, so the connection can be reused
+                    break
+                except (http.client.HTTPException, OSError):
+                    # Server closed an idle keep-alive connection: reconnect once
+                    self.drop(parts.scheme, parts.netloc)
+                    if attempt:
+                        raise
+            if response.will_close:
+                self.drop(parts.scheme, parts.netloc)
+            if response.status in (301, 302, 303, 307, 308) and response.getheader("Location"):
+                url = urljoin(url, response.getheader("Location"))
+                continue
+            if response.status != 200:
+                raise IOError(f"HTTP {response.status}")
+            return body, response.getheader("Content-Type", "")
+        raise IOError("too many redirects")
+
+    def fetch(self, key, url):
+        """→ (key, sha256, relative path, size) or (key, None, error, None)."""
+        try:
+            body, content_type = self.get(url)
+        except Exception as e:
+            return key, None, str(e) or type(e).__name__, None
+        sha256 = hashlib.sha256(body).hexdigest()
+        ext = (mimetypes.guess_extension(content_type.split(";")[0].strip()) or
+               os.path.splitext(urlsplit(url).path)[1] or ".bin")
+        rel_path = os.path.join(sha256[:2], sha256 + ext)
+        path = os.path.join(self.out_dir, rel_path)
+        if not os.path.exists(path):  # same bytes under another key: already stored
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(body)
+            os.replace(tmp_path, path)
+        return key, sha256, rel_path, len(body)
+
+
+def read_manifests(paths):
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get("key") and entry.get("url"):
+                    yield entry
+
+
+def download(state, fetcher, todo, concurrency, commit_every=100):
+    """Runs the fetches with at most `concurrency` in flight; state is only touched from this thread."""
+    done = failed = 0
+    pending = set()
+    todo = iter(todo)
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        while True:
+            for key, url in todo:
+                pending.add(pool.submit(fetcher.fetch, key, url))
+                if len(pending) >= concurrency * 2:
+                    break
+            if not pending:
+                break
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                key, sha256, path_or_error, size = future.result()
+                if sha256:
+                    state.done(key, sha256, path_or_error, size)
+                    done += 1
+                else:
+                    state.failed(key, path_or_error)
+                    failed += 1
+                if (done + failed) % commit_every == 0:
+                    state.commit()
+                    print(f"[IMAGES] {done} downloaded, {failed} failed")
+    state.commit()
+    return done, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download manifest images into a content-addressed tree.")
+    parser.add_argument("manifests", nargs="+", help="NDJSON manifests (output/image_manifests/*.ndjson)")
+    parser.add_argument("--out", default="output/images")
+    parser.add_argument("--state", default="output/image_downloads.sqlite")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--max-attempts", type=int, default=3)
+    args = parser.parse_args()
+
+    state = DownloadState(args.state)
+    added = state.add(read_manifests(args.manifests))
+    todo = state.todo(args.max_attempts)
+    print(f"[IMAGES] {added} new images from {len(args.manifests)} manifests, {len(todo)} to download")
+    started = time.monotonic()
+    done, failed = download(state, ImageFetcher(args.out, args.timeout), todo, max(1, args.concurrency))
+    print(f"[IMAGES] {done} downloaded, {failed} failed in {time.monotonic() - started:.0f}s — "
+          + ", ".join(f"{status}: {count}" for status, count in sorted(state.summary().items())))
+    state.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Hotel image URLs → canonical keys, the `hotel_images` table and per-batch download manifests.
+
+The same photo shows up under several URLs: Agoda serves it from numbered CDN shards (pix6/pix8...)
+with the size in the query string, Booking's CDN puts the size in the path (/max1024x768/). All of
+them map to one canonical key (extractors.image_key, the key the extractors dedupe a page with too),
+so a photo is downloaded once no matter how many hotels or variants reference it. Only keys the `hotel_images` table has never seen go into the manifests
+(output/image_manifests/batch_N.ndjson), so a re-crawl of unchanged hotels produces no download work.
+Manifests are fetched with `python -m agoda.image_downloader`.
+"""
+import os
+import json
+import datetime
+from .extractors import image_key
+
+
+def image_rows(image_urls):
+    """[(image_key, url, sort_order)] for one hotel, first URL per key kept (the extractor lists the largest)."""
+    rows, seen = [], set()
+    for url in image_urls or ():
+        if not url:
+            continue
+        key = image_key(url)
+        if key not in seen:
+            seen.add(key)
+            rows.append((key, url, len(rows)))
+    return rows
+
+
+class ImageManifestWriter:
+    """Appends newly seen images to output/image_manifests/batch_<N>.ndjson (run_<id>.ndjson outside batches).
+
+    Used from the DB writer thread only, before the transaction that records the images commits: lines
+    are fsynced first, so a committed image is always in a manifest. A failed or retried commit can list
+    an image twice, the downloader ignores keys it already has.
+    """
+
+    def __init__(self, directory, run_id=None):
+        self.directory = directory
+        self.run_id = run_id
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, batch_index):
+        name = f"batch_{batch_index}" if batch_index is not None else f"run_{self.run_id or 'default'}"
+        return os.path.join(self.directory, f"{name}.ndjson")
+
+    def write(self, batch_index, images):
+        """`images`: [(image_key, url, hotel_url)]; returns the number of lines written."""
+        if not images:
+            return 0
+        seen_at = datetime.datetime.utcnow().isoformat()
+        with open(self.path(batch_index), "a", encoding="utf-8") as f:
+            for key, url, hotel_url in images:
+                f.write(json.dumps({"key": key, "url": url, "hotel_url": hotel_url, "run_id": self.run_id,
+                                    "seen_at": seen_at}, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return len(images)
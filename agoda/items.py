@@ -9,4 +9,6 @@ class HotelItem(scrapy.Item):
     location_agoda = scrapy.Field()
     description = scrapy.Field()
     facilities = scrapy.Field()
-    image_urls = scrapy.Field()
\ No newline at end of file
+    image_urls = scrapy.Field()
+    row_index = scrapy.Field()  # input CSV row, links DB errors back to the failure store
+    batch_index = scrapy.Field()  # input batch, names the image manifest its new images go to
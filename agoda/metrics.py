@@ -0,0 +1,159 @@
+"""Crawl instrumentation shared by the spider, the proxy/CAPTCHA middleware and the DB pipeline.
+
+Stage durations are histograms, hotel outcomes and per-proxy outcomes are counters, browser page/context
+counts and the pipeline queue depth are gauges. Everything is kept in memory (dumped per batch as
+batch_N.metrics.json by BatchRecorder) and, when prometheus_client is installed and METRICS_PORT is set,
+also served on a local Prometheus endpoint.
+"""
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Seconds; a hotel's stages range from a fast autosuggest call to a slow search flow with CAPTCHA retries
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+# found: hotel page scraped, not_found: no listing, failed: request gave up, captcha: page still blocked
+# after all retries, stored: row written to the DB
+HOTEL_OUTCOMES = ("found", "not_found", "failed", "captcha", "stored")
+
+
+class Histogram:
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 4),
+            "max": round(self.max, 4),
+            "buckets": {str(b): c for b, c in zip(self.buckets + ("+Inf",), self.counts)},
+        }
+
+
+class CrawlMetrics:
+    def __init__(self, port=0, address="127.0.0.1"):
+        self.lock = threading.Lock()  # the DB writer thread records too
+        self.stages = {}
+        self.hotels = dict.fromkeys(HOTEL_OUTCOMES, 0)
+        self.proxies = {}  # proxy → {outcome: count}
+        self.gauges = {}   # name → callable returning the current value
+        self.prometheus = self.start_exporter(port, address) if port else None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(settings.getint("METRICS_PORT", 0), settings.get("METRICS_ADDRESS", "127.0.0.1"))
+
+    @staticmethod
+    def start_exporter(port, address):
+        try:
+            import prometheus_client  # optional dependency
+        except ImportError:
+            logger.warning("[METRICS] prometheus_client not installed — metrics only go to batch_N.metrics.json")
+            return None
+        try:
+            prometheus_client.start_http_server(port, addr=address)
+        except OSError as e:
+            # e.g. another crawl on this machine already holds the port
+            logger.warning(f"[METRICS] Could not serve Prometheus metrics on {address}:{port}: {e}")
+            return None
+        logger.info(f"[METRICS] Prometheus metrics on http://{address}:{port}/metrics")
+        return {
+            "client": prometheus_client,
+            "stages": prometheus_client.Histogram(
+                "agoda_stage_seconds", "Duration of one crawl stage", ["stage"], buckets=STAGE_BUCKETS),
+            "hotels": prometheus_client.Counter(
+                "agoda_hotels", "Hotels per final outcome", ["outcome"]),
+            "proxies": prometheus_client.Counter(
+                "agoda_proxy_responses", "Responses per proxy and outcome", ["proxy", "outcome"]),
+        }
+
+    # ----------- RECORDING -------------
+    def observe(self, stage, seconds):
+        if seconds is None:
+            return
+        with self.lock:
+            self.stages.setdefault(stage, Histogram()).observe(seconds)
+        if self.prometheus:
+            self.prometheus["stages"].labels(stage=stage).observe(seconds)
+
+    def hotel(self, outcome, count=1):
+        with self.lock:
+            self.hotels[outcome] = self.hotels.get(outcome, 0) + count
+        if self.prometheus:
+            self.prometheus["hotels"].labels(outcome=outcome).inc(count)
+
+    def proxy(self, proxy, outcome):
+        with self.lock:
+            outcomes = self.proxies.setdefault(proxy, {})
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        if self.prometheus:
+            self.prometheus["proxies"].labels(proxy=proxy, outcome=outcome).inc()
+
+    def gauge(self, name, description, value_fn):
+        """Register a gauge read on demand (JSON snapshot / Prometheus scrape), e.g. a queue size."""
+        self.gauges[name] = value_fn
+        if self.prometheus:
+            self.prometheus["client"].Gauge(f"agoda_{name}", description).set_function(value_fn)
+
+    # ----------- SNAPSHOTS -------------
+    def snapshot(self):
+        with self.lock:
+            data = {
+                "stages": {stage: h.snapshot() for stage, h in sorted(self.stages.items())},
+                "hotels": dict(self.hotels),
+                "proxies": {proxy: dict(outcomes) for proxy, outcomes in sorted(self.proxies.items())},
+            }
+        data["gauges"] = {name: value_fn() for name, value_fn in sorted(self.gauges.items())}
+        return data
+
+    @staticmethod
+    def delta(before, after):
+        """Difference of two snapshots (gauges keep their latest value), i.e. what one batch did."""
+        def subtract(new, old):
+            if isinstance(new, dict):
+                return {k: subtract(v, (old or {}).get(k)) for k, v in new.items()}
+            return new - (old or 0)
+
+        stages = {}
+        for stage, figures in after["stages"].items():
+            old = before["stages"].get(stage, {})
+            if figures["count"] - old.get("count", 0):
+                diff = subtract({k: v for k, v in figures.items() if k != "max"}, old)
+                diff["sum"] = round(diff["sum"], 4)
+                stages[stage] = diff
+        return {
+            "stages": stages,
+            "hotels": subtract(after["hotels"], before["hotels"]),
+            "proxies": {proxy: outcomes for proxy, outcomes
+                        in subtract(after["proxies"], before["proxies"]).items() if any(outcomes.values())},
+            "gauges": after["gauges"],
+        }
+
+
+def get_metrics(crawler):
+    """The crawler's CrawlMetrics, created on first use so every component shares one instance."""
+    metrics = getattr(crawler, "agoda_metrics", None)
+    if metrics is None:
+        metrics = crawler.agoda_metrics = CrawlMetrics.from_crawler(crawler)
+        stats = crawler.stats
+        # scrapy-playwright already counts pages/contexts in stats; expose them as gauges. It only counts
+        # contexts it creates: BrowserLifecycle counts the ones it closes (retired generations, browser gone)
+        metrics.gauge("browser_contexts", "Browser contexts currently open",
+                      lambda: max(stats.get_value("playwright/context_count", 0)
+                                  - stats.get_value("browser/contexts_closed", 0), 0))
+        metrics.gauge("browser_pages_open", "Browser pages currently open",
+                      lambda: stats.get_value("playwright/page_count", 0)
+                      - stats.get_value("playwright/page_count/closed", 0))
+    return metrics
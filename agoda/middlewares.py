@@ -1,57 +1,85 @@
-import os
-import json
+import re
 import random
-import datetime
-import http.cookies
+import asyncio
+import weakref
 from playwright_stealth import Stealth
+from scrapy import signals
+from scrapy_playwright.page import PageMethod
+from .worker_pool import BrowserWorkerPool
+from .proxy_scheduler import ProxyScheduler
+from .block_detector import BlockDetector, OK, CAPTCHA
+from .metrics import get_metrics
+from .cookie_store import CookieStore, get_cookie_store
+from .browser_lifecycle import get_browser_lifecycle
+from .header_profiles import HeaderProfiles
 
 CAPTCHA_THRESHOLD = 3  # Reset cookies after this many CAPTCHA hits
 PROXY_REUSE_LIMIT = 5  # Number of requests per proxy before switching
 
+# Rough transfer size per aborted resource type (bytes), used to estimate bandwidth saved
+RESOURCE_SIZE_ESTIMATES = {
+    "image": 60_000,
+    "media": 500_000,
+    "font": 40_000,
+    "script": 30_000,
+    "stylesheet": 20_000,
+    "xhr": 5_000,
+    "fetch": 5_000,
+    "other": 5_000,
+}
+
+# Metrics stage per request kind (request.meta["page_type"]; plain-HTTP requests are autosuggest lookups)
+REQUEST_STAGES = {"search": "search_flow", "hotel": "hotel_page", "hotel_http": "hotel_page_http"}
+
 class ProxyUserAgentAndCaptchaMiddleware:
     """Handles proxy rotation, user‑agent spoofing, header rotation and CAPTCHA retry."""
 
-    def __init__(self, agoda_user_agents, chrome_headers, proxies, retry_times):
-        self.agoda_user_agents = agoda_user_agents
-        self.chrome_headers = chrome_headers
+    def __init__(self, profiles, proxies, retry_times, workers=1, scheduler=None, stats=None,
+                 block_detector=None, header_domains=("agoda.com",), metrics=None, cookie_store=None,
+                 lifecycle=None, debug=False):
+        # One immutable header profile per UA; each proxy sticks to one for its session
+        self.profiles = profiles
         self.proxies = proxies
         self.retry_times = retry_times
-        self.cookie_jar_path = "cookies.json"
-        self.cookie_jar = self.load_cookies()
+        # Health-scored proxy choice with cooldowns; state persists across runs
+        self.scheduler = scheduler or ProxyScheduler(proxies, "output/proxy_health.json")
+        self.stats = stats
+        self.metrics = metrics
+        self.block_detector = block_detector or BlockDetector.from_file("block_rules.json")
+        self.header_domains = re.compile("|".join(re.escape(domain) for domain in header_domains))
+        self.debug = debug  # TEST_MODE, read once instead of per request
+        # Per-proxy sessions in memory, saved debounced + atomically, shared with the browser contexts
+        self.cookies = cookie_store or CookieStore("cookies.json", "https://www.agoda.com/")
         self.proxy_captcha_count = {}  # Track CAPTCHA frequency per proxy
-        self.current_proxy = None
-        self.proxy_request_count = 0
+        # Proxy + request counter live per worker, so workers never share a sticky session
+        self.pool = BrowserWorkerPool(workers)
+        # Context generations: a context is swapped for a fresh one after N pages / on memory pressure
+        self.lifecycle = lifecycle
 
 
     @classmethod
     def from_crawler(cls, crawler):
         # Load proxy list & user‑agents and chrome headers from files
-        with open("proxies.txt") as pf:
+        with open(crawler.settings.get("PROXIES_FILE", "proxies.txt")) as pf:
             proxies = [line.strip() for line in pf if line.strip()]
-        with open("user_agents.txt") as uf:
-            ua_list = [line.strip() for line in uf if line.strip()]            
-        with open("chrome_headers.json", encoding="utf-8") as hf:
-            chrome_headers = json.load(hf)            
-        # Filter UA list to only ones that exist in the header mapping
-        ua_list = [ua for ua in ua_list if ua in chrome_headers]
-        
+        # Header profiles are built once here (UAs without a chrome_headers.json entry are dropped)
+        profiles = HeaderProfiles.from_files("user_agents.txt", "chrome_headers.json")
+
         retry_times = crawler.settings.getint("CAPTCHA_RETRY_TIMES", 3)
+        workers = crawler.settings.getint("PLAYWRIGHT_WORKERS", 1)
+        scheduler = ProxyScheduler.from_settings(proxies, crawler.settings)
+        block_detector = BlockDetector.from_file(crawler.settings.get("BLOCK_RULES_FILE", "block_rules.json"))
         
-        return cls(ua_list, chrome_headers, proxies, retry_times)
-
-    def load_cookies(self):
-        if os.path.exists(self.cookie_jar_path):
-            if os.path.getsize(self.cookie_jar_path) > 0:
-                with open(self.cookie_jar_path, "r") as f:
-                    return json.load(f)
-            else:
-                # Log for debug visibility in test mode
-                print(f"[COOKIES] '{self.cookie_jar_path}' is empty — starting with fresh jar.")
-        return {}
+        middleware = cls(profiles, proxies, retry_times, workers, scheduler, crawler.stats,
+                         block_detector, crawler.settings.getlist("HEADER_DOMAINS", ["agoda.com"]),
+                         get_metrics(crawler), get_cookie_store(crawler), get_browser_lifecycle(crawler),
+                         debug=crawler.settings.getbool("TEST_MODE"))
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
 
-    def save_cookies(self):
-        with open(self.cookie_jar_path, "w") as f:
-            json.dump(self.cookie_jar, f, indent=2)
+    def spider_closed(self, spider):
+        self.scheduler.save()
+        self.cookies.flush()
 
     # ----------- REQUEST -------------
     def process_request(self, request, spider):
@@ -60,115 +88,167 @@ class ProxyUserAgentAndCaptchaMiddleware:
         # if spider.settings.getbool("TEST_MODE"):
         #     return None  # Skip proxy/user-agent rotation in test mode
         
-        if not self.current_proxy or self.proxy_request_count >= PROXY_REUSE_LIMIT:
-            self.current_proxy = random.choice(self.proxies)
-            self.proxy_request_count = 0  # Reset count for new proxy
-            if spider.settings.getbool("TEST_MODE"):
-                spider.logger.info(f"[PROXY] Rotated to new proxy: {self.current_proxy}")
-
-        proxy = self.current_proxy
-        self.proxy_request_count += 1 # Count how many times current proxy has been used
+        worker = self.pool.worker_for(request)
+        if (not worker.proxy or worker.request_count >= PROXY_REUSE_LIMIT
+                or self.scheduler.in_cooldown(worker.proxy)):
+            if worker.proxy:
+                self.retire_context(worker)
+            worker.proxy = self.pick_proxy()
+            worker.request_count = 0  # Reset count for new proxy
+            if self.debug:
+                spider.logger.info(f"[PROXY] Worker {worker.worker_id} rotated to new proxy: {worker.proxy}")
+
+        proxy = worker.proxy
+        worker.request_count += 1 # Count how many times current proxy has been used
+        worker.in_flight += 1
         # Proxy is already IP-authenticated, no credential injection needed
         request.meta["proxy"] = proxy
 
-        # Inject cookies if valid
-        proxy_data = self.cookie_jar.get(proxy)
-        if proxy_data:
-            age = datetime.datetime.utcnow() - datetime.datetime.fromisoformat(proxy_data["last_updated"])
-            if age.total_seconds() < 86400:  # 24 hours
-                cookie_str = "; ".join(f"{k}={v}" for k, v in proxy_data["cookies"].items())
-                request.headers["Cookie"] = cookie_str
-                
-                # ✅ Log cookie string in test mode
-                if spider.settings.getbool("TEST_MODE"):
-                    spider.logger.info(f"[COOKIES] Injected for proxy {proxy}: {cookie_str}")
-            else:
-                del self.cookie_jar[proxy]  # expired
-                self.save_cookies()
-                # Log when cookies are cleared due to expiration
-                spider.logger.info(f"[COOKIES] Expired for proxy {proxy}, removed from jar")
-
-        # Domain‑specific headers
-        if "agoda.com" in request.url:
-            ua = random.choice(self.agoda_user_agents)
-            hdr_extra = self.chrome_headers.get(ua, {})
-            
-            # test whether headers are applied as expected 
-            if spider.settings.getbool("TEST_MODE"):
-                spider.logger.info(f"[UA] {ua}")
-                spider.logger.info(f"[Headers] {hdr_extra}")
+        # Worker pool: each worker gets its own browser context, bound to its proxy via Playwright's per-context option
+        if request.meta.get("playwright"):
+            base = worker.context_name if self.pool.isolated else "default"
+            context_name = self.lifecycle.context_name(base) if self.lifecycle else base
+            if context_name != "default":
+                request.meta["playwright_context"] = context_name
+                context_kwargs = {"proxy": {"server": proxy}} if self.pool.isolated else {}
+                # A new context starts from the proxy's saved session (cookies + localStorage): no warm-up needed
+                storage_state = self.cookies.storage_state(proxy)
+                if storage_state:
+                    context_kwargs["storage_state"] = storage_state
+                request.meta["playwright_context_kwargs"] = context_kwargs
+            if self.pool.isolated:
+                request.meta["download_slot"] = worker.download_slot
 
-            request.headers["User-Agent"] = ua
-            request.meta["user_agent"] = ua
-            for k, v in hdr_extra.items():
-                request.headers[k] = v
+        # Inject cookies if valid (cached per proxy + host until the jar changes or a cookie expires)
+        cookie_str = self.cookies.cookie_header(proxy, request.url)
+        if cookie_str:
+            request.headers["Cookie"] = cookie_str
+
+            # ✅ Log cookie string in test mode
+            if self.debug:
+                spider.logger.info(f"[COOKIES] Injected for proxy {proxy}: {cookie_str}")
+
+        # Domain‑specific headers: the proxy's session profile, same UA + client hints on every request
+        if self.header_domains.search(request.url):
+            profile = self.profiles.for_proxy(proxy)
+            profile.apply(request.headers)
+            request.meta["user_agent"] = profile.user_agent
+
+            # test whether headers are applied as expected 
+            if self.debug:
+                spider.logger.info(f"[UA] {profile.user_agent}")
+                spider.logger.info(f"[Headers] {dict(profile.headers)}")
 
         # You could add more domains here with elif blocks
 
+    def retire_context(self, worker):
+        # The worker's context is bound to its proxy: close it once its pages are done
+        if self.pool.isolated and self.lifecycle:
+            self.lifecycle.retire(self.lifecycle.context_name(worker.context_name))
+
+    def pick_proxy(self):
+        # Prefer a proxy no other worker is holding, so each proxy keeps a single sticky session
+        return self.scheduler.pick(exclude=self.pool.proxies_in_use())
+
+    def record_proxy_failure(self, proxy, spider, captcha):
+        cooldown = self.scheduler.record_failure(proxy, captcha=captcha)
+        self.stats.inc_value("proxy/captcha" if captcha else "proxy/error")
+        if cooldown:
+            self.stats.inc_value("proxy/quarantined")
+            spider.logger.warning(f"[PROXY] Quarantined {proxy} for {cooldown:.0f}s "
+                                  f"({self.scheduler.quarantined_count()}/{len(self.proxies)} in cooldown)")
+
+    @staticmethod
+    def request_stage(request):
+        default = "other" if request.meta.get("playwright") else "autosuggest"
+        return REQUEST_STAGES.get(request.meta.get("page_type"), default)
+
+    def release_worker(self, request):
+        worker_id = request.meta.get("worker_id")
+        if worker_id is not None and worker_id < self.pool.size:
+            worker = self.pool.workers[worker_id]
+            worker.in_flight = max(worker.in_flight - 1, 0)
+
     # ----------- RESPONSE ------------
+    def process_exception(self, request, exception, spider):
+        self.release_worker(request)
+        proxy = request.meta.get("proxy")
+        if proxy:
+            self.record_proxy_failure(proxy, spider, captcha=False)
+            if self.metrics:
+                self.metrics.proxy(proxy, "error")
+        return None
+
     def process_response(self, request, response, spider):
-        """Save cookies if any, detect CAPTCHA/verify pages and trigger retry with a new proxy/user-agent."""
+        """Save cookies if any, detect CAPTCHA/soft-block pages and trigger retry with a new proxy/user-agent."""
+        self.release_worker(request)
         
         proxy = request.meta.get("proxy")
         if not proxy:
             spider.logger.warning("[PROXY] No proxy found in request.meta — skipping CAPTCHA and cookie logic.")
             return response
         
-        # --- Cookie Saving ---
-        set_cookie_headers = response.headers.getlist("Set-Cookie")
-        if set_cookie_headers:
-            jar = {}
-            for header in set_cookie_headers:
-                simple_cookie = http.cookies.SimpleCookie()
-                simple_cookie.load(header.decode() if isinstance(header, bytes) else header)
-                for k, morsel in simple_cookie.items():
-                    jar[k] = morsel.value
-            self.cookie_jar[request.meta["proxy"]] = {
-                "cookies": jar,
-                "last_updated": datetime.datetime.utcnow().isoformat()
-            }
-            self.save_cookies()
+        # --- Cookie Saving --- (browser pages are read back from their context by PlaywrightCookieSyncMiddleware)
+        if not request.meta.get("cookies_synced"):
+            set_cookie_headers = response.headers.getlist("Set-Cookie")
+            if set_cookie_headers:
+                self.cookies.update_from_headers(proxy, set_cookie_headers, response.url)
         
-        # --- CAPTCHA Detection and Proxy Reset Logic ---
-        lower = response.text.lower()
-        if ("captcha" in lower or "verify" in lower) and request.meta.get("retry_times", 0) < self.retry_times:
+        # --- CAPTCHA / Soft Block Detection and Proxy Reset Logic ---
+        verdict, reason = self.block_detector.classify(response.status, response.url, response.body)
+        request.meta["block_verdict"] = verdict
+        self.stats.inc_value(f"block_detector/{verdict}")
+        blocked = verdict != OK
+        if self.metrics:
+            self.metrics.proxy(proxy, verdict)
+            # Time burnt on blocked pages is the CAPTCHA retry cost, not the stage's own latency
+            stage = "captcha_retry" if blocked else self.request_stage(request)
+            self.metrics.observe(stage, request.meta.get("download_latency"))
+        if blocked:
+            self.record_proxy_failure(proxy, spider, captcha=verdict == CAPTCHA)
+        if blocked and request.meta.get("retry_times", 0) < self.retry_times:
             count = self.proxy_captcha_count.get(proxy, 0) + 1
             self.proxy_captcha_count[proxy] = count
             
-            spider.logger.warning(f"CAPTCHA detected for proxy {proxy} (hit #{count}) — retrying {request.url}")            
+            spider.logger.warning(f"{verdict.upper()} detected for proxy {proxy} ({reason}, hit #{count}) — retrying {request.url}")            
             
-            # Reset current proxy on CAPTCHA detection to trigger rotation
-            self.current_proxy = None
-            self.proxy_request_count = 0
+            # Reset this worker's proxy on CAPTCHA detection to trigger rotation (the retry stays on the same worker)
+            worker = self.pool.worker_for(request)
+            if worker.proxy == proxy:
+                # Retire the context too: its proxy is fixed at creation, so reusing it would keep the
+                # retry on the blocked proxy while health and cookies are credited to the new one
+                self.retire_context(worker)
+            worker.proxy = None
+            worker.request_count = 0
             
+            # The blocked session's fingerprint is burnt: the proxy gets a new profile for its next session
+            self.profiles.rotate(proxy)
+
             # Reset cookies after n CAPTCHA hits
             if count >= CAPTCHA_THRESHOLD:
                 spider.logger.warning(f"⚠️ Clearing cookies for proxy {proxy} after {CAPTCHA_THRESHOLD} CAPTCHA hits")
-                self.cookie_jar.pop(proxy, None)
-                self.save_cookies()
+                self.cookies.clear(proxy)
                 self.proxy_captcha_count[proxy] = 0
             
             new_request = request.copy()
             new_request.dont_filter = True  # allow duplicate
             # increment retry counter
             new_request.meta["retry_times"] = request.meta.get("retry_times", 0) + 1
+            new_request.headers.pop("Cookie", None)  # the old session's cookies; process_request sets the new one's
             
-            # ✅ Rotate User-Agent
-            ua = random.choice(self.agoda_user_agents)
-            hdr_extra = self.chrome_headers.get(ua, {})
-            new_request.headers["User-Agent"] = ua
-            for k, v in hdr_extra.items():
-                new_request.headers[k] = v
-            new_request.meta["user_agent"] = ua
-            
-            # Log rotated UA during retry for debugging
-            if spider.settings.getbool("TEST_MODE"):
-                spider.logger.info(f"[UA ROTATE] New UA after CAPTCHA for proxy {proxy}: {ua}")
+            # The retry goes through process_request again and picks up its (new) proxy's profile there
+            if self.debug:
+                spider.logger.info(f"[UA ROTATE] New UA after CAPTCHA for proxy {proxy}: "
+                                   f"{self.profiles.for_proxy(proxy).user_agent}")
             
             return new_request
         
+        if blocked:
+            return response  # out of retries, let the spider see the page
+
         # --- Successful response → reset CAPTCHA count
         self.proxy_captcha_count[proxy] = 0
+        self.scheduler.record_success(proxy, request.meta.get("download_latency"))
         return response
 
 
@@ -176,12 +256,49 @@ class ProxyUserAgentAndCaptchaMiddleware:
 # New stealth middleware class
 # -----------------------------
 class PlaywrightStealthMiddleware:
-    """Automatically applies stealth fingerprinting protection to all Playwright pages."""
+    """Automatically applies stealth fingerprinting protection to all Playwright pages.
+
+    Stealth is applied once per browser context (its init scripts cover every later page of that
+    context), and the fingerprint probe only runs in TEST_MODE or for a sampled share of pages.
+    """
+
+    def __init__(self, stats=None, probe_rate=0.0):
+        self.stealth = Stealth()
+        # context → stealth task; registered before the first await so concurrent pages of a new context
+        # wait on the same patch instead of applying it twice or navigating unpatched. Closed contexts drop out.
+        self.patched_contexts = weakref.WeakKeyDictionary()
+        self.stats = stats
+        self.probe_rate = probe_rate
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        probe_rate = 1.0 if settings.getbool("TEST_MODE") else settings.getfloat("STEALTH_PROBE_RATE", 0.0)
+        return cls(crawler.stats, probe_rate)
 
     async def __call__(self, page, request):
-        stealth = Stealth()
-        await stealth.apply_stealth_async(page.context)
+        context = page.context
+        patching = self.patched_contexts.get(context)
+        if patching is None:
+            patching = asyncio.ensure_future(self.stealth.apply_stealth_async(context))
+            self.patched_contexts[context] = patching
+            if self.stats:
+                self.stats.inc_value("stealth/applied")
+        try:
+            await asyncio.shield(patching)  # one page being cancelled must not cancel the shared patch
+        except Exception:
+            if self.patched_contexts.get(context) is patching and patching.done():
+                del self.patched_contexts[context]  # failed: the next page of this context tries again
+            raise
+
+        if self.probe_rate and random.random() < self.probe_rate:
+            request.meta["stealth_debug"] = await self.probe(page)
+            if self.stats:
+                self.stats.inc_value("stealth/probes")
+        return page
 
+    @staticmethod
+    async def probe(page):
         # Optional fingerprint logging for debugging
         val = await page.evaluate("""
         () => ({
@@ -197,5 +314,137 @@ class PlaywrightStealthMiddleware:
             #   'plugins': 2,        # Or any number > 0
             #   'chromeRuntime': True}
             
-        request.meta["stealth_debug"] = val  # Can log this in parse_ functions if needed
-        return page
\ No newline at end of file
+        return val  # stored in request.meta["stealth_debug"], logged in parse_ functions
+
+
+# -----------------------------
+# Browser context recycling
+# -----------------------------
+class PlaywrightLifecycleMiddleware:
+    """Counts every new page against its context, so BrowserLifecycle can recycle contexts after
+    BROWSER_CONTEXT_MAX_PAGES pages (pages themselves are closed by scrapy-playwright as soon as the
+    response is read, since no request asks for playwright_include_page)."""
+
+    def __init__(self, lifecycle):
+        self.lifecycle = lifecycle
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(get_browser_lifecycle(crawler))
+
+    async def __call__(self, page, request):
+        self.lifecycle.track(page, request)
+        return page
+
+
+# -----------------------------
+# Cookie sync between the CookieStore and browser contexts
+# -----------------------------
+class PlaywrightCookieSyncMiddleware:
+    """Keeps each browser context's cookies in step with the proxy's session in the CookieStore.
+
+    Before navigation the context gets the proxy's cookies whenever the store changed since the context
+    last saw them (or the context now runs under another proxy); after the page's steps a final
+    PageMethod reads `context.storage_state()` back into the store.
+    """
+
+    def __init__(self, store, stats=None):
+        self.store = store
+        self.stats = stats
+        self.context_revisions = weakref.WeakKeyDictionary()  # context → (proxy, store revision)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(get_cookie_store(crawler), crawler.stats)
+
+    async def __call__(self, page, request):
+        proxy = request.meta.get("proxy")
+        if not proxy:
+            return page
+        context = page.context
+        if self.context_revisions.get(context) != (proxy, self.store.revision(proxy)):
+            await context.clear_cookies()
+            cookies = self.store.cookies(proxy)
+            if cookies:
+                await context.add_cookies(cookies)
+            self.context_revisions[context] = (proxy, self.store.revision(proxy))
+            if self.stats:
+                self.stats.inc_value("cookies/pushed_to_browser")
+
+        # New list rather than append: a retried request shares the original's meta values
+        request.meta["playwright_page_methods"] = [
+            *request.meta.get("playwright_page_methods", ()), PageMethod(self.capture, proxy),
+        ]
+        request.meta["cookies_synced"] = True
+        return page
+
+    async def capture(self, page, proxy):
+        state = await page.context.storage_state()
+        self.context_revisions[page.context] = (proxy, self.store.update_from_storage_state(proxy, state))
+        if self.stats:
+            self.stats.inc_value("cookies/pulled_from_browser")
+
+
+# -----------------------------
+# Resource blocking for Playwright pages
+# -----------------------------
+class ResourceBlockingMiddleware:
+    """Aborts resource types / URL patterns that the scrape never reads (images, fonts, trackers, media).
+
+    Rules come from PLAYWRIGHT_BLOCKING, one entry per page type (request.meta["page_type"]), with an
+    allowlist that always wins. Blocked counts and estimated bytes saved go to stats.
+    """
+
+    def __init__(self, stats, rules, size_estimates):
+        self.stats = stats
+        self.size_estimates = size_estimates
+        self.rules = {
+            page_type: {
+                "resource_types": frozenset(rule.get("resource_types", ())),
+                "url_pattern": self.compile(rule.get("url_patterns")),
+                "allow_pattern": self.compile(rule.get("allow_patterns")),
+            }
+            for page_type, rule in rules.items()
+        }
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        size_estimates = {**RESOURCE_SIZE_ESTIMATES, **(settings.getdict("PLAYWRIGHT_BLOCKING_SIZE_ESTIMATES") or {})}
+        return cls(crawler.stats, settings.getdict("PLAYWRIGHT_BLOCKING"), size_estimates)
+
+    @staticmethod
+    def compile(patterns):
+        # One alternation per rule set, so each request URL is matched once
+        return re.compile("|".join(f"(?:{p})" for p in patterns)) if patterns else None
+
+    def should_block(self, rules, resource_type, url):
+        if rules["allow_pattern"] and rules["allow_pattern"].search(url):
+            return False
+        if resource_type in rules["resource_types"]:
+            return True
+        return bool(rules["url_pattern"] and rules["url_pattern"].search(url))
+
+    async def __call__(self, page, request):
+        page_type = request.meta.get("page_type", "default")
+        rules = self.rules.get(page_type) or self.rules.get("default")
+        if not rules:
+            return page
+
+        async def handle(route):
+            req = route.request
+            if self.should_block(rules, req.resource_type, req.url):
+                self.stats.inc_value(f"playwright_blocking/{page_type}/blocked")
+                self.stats.inc_value(f"playwright_blocking/blocked/{req.resource_type}")
+                self.stats.inc_value("playwright_blocking/bytes_saved_estimate",
+                                     self.size_estimates.get(req.resource_type, self.size_estimates["other"]))
+                await route.abort()
+            else:
+                self.stats.inc_value(f"playwright_blocking/{page_type}/allowed")
+                # fallback(), not continue_(): Playwright runs route handlers newest first, and
+                # scrapy-playwright's own handler (registered before ours) is what sends the request's
+                # UA, header profile and Cookie header. continue_() would skip it.
+                await route.fallback()
+
+        await page.route("**/*", handle)
+        return page
@@ -0,0 +1,26 @@
+import inspect
+from scrapy.utils.misc import load_object
+
+
+class PageCoroutineRunner:
+    """Runs the PLAYWRIGHT_PAGE_COROUTINES chain on every new Playwright page.
+
+    Hooked in through scrapy-playwright's `playwright_page_init_callback` request meta, so it runs
+    before navigation. Entries are functions `(page, request)` or classes with an async
+    `__call__(page, request)` (built via `from_crawler` when available).
+    """
+
+    def __init__(self, crawler):
+        paths = crawler.settings.getdict("PLAYWRIGHT_PAGE_COROUTINES").get("default", [])
+        self.coroutines = [self.build(load_object(path), crawler) for path in paths]
+
+    @staticmethod
+    def build(obj, crawler):
+        if inspect.isclass(obj):
+            return obj.from_crawler(crawler) if hasattr(obj, "from_crawler") else obj()
+        return obj
+
+    async def __call__(self, page, request):
+        for coroutine in self.coroutines:
+            page = await coroutine(page, request) or page
+        return page
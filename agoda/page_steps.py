@@ -0,0 +1,175 @@
+"""Event-driven navigation steps for the Agoda search flow and hotel page.
+
+Each step performs an action and then waits on a real page signal (element attached/hidden, network
+response) with a bounded timeout. If the signal never comes, a short fallback runs instead of failing
+the hotel. Time spent per step is written into the shared `timings` dict (request.meta["step_timings"])
+and turned into Scrapy stats by the spider.
+"""
+import time
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from scrapy_playwright.page import PageMethod
+from .block_detector import OK
+
+CONSENT_REJECT_BUTTON = "button[data-element-name='consent-banner-reject-btn']"
+SEARCH_INPUT = "input[data-selenium='textInput']"
+SUGGESTION_ITEM = 'li[data-selenium="topDestinationListItem"]'
+SEARCH_BUTTON = "button[data-selenium='searchButton']"
+PROPERTY_CARD = "li.PropertyCard"
+GALLERY_BUTTON = 'button[data-element-name="hotel-mosaic-see-all-photos"]'
+
+# Default per-step timeouts (ms), override with SEARCH_STEP_TIMEOUTS in settings
+STEP_TIMEOUTS = {
+    "consent": 1500,
+    "suggestions": 5000,
+    "pick_suggestion": 2000,
+    "search_response": 10000,
+    "results": 10000,
+    "gallery": 30000,
+}
+FALLBACK_WAIT = 1000  # ms, used when a signal doesn't show up in time
+
+
+async def timed_step(page, name, action, timings, screenshots=None, **kwargs):
+    """Run one step, record its duration and whether the fallback path was taken.
+
+    `screenshots` (HotelScreenshots) captures the page after a failed/fallback step, or after every
+    step for sampled hotels.
+    """
+    started = time.monotonic()
+    try:
+        fallback = await action(page, **kwargs)
+    except Exception:
+        timings[name] = {"ms": round((time.monotonic() - started) * 1000), "fallback": True}
+        if screenshots:
+            await screenshots.after_step(page, name, failed=True)
+        raise
+    timings[name] = {"ms": round((time.monotonic() - started) * 1000), "fallback": bool(fallback)}
+    if screenshots:
+        await screenshots.after_step(page, name, failed=bool(fallback))
+
+
+async def capture_if_blocked(page, block_detector, screenshots, timings):
+    """Last page method: screenshot the page when the block detector flags it (CAPTCHA / soft block).
+
+    The steps before it may all have "succeeded" on an interstitial (fallback waits); the response
+    is classified again by the middleware, but by then the page is closed, so its verdict can't be
+    reused here. Only pages where a step fell back are snapshotted: on a real page every signal
+    shows up, so healthy pages don't pay for `page.content()` + classify.
+    """
+    if not any(timing["fallback"] for timing in timings.values()):
+        return
+    try:
+        body = (await page.content()).encode("utf-8")
+    except Exception:
+        return  # page already gone
+    verdict, _ = block_detector.classify(200, page.url, body)
+    if verdict != OK:
+        await screenshots.after_block(page, verdict)
+
+
+# ----------- STEPS -------------
+async def dismiss_consent(page, timeout):
+    clicked = await page.evaluate(
+        """(selector) => {
+            const btn = document.querySelector(selector);
+            if (btn) btn.click();
+            return !!btn;
+        }""",
+        CONSENT_REJECT_BUTTON,
+    )
+    if not clicked:
+        return False  # no banner, nothing to wait for
+    try:
+        await page.wait_for_selector(CONSENT_REJECT_BUTTON, state="detached", timeout=timeout)
+        return False
+    except PlaywrightTimeoutError:
+        return True  # banner still there, carry on: it doesn't cover the search box
+
+
+async def enter_prompt(page, prompt, timeout):
+    await page.fill(SEARCH_INPUT, prompt)
+    try:
+        await page.wait_for_selector(SUGGESTION_ITEM, state="visible", timeout=timeout)
+        return False
+    except PlaywrightTimeoutError:
+        # Suggestions sometimes only open on a keystroke, nudge the input once and give it a moment
+        await page.press(SEARCH_INPUT, "End")
+        await page.wait_for_timeout(FALLBACK_WAIT)
+        return True
+
+
+async def pick_suggestion(page, timeout):
+    await page.click(f"{SUGGESTION_ITEM} >> nth=0")
+    try:
+        await page.wait_for_selector(SUGGESTION_ITEM, state="hidden", timeout=timeout)
+        return False
+    except PlaywrightTimeoutError:
+        return True
+
+
+async def submit_search(page, response_pattern, response_timeout, results_timeout):
+    fallback = False
+    try:
+        async with page.expect_response(response_pattern, timeout=response_timeout):
+            await page.click(SEARCH_BUTTON)
+    except PlaywrightTimeoutError:
+        fallback = True  # results API not seen (pattern changed?) — rely on the DOM wait below
+
+    try:
+        await page.wait_for_selector(PROPERTY_CARD, state="attached", timeout=results_timeout)
+    except PlaywrightTimeoutError:
+        # No cards: either no listing for this hotel or a slow page. Let the network settle, the spider decides
+        fallback = True
+        try:
+            await page.wait_for_load_state("networkidle", timeout=FALLBACK_WAIT * 3)
+        except PlaywrightTimeoutError:
+            pass
+    return fallback
+
+
+async def open_gallery(page, timeout):
+    # image bytes are blocked, so wait for <img> elements to be attached rather than visible
+    await page.wait_for_selector("img", state="attached", timeout=timeout)  # wait for initial page load
+    await page.click(GALLERY_BUTTON, timeout=timeout)
+    await page.wait_for_selector("img", state="attached", timeout=timeout)  # wait again for the photo gallery after click
+    return False
+
+
+def block_check(screenshots, block_detector, timings):
+    if screenshots is None or block_detector is None or not screenshots.enabled:
+        return []
+    return [PageMethod(capture_if_blocked, block_detector, screenshots, timings)]
+
+
+def search_page_methods(search_prompt, timings, settings, screenshots=None, block_detector=None):
+    """PageMethods for homepage → consent → prompt → suggestion → search results (→ block screenshot)."""
+    timeouts = {**STEP_TIMEOUTS, **(settings.getdict("SEARCH_STEP_TIMEOUTS") or {})}
+    response_pattern = settings.get("SEARCH_RESULTS_RESPONSE_PATTERN", "**/graphql/search**")
+
+    def step(name, action, **kwargs):
+        return PageMethod(timed_step, name, action, timings, screenshots=screenshots, **kwargs)
+
+    return [
+        # Dismiss cookie banner if present
+        step("consent", dismiss_consent, timeout=timeouts["consent"]),
+
+        # enter search prompt(format: hotel name, city) and wait for the suggestion list to open
+        step("suggestions", enter_prompt, prompt=search_prompt, timeout=timeouts["suggestions"]),
+
+        # click the first listing from auto suggestion box
+        step("pick_suggestion", pick_suggestion, timeout=timeouts["pick_suggestion"]),
+
+        # click search button, wait for the results API response and the first property card
+        step("search", submit_search,
+             response_pattern=response_pattern,
+             response_timeout=timeouts["search_response"],
+             results_timeout=timeouts["results"]),
+    ] + block_check(screenshots, block_detector, timings)
+
+
+def hotel_page_methods(timings, settings, screenshots=None, block_detector=None):
+    """PageMethods for the hotel detail page: open the "see all photos" gallery (→ block screenshot)."""
+    timeouts = {**STEP_TIMEOUTS, **(settings.getdict("SEARCH_STEP_TIMEOUTS") or {})}
+    return [
+        PageMethod(timed_step, "gallery", open_gallery, timings, screenshots=screenshots, timeout=timeouts["gallery"]),
+    ] + block_check(screenshots, block_detector, timings)
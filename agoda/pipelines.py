@@ -1,84 +1,470 @@
-
+import io
+import json
+import time
+import hashlib
+import queue
+import datetime
+import threading
 import psycopg2
-from psycopg2.extras import execute_values
+from scrapy.exceptions import DropItem
+from twisted.internet import threads, task
+from .metrics import get_metrics
+from .failure_store import get_failure_store, DB_ERROR
+from .images import image_rows, ImageManifestWriter
 
-class HotelDataPipeline:
-    def open_spider(self, spider):
-        self.connection = psycopg2.connect(
-            host=spider.settings.get("POSTGRES_HOST"),
-            database=spider.settings.get("POSTGRES_DB"),
-            user=spider.settings.get("POSTGRES_USER"),
-            password=spider.settings.get("POSTGRES_PASSWORD")
-        )
-        self.cursor = self.connection.cursor()
-        self.cursor.execute("""
-            CREATE TABLE IF NOT EXISTS hotels (
-                name TEXT,
-                url TEXT UNIQUE,
-                location TEXT,
-                description TEXT,
-                facilities TEXT[],
-                image_urls TEXT[]
-            );
-        """)
-        self.connection.commit()
-
-        self.buffer = []
-        self.buffer_size = 100
-        self.test_mode = spider.settings.getbool("TEST_MODE")
+HOTEL_COLUMNS = ("name", "url", "location", "description", "facilities", "image_urls")
+HASHED_COLUMNS = ("name", "location", "description", "facilities", "image_urls")
+STAGING_COLUMNS = HOTEL_COLUMNS + ("content_hash",)
+CONNECTION_ERRORS = (psycopg2.OperationalError, psycopg2.InterfaceError)
+# Change tracking columns, added in place so existing tables migrate on the next run
+TRACKING_COLUMNS = {
+    "content_hash": "TEXT",
+    "first_seen": "TIMESTAMPTZ DEFAULT now()",
+    "last_seen": "TIMESTAMPTZ DEFAULT now()",
+    "last_changed": "TIMESTAMPTZ DEFAULT now()",
+    "last_changed_run": "TEXT",
+}
+HOTELS_FILLFACTOR = 90  # free space per page keeps the last_seen bumps HOT updates
+_STOP = object()  # queue sentinel
+BACKPRESSURE_POLL = 0.1  # seconds between retries while the writer queue is full
 
-    def process_item(self, item, spider):
-        if self.test_mode:
+
+def copy_text(value):
+    """Encode one value for COPY ... FROM STDIN (text format)."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, (list, tuple)):
+        # TEXT[] literal: quote every element, NULL for missing ones
+        value = "{" + ",".join(
+            "NULL" if v is None else '"' + str(v).replace("\\", "\\\\").replace('"', '\\"') + '"'
+            for v in value
+        ) + "}"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+def content_hash(row):
+    """Stable hash over the scraped content, used to skip rewriting hotels that didn't change."""
+    values = dict(zip(HOTEL_COLUMNS, row))
+    payload = json.dumps([values[c] for c in HASHED_COLUMNS], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class HotelDbWriter(threading.Thread):
+    """Background writer: drains the row queue and bulk-loads it with COPY into a staging table,
+    then merges into `hotels`. Keeps all DB I/O off the reactor thread."""
+
+    def __init__(self, connect, rows, flush_size, flush_interval, dead_letter_path, logger, stats,
+                 upsert_mode="incremental", run_id=None, last_seen_resolution="1 day", metrics=None,
+                 on_dead_letter=None, image_manifests=None, on_stored=None):
+        super().__init__(name="hotel-db-writer", daemon=True)
+        self.connect = connect
+        self.upsert_mode = upsert_mode
+        self.run_id = run_id
+        self.last_seen_resolution = last_seen_resolution
+        self.rows = rows
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.dead_letter_path = dead_letter_path
+        self.logger = logger
+        self.stats = stats
+        self.metrics = metrics
+        self.on_dead_letter = on_dead_letter  # called with (row_indices, error) from this thread
+        self.on_stored = on_stored  # called with [(row_index, batch_index)] after each commit, from this thread
+        self.image_manifests = image_manifests  # ImageManifestWriter for images no earlier run has seen
+        self.connection = self.open_connection()
+
+    def open_connection(self):
+        connection = self.connect()
+        with connection.cursor() as cursor:
+            # Session-local staging table for COPY, emptied at every commit (recreated after a reconnect)
+            cursor.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS hotels_staging (
+                    name TEXT,
+                    url TEXT,
+                    location TEXT,
+                    description TEXT,
+                    facilities TEXT[],
+                    image_urls TEXT[],
+                    content_hash TEXT
+                ) ON COMMIT DELETE ROWS;
+            """)
+        connection.commit()
+        return connection
+
+    def run(self):
+        batch = []
+        deadline = None
+        stopping = False
+        while not stopping:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
             try:
-                self.cursor.execute("""
-                    INSERT INTO hotels (name, url, location, description, facilities, image_urls)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    ON CONFLICT DO NOTHING;
-                """, (
-                    item["name"],
-                    item["url"],
-                    item["location"],
-                    item["description"],
-                    item["facilities"],
-                    item["image_urls"]
-                ))
-                self.connection.commit()
-            except Exception as e:
-                spider.logger.error(f"[DB ERROR] Insert failed for {item['name']}: {e}")
-        else:
-            row = (
-                item["name"],
-                item["url"],
-                item["location"],
-                item["description"],
-                item["facilities"],
-                item["image_urls"]
+                entry = self.rows.get(timeout=timeout)  # (row, input row_index, batch_index)
+                if entry is _STOP:
+                    stopping = True
+                else:
+                    batch.append(entry)
+                    deadline = deadline or time.monotonic() + self.flush_interval
+            except queue.Empty:
+                pass
+
+            # Flush on size, on age of the oldest buffered row, or on shutdown
+            if batch and (stopping or len(batch) >= self.flush_size or time.monotonic() >= deadline):
+                self.flush(batch)
+                batch = []
+                deadline = None
+        self.connection.close()
+
+    # ----------- FLUSH -------------
+    def flush(self, batch):
+        started = time.monotonic()
+        error = "connection lost"
+        for attempt in range(3):
+            try:
+                self.copy_merge(batch)
+                self.stored(batch)
+                self.stats.inc_value("db_writer/rows_flushed", len(batch))
+                self.stats.inc_value("db_writer/flushes")
+                if self.metrics:
+                    self.metrics.observe("db_flush", time.monotonic() - started)
+                    self.metrics.hotel("stored", len(batch))
+                return
+            except CONNECTION_ERRORS as e:
+                # DB unreachable: reconnect and retry the whole batch a few times before giving up on it
+                self.logger.error(f"[DB ERROR] Connection lost during flush (attempt {attempt + 1}): {e}")
+                time.sleep(2 ** attempt)
+                self.reconnect()
+            except psycopg2.Error as e:
+                # Bad data somewhere in the batch: isolate the poisoned rows one by one
+                self.logger.error(f"[DB ERROR] Batch insert failed, retrying row by row: {e}")
+                self.rollback()
+                self.flush_row_by_row(batch)
+                return
+            except OSError as e:
+                # Image manifest not written (disk full, permissions): nothing committed, try the batch again
+                self.logger.error(f"[IMAGES] Manifest write failed (attempt {attempt + 1}): {e}")
+                self.stats.inc_value("images/manifest_errors")
+                self.rollback()
+                error = f"image manifest not written: {e}"
+                time.sleep(2 ** attempt)
+        self.dead_letter(batch, error)
+
+    def flush_row_by_row(self, batch):
+        for entry in batch:
+            try:
+                self.copy_merge([entry])
+                self.stored([entry])
+                self.stats.inc_value("db_writer/rows_flushed")
+                if self.metrics:
+                    self.metrics.hotel("stored")
+            except (psycopg2.Error, OSError) as e:
+                self.rollback()
+                self.dead_letter([entry], str(e))
+
+    def copy_merge(self, batch):
+        payload = "".join("\t".join(copy_text(v) for v in row) + "\n" for row, _, _ in batch)
+        with self.connection.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY hotels_staging ({', '.join(STAGING_COLUMNS)}) FROM STDIN",
+                io.StringIO(payload),
             )
-            self.buffer.append(row)
+            if self.upsert_mode == "incremental":
+                written_urls = self.merge_incremental(cursor)
+            else:
+                cursor.execute(self.insert_sql())
+                written_urls = {url for (url,) in cursor.fetchall()}
+            new_images = self.merge_images(cursor, batch, written_urls)
+        # Manifest first (fsynced), then commit: a crash in between re-lists images on the retry, which the
+        # downloader dedupes by key; the other order would lose them for good (the table already knows them)
+        self.write_manifests(new_images)
+        self.connection.commit()  # staging is ON COMMIT DELETE ROWS
+
+    def insert_sql(self):
+        columns = ", ".join(STAGING_COLUMNS)
+        # DISTINCT ON: the same hotel URL may appear twice in one batch
+        return f"""
+            INSERT INTO hotels ({columns})
+            SELECT DISTINCT ON (url) {columns} FROM hotels_staging
+            ON CONFLICT (url) DO NOTHING
+            RETURNING url;
+        """
 
-            if len(self.buffer) >= self.buffer_size:
-                self.flush_buffer(spider)
+    def merge_incremental(self, cursor):
+        """Insert new hotels, rewrite only rows whose content hash changed, leave the rest alone.
+        Returns the URLs of the hotels that were inserted or changed."""
+        columns = ", ".join(STAGING_COLUMNS)
+        updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in STAGING_COLUMNS if c != "url")
+        cursor.execute(f"""
+            INSERT INTO hotels ({columns}, first_seen, last_seen, last_changed, last_changed_run)
+            SELECT DISTINCT ON (url) {columns}, now(), now(), now(), %(run_id)s FROM hotels_staging
+            ON CONFLICT (url) DO UPDATE SET {updates},
+                last_seen = EXCLUDED.last_seen,
+                last_changed = EXCLUDED.last_changed,
+                last_changed_run = EXCLUDED.last_changed_run
+            WHERE hotels.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+            RETURNING url, (xmax = 0) AS inserted;
+        """, {"run_id": self.run_id})
+        results = cursor.fetchall()
+        inserted = sum(1 for _, is_new in results if is_new)
+        self.stats.inc_value("db_writer/rows_inserted", inserted)
+        self.stats.inc_value("db_writer/rows_changed", len(results) - inserted)
 
-        return item
+        # Unchanged rows only get last_seen bumped, and at most once per resolution window. The column
+        # isn't indexed, so with the table's fillfactor this stays a small HOT update, not a row rewrite
+        cursor.execute("""
+            UPDATE hotels h SET last_seen = now()
+            FROM hotels_staging s
+            WHERE h.url = s.url AND h.last_seen < now() - %(resolution)s::interval;
+        """, {"resolution": self.last_seen_resolution})
+        cursor.execute("SELECT count(DISTINCT url) FROM hotels_staging;")
+        self.stats.inc_value("db_writer/rows_unchanged", cursor.fetchone()[0] - len(results))
+        return {url for url, _ in results}
 
-    def flush_buffer(self, spider):
+    def merge_images(self, cursor, batch, written_urls):
+        """Record the images of inserted/changed hotels in hotel_images; returns the ones no hotel had before
+        as {batch_index: [(image_key, url, hotel_url)]}. Unchanged hotels are skipped: same photos, no work."""
+        hotel_urls, keys, urls, orders, batches = [], [], [], [], {}
+        for row, _, batch_index in batch:
+            hotel_url = row[HOTEL_COLUMNS.index("url")]
+            if hotel_url not in written_urls or hotel_url in batches:
+                continue
+            batches[hotel_url] = batch_index
+            for key, url, order in image_rows(row[HOTEL_COLUMNS.index("image_urls")]):
+                hotel_urls.append(hotel_url)
+                keys.append(key)
+                urls.append(url)
+                orders.append(order)
+        if not keys:
+            return {}
+
+        # Data-modifying CTEs share one snapshot: `fresh` sees hotel_images as it was before the insert
+        cursor.execute("""
+            WITH incoming AS (
+                SELECT * FROM unnest(%(hotels)s::text[], %(keys)s::text[], %(urls)s::text[], %(orders)s::int[])
+                    AS t(hotel_url, image_key, url, sort_order)
+            ),
+            fresh AS (
+                SELECT DISTINCT ON (image_key) image_key, url, hotel_url FROM incoming i
+                WHERE NOT EXISTS (SELECT 1 FROM hotel_images h WHERE h.image_key = i.image_key)
+                ORDER BY image_key, hotel_url
+            ),
+            upserted AS (
+                INSERT INTO hotel_images (hotel_url, image_key, url, sort_order, first_seen_run)
+                SELECT hotel_url, image_key, url, sort_order, %(run_id)s FROM incoming
+                ON CONFLICT (hotel_url, image_key) DO UPDATE SET
+                    url = EXCLUDED.url, sort_order = EXCLUDED.sort_order, last_seen = now()
+            )
+            SELECT image_key, url, hotel_url FROM fresh;
+        """, {"hotels": hotel_urls, "keys": keys, "urls": urls, "orders": orders, "run_id": self.run_id})
+        new_images = {}
+        for key, url, hotel_url in cursor.fetchall():
+            new_images.setdefault(batches[hotel_url], []).append((key, url, hotel_url))
+        self.stats.inc_value("images/recorded", len(keys))
+        return new_images
+
+    def write_manifests(self, new_images):
+        if not self.image_manifests:
+            return
+        for batch_index, images in new_images.items():
+            self.stats.inc_value("images/new", self.image_manifests.write(batch_index, images))
+
+    def stored(self, batch):
+        if self.on_stored:
+            self.on_stored([(row_index, batch_index) for _, row_index, batch_index in batch if row_index is not None])
+
+    def rollback(self):
         try:
-            execute_values(
-                self.cursor,
-                """
-                INSERT INTO hotels (name, url, location, description, facilities, image_urls)
-                VALUES %s
-                ON CONFLICT DO NOTHING;
-                """,
-                self.buffer
+            self.connection.rollback()
+        except psycopg2.Error:
+            self.reconnect()  # connection is gone, a fresh one has nothing to roll back
+
+    def reconnect(self):
+        try:
+            self.connection.close()
+        except psycopg2.Error:
+            pass
+        try:
+            self.connection = self.open_connection()
+        except CONNECTION_ERRORS as e:
+            self.logger.error(f"[DB ERROR] Reconnect failed: {e}")
+
+    def dead_letter(self, batch, error):
+        """Park rows that can't be written so they don't wedge the batch; replay them later from the file."""
+        self.stats.inc_value("db_writer/dead_letter", len(batch))
+        try:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                for row, row_index, _ in batch:
+                    f.write(json.dumps({
+                        "row": dict(zip(STAGING_COLUMNS, row)),
+                        "row_index": row_index,
+                        "error": error,
+                        "failed_at": datetime.datetime.utcnow().isoformat(),
+                    }, ensure_ascii=False) + "\n")
+        except OSError as e:
+            # Same disk trouble as the manifest, most likely; the rows stay un-checkpointed and are re-crawled
+            self.logger.error(f"[DB ERROR] Could not dead-letter {len(batch)} rows: {e}")
+        if self.on_dead_letter:
+            self.on_dead_letter([row_index for _, row_index, _ in batch if row_index is not None], error)
+
+
+class HotelDataPipeline:
+    def open_spider(self, spider):
+        settings = spider.settings
+
+        def connect():
+            return psycopg2.connect(
+                host=settings.get("POSTGRES_HOST"),
+                database=settings.get("POSTGRES_DB"),
+                user=settings.get("POSTGRES_USER"),
+                password=settings.get("POSTGRES_PASSWORD")
             )
-            self.connection.commit()
-            self.buffer.clear()
-        except Exception as e:
-            spider.logger.error(f"[DB ERROR] Batch insert failed: {e}")
+
+        self.writer = HotelDbWriter(
+            connect,
+            rows=queue.Queue(maxsize=settings.getint("DB_QUEUE_SIZE", 1000)),
+            flush_size=settings.getint("DB_FLUSH_SIZE", 100),
+            flush_interval=settings.getfloat("DB_FLUSH_INTERVAL", 5.0),
+            dead_letter_path=settings.get("DB_DEAD_LETTER_FILE", "output/db_dead_letter.ndjson"),
+            logger=spider.logger,
+            stats=spider.crawler.stats,
+            upsert_mode=settings.get("HOTELS_UPSERT_MODE", "incremental"),
+            run_id=settings.get("CRAWL_RUN_ID"),
+            last_seen_resolution=settings.get("HOTELS_LAST_SEEN_RESOLUTION", "1 day"),
+            metrics=get_metrics(spider.crawler),
+            on_dead_letter=self.record_db_failures,
+            on_stored=self.record_stored,
+            image_manifests=ImageManifestWriter(settings.get("IMAGE_MANIFEST_DIR", "output/image_manifests"),
+                                                settings.get("CRAWL_RUN_ID")),
+        )
+        self.failures = get_failure_store(spider.crawler)
+        self.spider = spider
+        # The spider checkpoints rows with an item only when record_stored reports them committed
+        spider.crawler.agoda_storage_acks = True
+        self.writer.metrics.gauge("pipeline_queue_depth", "Rows waiting for the DB writer", self.writer.rows.qsize)
+        self.create_tables(self.writer.connection, settings.get("CRAWL_RUN_ID"))
+        self.writer.start()
+        self.stats = spider.crawler.stats
+
+    @staticmethod
+    def create_tables(connection, run_id):
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS hotels (
+                    name TEXT,
+                    url TEXT UNIQUE,
+                    location TEXT,
+                    description TEXT,
+                    facilities TEXT[],
+                    image_urls TEXT[]
+                );
+            """)
+            # Change tracking + fillfactor. ALTER TABLE takes an ACCESS EXCLUSIVE lock even when it changes
+            # nothing (every other node's reads and writes on hotels queue behind it), so only alter what differs
+            cursor.execute("""
+                SELECT c.reloptions, array_agg(a.attname::text)
+                FROM pg_class c JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+                WHERE c.oid = 'hotels'::regclass
+                GROUP BY c.reloptions;
+            """)
+            reloptions, columns = cursor.fetchone()
+            changes = [f"ADD COLUMN IF NOT EXISTS {name} {definition}"
+                       for name, definition in TRACKING_COLUMNS.items() if name not in columns]
+            if f"fillfactor={HOTELS_FILLFACTOR}" not in (reloptions or []):
+                changes.append(f"SET (fillfactor = {HOTELS_FILLFACTOR})")
+            if changes:
+                cursor.execute(f"ALTER TABLE hotels {', '.join(changes)};")
+            # "What changed since run X": WHERE last_changed >= (SELECT started_at FROM crawl_runs WHERE run_id = X)
+            cursor.execute("CREATE INDEX IF NOT EXISTS hotels_last_changed_idx ON hotels (last_changed);")
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS crawl_runs (
+                    run_id TEXT PRIMARY KEY,
+                    started_at TIMESTAMPTZ NOT NULL DEFAULT now()
+                );
+            """)
+            cursor.execute("INSERT INTO crawl_runs (run_id) VALUES (%s) ON CONFLICT DO NOTHING;", (run_id,))
+            # One row per hotel + canonical image key (agoda/images.py); image_key alone finds every hotel using a photo
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS hotel_images (
+                    hotel_url TEXT NOT NULL,
+                    image_key TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    sort_order INT,
+                    first_seen TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    last_seen TIMESTAMPTZ NOT NULL DEFAULT now(),
+                    first_seen_run TEXT
+                );
+            """)
+            cursor.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS hotel_images_hotel_key_idx ON hotel_images (hotel_url, image_key);
+            """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS hotel_images_key_idx ON hotel_images (image_key);")
+        connection.commit()
+
+    @staticmethod
+    def row_from_item(item):
+        row = (
+            item.get("name_agoda") or item.get("name_original"),
+            item.get("url"),
+            item.get("location_agoda") or item.get("location_original"),
+            item.get("description"),
+            item.get("facilities"),
+            item.get("image_urls"),
+        )
+        return row + (content_hash(row),)
+
+    def record_db_failures(self, row_indices, error):
+        # Writer thread → reactor thread, which owns the failure store's SQLite connection
+        from twisted.internet import reactor
+
+        def record():
+            for row_index in row_indices:
+                self.failures.record(row_index, DB_ERROR, detail=error)
+            self.spider.rows_not_stored(len(row_indices))
+        reactor.callFromThread(record)
+
+    def record_stored(self, rows):
+        # Writer thread → reactor thread: the spider checkpoints these rows now that they're in Postgres
+        from twisted.internet import reactor
+        reactor.callFromThread(self.spider.rows_stored, rows)
+
+    def process_item(self, item, spider):
+        entry = (self.row_from_item(item), item.get("row_index"), item.get("batch_index"))
+        try:
+            self.enqueue(entry)
+            return item
+        except queue.Full:
+            # Back-pressure: the DB is behind. Hand the item back only once there's room, which keeps
+            # the scraper slot busy and makes Scrapy slow down instead of buffering without bound
+            self.stats.inc_value("db_writer/backpressure")
+            return self.wait_for_room(entry, item)
+
+    def enqueue(self, entry):
+        if not self.writer.is_alive():
+            # Nothing would ever drain the queue; drop the item (the spider leaves its row un-checkpointed)
+            raise DropItem("DB writer thread is not running")
+        self.writer.rows.put_nowait(entry)
+
+    def wait_for_room(self, entry, result):
+        # Poll from the reactor instead of parking a threadpool thread (shared with DNS) on a blocking put
+        from twisted.internet import reactor
+
+        def retry():
+            try:
+                self.enqueue(entry)
+                return result
+            except queue.Full:
+                return task.deferLater(reactor, BACKPRESSURE_POLL, retry)
+        return task.deferLater(reactor, BACKPRESSURE_POLL, retry)
 
     def close_spider(self, spider):
-        if not self.test_mode and self.buffer:
-            self.flush_buffer(spider)
-        self.cursor.close()
-        self.connection.close()
+        # Flush whatever is buffered and wait for the writer without blocking the reactor
+        if not self.writer.is_alive():
+            spider.logger.error("[DB ERROR] DB writer thread died — buffered rows were not written")
+            return None
+        try:
+            self.enqueue(_STOP)
+        except queue.Full:
+            d = self.wait_for_room(_STOP, None)
+            d.addCallback(lambda _: threads.deferToThread(self.writer.join))
+            return d
+        return threads.deferToThread(self.writer.join)
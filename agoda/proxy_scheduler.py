@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import random
+
+PRIOR_SUCCESS = 0.7  # optimistic start for proxies we know nothing about, so they get tried
+
+
+class ProxyHealth:
+    """Decaying (EWMA) success / CAPTCHA / latency figures for one proxy, plus its cooldown state."""
+
+    def __init__(self, success=PRIOR_SUCCESS, captcha=0.0, latency=None, samples=0,
+                 consecutive_failures=0, backoff_level=0, cooldown_until=0.0, updated_at=0.0):
+        self.success = success
+        self.captcha = captcha
+        self.latency = latency
+        self.samples = samples
+        self.consecutive_failures = consecutive_failures
+        self.backoff_level = backoff_level
+        self.cooldown_until = cooldown_until  # wall clock, so it survives restarts
+        self.updated_at = updated_at
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+class ProxyScheduler:
+    """Picks proxies by health score and quarantines failing ones with exponential backoff.
+
+    State is kept in a JSON file so a new run starts from what earlier runs learned. Old figures
+    drift back towards the prior with a half-life, so a proxy that was bad yesterday gets another chance.
+    """
+
+    def __init__(self, proxies, state_path, alpha=0.2, failure_threshold=3, base_cooldown=60,
+                 max_cooldown=3600, half_life=6 * 3600, latency_scale=10.0, save_every=20):
+        self.proxies = proxies
+        self.state_path = state_path
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = base_cooldown
+        self.max_cooldown = max_cooldown
+        self.half_life = half_life
+        self.latency_scale = latency_scale
+        self.save_every = save_every
+        self.updates_since_save = 0
+        self.health = self.load()
+
+    @classmethod
+    def from_settings(cls, proxies, settings):
+        return cls(
+            proxies,
+            settings.get("PROXY_HEALTH_FILE", "output/proxy_health.json"),
+            alpha=settings.getfloat("PROXY_HEALTH_ALPHA", 0.2),
+            failure_threshold=settings.getint("PROXY_FAILURE_THRESHOLD", 3),
+            base_cooldown=settings.getfloat("PROXY_COOLDOWN_BASE", 60),
+            max_cooldown=settings.getfloat("PROXY_COOLDOWN_MAX", 3600),
+            half_life=settings.getfloat("PROXY_HEALTH_HALF_LIFE", 6 * 3600),
+        )
+
+    # ----------- STATE -------------
+    def load(self):
+        health = {}
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, "r") as f:
+                    saved = json.load(f)
+                health = {p: ProxyHealth(**saved[p]) for p in self.proxies if p in saved}
+            except (OSError, ValueError, TypeError):
+                print(f"[PROXY] '{self.state_path}' unreadable — starting with fresh proxy health.")
+        for proxy in self.proxies:
+            health.setdefault(proxy, ProxyHealth())
+        now = time.time()
+        for h in health.values():
+            self.decay(h, now)
+        return health
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({p: h.to_dict() for p, h in self.health.items()}, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+        self.updates_since_save = 0
+
+    def decay(self, h, now):
+        # Pull stale figures back towards the prior: weight halves every `half_life` seconds
+        if not h.updated_at:
+            return
+        keep = 0.5 ** ((now - h.updated_at) / self.half_life)
+        h.success = PRIOR_SUCCESS + (h.success - PRIOR_SUCCESS) * keep
+        h.captcha *= keep
+        h.updated_at = now  # decayed up to now; the next load must not decay the same span again
+
+    # ----------- PICK -------------
+    def score(self, h):
+        latency_penalty = 1.0 + (h.latency or 0.0) / self.latency_scale
+        return max(h.success * (1.0 - h.captcha), 0.01) / latency_penalty
+
+    def pick(self, exclude=()):
+        now = time.time()
+        available = [p for p in self.proxies if self.health[p].cooldown_until <= now and p not in exclude]
+        if not available:
+            available = [p for p in self.proxies if self.health[p].cooldown_until <= now]
+        if not available:
+            # Everything is quarantined: use the proxy that comes out of cooldown first
+            return min(self.proxies, key=lambda p: self.health[p].cooldown_until)
+        # Weighted random rather than argmax, so close scores still share load and stats keep updating
+        weights = [self.score(self.health[p]) ** 2 for p in available]
+        return random.choices(available, weights=weights)[0]
+
+    # ----------- RECORD -------------
+    def record_success(self, proxy, latency=None):
+        h = self.health.get(proxy)
+        if h is None:
+            return
+        h.success += self.alpha * (1.0 - h.success)
+        h.captcha -= self.alpha * h.captcha
+        if latency is not None:
+            h.latency = latency if h.latency is None else h.latency + self.alpha * (latency - h.latency)
+        h.consecutive_failures = 0
+        h.backoff_level = max(h.backoff_level - 1, 0)
+        self.touch(h)
+
+    def record_failure(self, proxy, captcha=False):
+        """Returns the cooldown in seconds if the proxy was just quarantined, else None."""
+        h = self.health.get(proxy)
+        if h is None:
+            return None
+        h.success -= self.alpha * h.success
+        if captcha:
+            h.captcha += self.alpha * (1.0 - h.captcha)
+        h.consecutive_failures += 1
+        cooldown = None
+        if h.consecutive_failures >= self.failure_threshold:
+            cooldown = min(self.base_cooldown * 2 ** h.backoff_level, self.max_cooldown)
+            h.cooldown_until = time.time() + cooldown
+            h.backoff_level += 1
+            h.consecutive_failures = 0
+        self.touch(h)
+        return cooldown
+
+    def touch(self, h):
+        h.samples += 1
+        h.updated_at = time.time()
+        self.updates_since_save += 1
+        if self.updates_since_save >= self.save_every:
+            self.save()
+
+    def in_cooldown(self, proxy):
+        h = self.health.get(proxy)
+        return bool(h and h.cooldown_until > time.time())
+
+    def quarantined_count(self):
+        now = time.time()
+        return sum(1 for h in self.health.values() if h.cooldown_until > now)
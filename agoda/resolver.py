@@ -0,0 +1,113 @@
+"""Resolve (hotel_name, city_name) straight to an Agoda property URL without the browser search flow.
+
+Order: persistent SQLite cache → plain-HTTP autosuggest call (the endpoint the search box uses)
+→ full browser search on a miss. Only URLs whose hotel page parsed and carries the requested hotel's
+name are cached, so a wrong autosuggest guess is never reused.
+"""
+import os
+import re
+import sqlite3
+import datetime
+import unicodedata
+from urllib.parse import quote, urlsplit, urlunsplit
+
+AUTOSUGGEST_URL = (
+    "https://www.agoda.com/api/cronos/search/GetUnifiedSuggestResult/3/1/1/0/en-us/"
+    "?searchText={query}&origin=US&cid=-1&pageTypeId=1&logtime=0&isHotelLandSearch=true"
+)
+PROPERTY_PATH = re.compile(r"/hotel/[^/]+\.html")  # e.g. /en-us/some-hotel/hotel/bangkok-th.html
+# Words most hotel names share, ignored when checking that a page is the hotel asked for
+GENERIC_NAME_WORDS = frozenset({
+    "the", "and", "by", "of", "at", "a", "hotel", "hotels", "resort", "resorts", "spa", "inn", "suites",
+    "residence", "apartment", "apartments", "hostel", "villa", "villas", "boutique", "beach", "grand",
+})
+
+
+def normalize(text):
+    """Lowercase, strip accents/punctuation and collapse whitespace so trivial variants share a key."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(c for c in text if not unicodedata.combining(c)).lower()
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def name_words(name):
+    words = set(normalize(name).split())
+    return words - GENERIC_NAME_WORDS or words
+
+
+def names_match(query, page_name, min_overlap=0.6):
+    """Loose check that a hotel page is the hotel asked for: most of the query's distinctive words
+    (not "hotel", "resort", ...) are in its name."""
+    wanted, found = name_words(query), name_words(page_name)
+    return bool(wanted) and len(wanted & found) / len(wanted) >= min_overlap
+
+
+def cache_key(hotel_name, city_name):
+    return f"{normalize(hotel_name)}|{normalize(city_name)}"
+
+
+def strip_query(url):
+    # Search-result links carry check-in dates etc., the cached URL only needs the property path
+    parts = urlsplit(url)
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, "", ""))
+
+
+class HotelUrlCache:
+    """Persistent (normalized name + city) → property URL mapping."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS resolved_hotels (
+                key TEXT PRIMARY KEY,
+                url TEXT NOT NULL,
+                source TEXT,
+                resolved_at TEXT
+            )
+        """)
+        self.connection.commit()
+
+    def get(self, hotel_name, city_name):
+        row = self.connection.execute(
+            "SELECT url FROM resolved_hotels WHERE key = ?", (cache_key(hotel_name, city_name),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, hotel_name, city_name, url, source):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO resolved_hotels (key, url, source, resolved_at) VALUES (?, ?, ?, ?)",
+            (cache_key(hotel_name, city_name), strip_query(url), source,
+             datetime.datetime.utcnow().isoformat()),
+        )
+        self.connection.commit()
+
+    def invalidate(self, hotel_name, city_name):
+        self.connection.execute("DELETE FROM resolved_hotels WHERE key = ?", (cache_key(hotel_name, city_name),))
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+def autosuggest_url(template, hotel_name, city_name):
+    return template.format(query=quote(f"{hotel_name}, {city_name}"))
+
+
+def find_property_url(data):
+    """Return the first property page URL in an autosuggest JSON payload, or None.
+
+    The payload layout isn't documented, so walk it and take the first string that looks like
+    a property path rather than depending on exact key names.
+    """
+    stack = [data]
+    while stack:
+        node = stack.pop(0)
+        if isinstance(node, dict):
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, str) and PROPERTY_PATH.search(node):
+            return node
+    return None
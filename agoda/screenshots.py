@@ -0,0 +1,118 @@
+import os
+import re
+import random
+import asyncio
+import hashlib
+import threading
+
+OFF = "off"
+FAILURE = "failure"    # only when a step raises or falls back, or the page is a CAPTCHA / block page
+SAMPLED = "sampled"    # failures + every step of a random `sample_rate` share of hotels
+
+
+class ScreenshotPolicy:
+    """Decides when to screenshot and keeps the screenshot folder under a disk budget.
+
+    Captures are JPEG at a configurable quality, file names are a short safe slug plus a hash of the
+    hotel name (no collisions, no invalid characters), and files are written off the event loop.
+    """
+
+    def __init__(self, mode=FAILURE, sample_rate=0.0, directory="screenshots", quality=60,
+                 budget_bytes=200 * 1024 * 1024, stats=None):
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.quality = quality
+        self.budget_bytes = budget_bytes
+        self.stats = stats
+        self.used_bytes = None  # measured lazily, on the first capture
+        self.lock = threading.Lock()  # writes run on executor threads, concurrently
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            mode=settings.get("SCREENSHOT_MODE", FAILURE),
+            sample_rate=settings.getfloat("SCREENSHOT_SAMPLE_RATE", 0.0),
+            directory=settings.get("SCREENSHOT_DIR", "screenshots"),
+            quality=settings.getint("SCREENSHOT_QUALITY", 60),
+            budget_bytes=settings.getint("SCREENSHOT_BUDGET_MB", 200) * 1024 * 1024,
+            stats=crawler.stats,
+        )
+
+    def sample(self):
+        """Draw the per-row sampling decision; made once per row and carried in request meta."""
+        return self.mode == SAMPLED and random.random() < self.sample_rate
+
+    def for_hotel(self, hotel_name, sampled):
+        return HotelScreenshots(self, hotel_name, sampled)
+
+    @staticmethod
+    def filename(hotel_name, step):
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", hotel_name or "").strip("-")[:40] or "hotel"
+        digest = hashlib.sha1((hotel_name or "").encode("utf-8")).hexdigest()[:10]
+        return f"{slug}_{digest}_{step}.jpg"
+
+    async def capture(self, page, hotel_name, step):
+        try:
+            data = await page.screenshot(type="jpeg", quality=self.quality)
+        except Exception:
+            return  # page already gone; a missing debug screenshot must never fail the hotel
+        path = os.path.join(self.directory, self.filename(hotel_name, step))
+        await asyncio.get_running_loop().run_in_executor(None, self.write, path, data)
+        if self.stats:
+            self.stats.inc_value("screenshots/captured")
+            self.stats.inc_value("screenshots/bytes", len(data))
+
+    # ----------- DISK BUDGET -------------
+    def write(self, path, data):
+        with self.lock:
+            os.makedirs(self.directory, exist_ok=True)
+            if self.used_bytes is None:
+                self.used_bytes = sum(e.stat().st_size for e in os.scandir(self.directory) if e.is_file())
+            with open(path, "wb") as f:
+                f.write(data)
+            self.used_bytes += len(data)
+            if self.used_bytes > self.budget_bytes:
+                self.prune()
+
+    def prune(self):
+        """Delete the oldest screenshots until usage is back under 90% of the budget (called under the lock)."""
+        files = sorted((e for e in os.scandir(self.directory) if e.is_file()), key=lambda e: e.stat().st_mtime)
+        self.used_bytes = sum(e.stat().st_size for e in files)
+        target = self.budget_bytes * 0.9
+        for entry in files:
+            if self.used_bytes <= target:
+                break
+            size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                continue
+            self.used_bytes -= size
+            if self.stats:
+                self.stats.inc_value("screenshots/pruned")
+
+
+class HotelScreenshots:
+    """Screenshot decisions for one hotel's pages (`sampled` comes from the row's meta)."""
+
+    def __init__(self, policy, hotel_name, sampled):
+        self.policy = policy
+        self.hotel_name = hotel_name
+        self.sampled = sampled
+
+    @property
+    def enabled(self):
+        return self.policy.mode != OFF
+
+    async def after_step(self, page, step, failed):
+        if self.policy.mode == OFF:
+            return
+        if failed or self.sampled:
+            await self.policy.capture(page, self.hotel_name, step)
+
+    async def after_block(self, page, verdict):
+        if self.policy.mode == OFF:
+            return
+        await self.policy.capture(page, self.hotel_name, f"blocked_{verdict}")
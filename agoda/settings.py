@@ -1,4 +1,5 @@
 import os
+import datetime
 from dotenv import load_dotenv
 
 # Load .env variables
@@ -40,6 +41,63 @@ PLAYWRIGHT_LAUNCH_OPTIONS = {
     "args": ["--auto-open-devtools-for-tabs"],
 }
 
+# Worker pool: N isolated browser contexts, each bound to its own proxy with its own cookies and request counter.
+# 1 = everything in the default context (previous behaviour)
+PLAYWRIGHT_WORKERS = int(os.getenv("PLAYWRIGHT_WORKERS", 1))
+if PLAYWRIGHT_WORKERS > 1:
+    CONCURRENT_REQUESTS = PLAYWRIGHT_WORKERS
+    CONCURRENT_REQUESTS_PER_DOMAIN = 1  # per worker download slot → one page at a time per context, DOWNLOAD_DELAY per worker
+    # Chromium needs a launch-level proxy before per-context proxies can be used; every context overrides it
+    PLAYWRIGHT_LAUNCH_OPTIONS["proxy"] = {"server": "http://per-context"}
+
+# Browser lifecycle (agoda/browser_lifecycle.py): keeps Chromium memory flat over long runs.
+# Browser memory (Playwright driver + Chromium processes, via psutil or /proc) is sampled into stats.
+BROWSER_CONTEXT_MAX_PAGES = 100        # pages per context before it is swapped for a fresh one
+BROWSER_RSS_LIMIT_MB = 1500            # above this, every context is recycled
+BROWSER_RESTART_RSS_MB = 2500          # above this, the browser is drained and restarted
+BROWSER_MEMORY_SAMPLE_INTERVAL = 15    # seconds, 0 disables sampling
+
+# Screenshots (agoda/screenshots.py): "off", "failure" (step raised / fell back) or "sampled" (failures +
+# every step of SCREENSHOT_SAMPLE_RATE of hotels). Production pays nothing on the happy path.
+SCREENSHOT_MODE = "sampled" if TEST_MODE else "failure"
+SCREENSHOT_SAMPLE_RATE = 1.0 if TEST_MODE else 0.0
+SCREENSHOT_DIR = "screenshots"
+SCREENSHOT_QUALITY = 60       # JPEG quality
+SCREENSHOT_BUDGET_MB = 200    # oldest screenshots are deleted beyond this
+
+# Search flow / hotel page: bounded waits (ms) per event-driven step, see agoda/page_steps.py for defaults
+SEARCH_STEP_TIMEOUTS = {
+    "consent": 1500,
+    "suggestions": 5000,
+    "pick_suggestion": 2000,
+    "search_response": 10000,
+    "results": 10000,
+    "gallery": 30000,
+}
+# Network response the search page fires once results are loaded (Playwright URL glob)
+SEARCH_RESULTS_RESPONSE_PATTERN = "**/graphql/search**"
+
+# URL resolution: cache → plain-HTTP autosuggest → browser search (only on a miss)
+RESOLVER_ENABLED = True
+RESOLUTION_CACHE_PATH = "output/resolution_cache.sqlite"
+# AUTOSUGGEST_URL = "..."  # override the autosuggest endpoint template ({query} is url-encoded "name, city")
+
+# Hotel pages are fetched over plain HTTP first (same proxy/UA/headers) and read from the server-rendered DOM +
+# embedded JSON state; the browser only renders them when a required field is missing or the page is blocked
+HTTP_FIRST_ENABLED = True
+HTTP_FIRST_REQUIRED_FIELDS = ["name", "address", "image_urls"]
+HTTP_FIRST_MIN_IMAGES = 5   # fewer image URLs than this → render in the browser and open the gallery
+
+# Hotel page extraction backend: "lxml" or "selectolax" (optional, faster; falls back to lxml if missing)
+HOTEL_EXTRACTOR = "lxml"
+
+# Site entry point and the domains that get UA/Chrome header profiles (overridden by the offline replay benchmark)
+AGODA_BASE_URL = os.getenv("AGODA_BASE_URL", "https://www.agoda.com/")
+HEADER_DOMAINS = ["agoda.com"]
+PROXIES_FILE = os.getenv("PROXIES_FILE", "proxies.txt")
+# CAPTCHA / soft-block classification rules (status codes, URL patterns, markers in the head of the body)
+BLOCK_RULES_FILE = "block_rules.json"
+
 # Input CSV file
 HOTELS_FILE = os.getenv("HOTELS_FILE", "hotels.csv")
 
@@ -47,8 +105,37 @@ HOTELS_FILE = os.getenv("HOTELS_FILE", "hotels.csv")
 BATCH_INDEX = int(os.getenv("BATCH_INDEX", 0))
 BATCH_SIZE = int(os.getenv("BATCH_SIZE", 1000))
 
+# Streaming input: byte-offset index stored as <HOTELS_FILE>.idx.json (rebuilt when the CSV changes)
+HOTELS_INDEX_STRIDE = 100  # keep the offset of every Nth row
+# Completed rows per batch, so a crashed batch restarts where it stopped (delete a file to re-run that batch)
+CHECKPOINT_DIR = "output/checkpoints"
+
+# Metrics (agoda/metrics.py): stage histograms, hotel/proxy outcome counters and gauges, dumped per batch as
+# batch_N.metrics.json and served for Prometheus on http://METRICS_ADDRESS:METRICS_PORT/metrics when
+# prometheus_client is installed. Opt-in: 0 = no endpoint (e.g. METRICS_PORT=9410 in .env)
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))
+METRICS_ADDRESS = "127.0.0.1"
+
+# Failed hotels per input row with a classified reason (timeout, captcha, no_listing, selector_missing,
+# db_error, error); `-a mode=retry-failed` / `./launch.sh --retry-failed` re-runs the ones due for retry
+FAILURE_STORE_PATH = "output/failures.sqlite"
+# Per-reason override of agoda/failure_store.py RETRY_POLICY, e.g. {"captcha": {"max_attempts": 8, "backoff": 3600}}
+FAILURE_RETRY_POLICY = {}
+
+# Distributed mode (agoda/work_queue.py): nodes lease chunks of input rows from a shared queue instead of
+# a fixed BATCH_INDEX. "postgres" (uses the POSTGRES_* connection) or "sqlite:///output/work_queue.sqlite"
+# (one machine / tests); unset = batch mode
+WORK_QUEUE = os.getenv("WORK_QUEUE")
+WORK_QUEUE_NAME = os.getenv("WORK_QUEUE_NAME")        # defaults to the HOTELS_FILE name, same on every node
+WORK_QUEUE_NODE_ID = os.getenv("WORK_QUEUE_NODE_ID")  # defaults to <hostname>-<pid>
+WORK_QUEUE_CHUNK_SIZE = 25           # rows per lease
+WORK_QUEUE_LEASE_SECONDS = 600       # visibility timeout; renewed while the node works on the chunk
+WORK_QUEUE_POLL_INTERVAL = 30        # seconds between lease attempts while other nodes hold the rest
+
 # Logging
 LOG_LEVEL = "INFO"  # or "DEBUG" for development
+# Directory for per-batch logs/stats (batch_N.log, batch_N.stats.json); set by launch.sh / agoda.batch_runner
+BATCH_LOG_DIR = os.getenv("BATCH_LOG_DIR")
 # LOG_FILE = "logs/batch_{BATCH_INDEX}.log"  # optional fallback file, used when crawling manually (not via launch.sh)
 
 # ──────────────────────────────────────────────
@@ -72,6 +159,21 @@ POSTGRES_DB = os.getenv("POSTGRES_DB", "agoda")
 POSTGRES_USER = os.getenv("POSTGRES_USER", "your_user")
 POSTGRES_PASSWORD = os.getenv("POSTGRES_PASSWORD", "your_password")
 
+# Background DB writer (COPY into staging + merge), see HotelDbWriter in pipelines.py
+DB_FLUSH_SIZE = 1 if TEST_MODE else 100   # rows per flush (1 in test mode → rows show up immediately)
+DB_FLUSH_INTERVAL = 5.0                   # seconds, flush even a partial buffer once the oldest row is this old
+DB_QUEUE_SIZE = 1000                      # bounded queue; when full the spider is slowed down (back-pressure)
+DB_DEAD_LETTER_FILE = "output/db_dead_letter.ndjson"  # rows the DB rejected, one JSON object per line
+
+# hotels upsert: "incremental" updates a row only when its content hash changed (and tracks first_seen/last_seen/
+# last_changed), "insert" keeps the old ON CONFLICT DO NOTHING behaviour
+HOTELS_UPSERT_MODE = "incremental"
+HOTELS_LAST_SEEN_RESOLUTION = "1 day"  # unchanged rows get last_seen bumped at most this often
+# Images no earlier crawl has seen, one NDJSON file per batch, for `python -m agoda.image_downloader`
+IMAGE_MANIFEST_DIR = "output/image_manifests"
+# Identifies this crawl in crawl_runs / hotels.last_changed_run
+CRAWL_RUN_ID = os.getenv("CRAWL_RUN_ID") or datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+
 # ──────────────────────────────────────────────
 # Safety check for production credentials
 if not TEST_MODE and ("your_user" in POSTGRES_USER or "your_password" in POSTGRES_PASSWORD):
@@ -84,10 +186,12 @@ if not POSTGRES_USER or not POSTGRES_PASSWORD:
     missing.append("POSTGRES_USER and POSTGRES_PASSWORD")
 if not HOTELS_FILE or not os.path.exists(HOTELS_FILE):
     missing.append("HOTELS_FILE not found")
-if not os.path.exists("proxies.txt"):
-    missing.append("proxies.txt file not found")
+if not os.path.exists(PROXIES_FILE):
+    missing.append(f"{PROXIES_FILE} file not found")
 if not os.path.exists("user_agents.txt"):
     missing.append("user_agents.txt file not found")
+if not os.path.exists(BLOCK_RULES_FILE):
+    missing.append(f"{BLOCK_RULES_FILE} file not found")
 
 if missing:
     raise EnvironmentError("Missing settings/files: " + ", ".join(missing))
@@ -103,12 +207,55 @@ DOWNLOADER_MIDDLEWARES = {
 
 CAPTCHA_RETRY_TIMES = 1 # adjust this for production mode
 
+# Cookie sessions per proxy (agoda/cookie_store.py), in Playwright storage_state shape so warmed browser
+# sessions are reused across runs. Kept in memory, written at most every COOKIE_SAVE_INTERVAL seconds.
+COOKIE_JAR_FILE = "cookies.json"
+COOKIE_MAX_AGE = 86400       # seconds, older sessions are dropped
+COOKIE_SAVE_INTERVAL = 5.0
+
+# Proxy health scheduler (agoda/proxy_scheduler.py): proxies picked by decaying success/CAPTCHA/latency score,
+# quarantined with exponential backoff after repeated failures. State persists across runs.
+PROXY_HEALTH_FILE = "output/proxy_health.json"
+PROXY_HEALTH_ALPHA = 0.2            # EWMA weight of the newest outcome
+PROXY_HEALTH_HALF_LIFE = 6 * 3600   # seconds, old figures drift back to neutral
+PROXY_FAILURE_THRESHOLD = 3         # consecutive failures before a cooldown
+PROXY_COOLDOWN_BASE = 60            # seconds, doubles with each repeated quarantine
+PROXY_COOLDOWN_MAX = 3600
+
 # Register stealth coroutine handler for Playwright pages
 # PLAYWRIGHT_PAGE_COROUTINES = "agoda.middlewares.PlaywrightStealthMiddleware"
-# debug_pause on headful mode for debug
+# Run on every new page before navigation (via playwright_page_init_callback, see agoda/page_coroutines.py)
 PLAYWRIGHT_PAGE_COROUTINES = {
     "default": [
+        "agoda.middlewares.PlaywrightLifecycleMiddleware",
+        "agoda.middlewares.ResourceBlockingMiddleware",
         "agoda.middlewares.PlaywrightStealthMiddleware",
-        "agoda.playwright_debug.debug_pause",
+        "agoda.middlewares.PlaywrightCookieSyncMiddleware",
+        # debug_pause on headful mode for debug (pauses the first page in DevTools, then stops the crawl)
+        # "agoda.playwright_debug.debug_pause",
     ]
 }
+
+# Stealth fingerprint probe (page.evaluate) share of pages outside TEST_MODE (TEST_MODE probes every page)
+STEALTH_PROBE_RATE = 0.0
+
+# Resource blocking per page type: the scrape only reads the DOM (srcset attributes, not image bytes),
+# so images/fonts/media/trackers are aborted to save proxy bandwidth. allow_patterns always win.
+TRACKER_PATTERNS = [
+    r"google-analytics\.com", r"googletagmanager\.com", r"doubleclick\.net", r"googlesyndication\.com",
+    r"facebook\.(?:net|com)/tr", r"connect\.facebook\.net", r"hotjar\.com", r"criteo\.(?:com|net)",
+    r"bat\.bing\.com", r"taboola\.com", r"outbrain\.com", r"adsrvr\.org", r"clarity\.ms",
+]
+PLAYWRIGHT_BLOCKING = {
+    "search": {
+        "resource_types": ["image", "media", "font"],
+        "url_patterns": TRACKER_PATTERNS,
+        "allow_patterns": [],
+    },
+    "hotel": {
+        "resource_types": ["image", "media", "font"],
+        "url_patterns": TRACKER_PATTERNS,
+        "allow_patterns": [],
+    },
+}
+# PLAYWRIGHT_BLOCKING_SIZE_ESTIMATES = {"image": 60_000}  # bytes per blocked resource type, for the bytes-saved stat
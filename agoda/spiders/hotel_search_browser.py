@@ -1,7 +1,29 @@
 import scrapy
-import csv
-from scrapy_playwright.page import PageMethod
+import time
+from scrapy import signals
+from scrapy.utils.defer import maybe_deferred_to_future
+import asyncio
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+from twisted.internet.error import TimeoutError as TwistedTimeoutError
 from ..items import HotelItem
+from ..hotel_input import HotelInputReader, BatchCheckpoint
+from ..batch_runner import BatchRecorder
+from ..page_steps import search_page_methods, hotel_page_methods
+from ..screenshots import ScreenshotPolicy
+from ..block_detector import BlockDetector
+from ..extractors import get_extractor, extract_embedded_state, merge_results
+from ..page_coroutines import PageCoroutineRunner
+from ..metrics import get_metrics
+from ..work_queue import open_work_queue, ThreadedWorkQueue
+from ..failure_store import (get_failure_store, GIVEN_UP, TIMEOUT, CAPTCHA, NO_LISTING, SELECTOR_MISSING,
+                             ERROR)
+from ..resolver import AUTOSUGGEST_URL, HotelUrlCache, autosuggest_url, find_property_url, names_match
+
+# worker_id keeps a hotel's follow-up requests on the worker (browser context, proxy) that started it,
+# screenshot_sampled makes the screenshot sampling decision once per row; chunk_index is the work-queue
+# chunk (WORK_QUEUE mode, batch_index is None there)
+ROW_META_KEYS = ("hotel_query", "city", "true_address", "row_index", "batch_index", "chunk_index", "dont_retry",
+                 "worker_id", "screenshot_sampled")
 
 class AgodaSearchSpider(scrapy.Spider):
     name = "agoda_search_browser"
@@ -9,15 +31,144 @@ class AgodaSearchSpider(scrapy.Spider):
         "RETRY_TIMES": 0 # adjust this for production mode
     }
 
-    def open_spider(self, spider):
-        self.failed_hotels = open("failed_hotels.csv", "w", newline='', encoding="utf-8")
-        self.failed_writer = csv.writer(self.failed_hotels)
-        self.failed_writer.writerow(["hotel_name", "reason"])
+    def closed(self, reason):
+        for checkpoint in getattr(self, "checkpoints", {}).values():
+            checkpoint.close()
+        if hasattr(self, "url_cache"):
+            self.url_cache.close()
+        if hasattr(self, "failures"):
+            self.failures.close()
+        if getattr(self, "work_queue", None):
+            # Hand unfinished chunks straight back to the other nodes instead of waiting for the lease to expire.
+            # Returned Deferred: the engine waits for the queue thread to finish before shutting down
+            released = self.work_queue.release(self.leased_chunks)
+            released.addErrback(self.queue_error, "release")
+            released.addBoth(lambda _: self.work_queue.close())
+            return released
+
+    def mark_row_done(self, response, outcome="found"):
+        self.complete_row(response.meta.get("row_index"), response.meta.get("batch_index"), outcome)
+
+    def complete_row(self, row_index, batch_index, outcome):
+        # Record the input row as finished so a restarted batch (or another node) skips it
+        checkpoint = getattr(self, "checkpoints", {}).get(batch_index)
+        if checkpoint:
+            checkpoint.mark_done(row_index)
+        self.record_queue_outcome(row_index, outcome)
+        self.finish_row()
+
+    def record_queue_outcome(self, row_index, outcome):
+        # Fire and forget: the queue thread runs calls in order, so the chunk-end check sees this row
+        if getattr(self, "work_queue", None) and row_index is not None:
+            self.work_queue.complete_row(row_index, outcome).addErrback(self.queue_error, "complete_row")
+
+    def queue_error(self, failure, call):
+        self.crawler.stats.inc_value("work_queue/errors")
+        self.logger.error(f"[QUEUE] {call} failed: {failure.getErrorMessage()}")
+
+    def storage_acknowledged(self):
+        # HotelDataPipeline reports rows back once they're committed (rows_stored / rows_not_stored)
+        return getattr(self.crawler, "agoda_storage_acks", False)
+
+    def rows_stored(self, rows):
+        """Called on the reactor thread by the DB writer: [(row_index, batch_index)] committed to Postgres."""
+        for row_index, batch_index in rows:
+            self.rows_in_pipeline = max(self.rows_in_pipeline - 1, 0)
+            self.complete_row(row_index, batch_index, "stored")
+
+    def rows_not_stored(self, count):
+        # Dead-lettered / dropped items: the row is over for this run but stays un-checkpointed, so it's redone
+        for _ in range(count):
+            self.rows_in_pipeline = max(self.rows_in_pipeline - 1, 0)
+            self.finish_row()
+
+    def item_lost(self, item, response, spider, **kwargs):
+        if self.storage_acknowledged() and item.get("row_index") is not None:
+            self.rows_not_stored(1)
+
+    def finish_row(self):
+        # One input row has reached a final outcome (item, not found or failure)
+        self.pending_rows = max(getattr(self, "pending_rows", 0) - 1, 0)
+
+    def batch_indices(self):
+        # `-a batch_start=0 -a batch_end=254` (or agoda.batch_runner) runs a range in one process,
+        # otherwise fall back to the single BATCH_INDEX from settings/.env
+        if getattr(self, "batch_start", None) is not None:
+            return range(int(self.batch_start), int(getattr(self, "batch_end", self.batch_start)) + 1)
+        return [self.settings.getint("BATCH_INDEX", 0)]
+
+    def engine_is_idle(self):
+        engine = self.crawler.engine
+        slot = getattr(engine, "_slot", None) or engine.slot  # renamed across Scrapy versions
+        return (not engine.downloader.active
+                and not slot.scheduler.has_pending_requests()
+                and engine.scraper.slot.is_idle())
+
+    async def wait_for_batch(self, heartbeat=None):
+        """Hold back the next batch until every row of the current one reached an outcome (stored rows: committed)."""
+        idle_polls = 0
+        while self.pending_rows > 0:
+            await asyncio.sleep(1)
+            if heartbeat:
+                heartbeat()
+            # Safety net: a row lost without reaching a callback/errback must not stall the job forever.
+            # Rows waiting in the DB writer get a minute for its flush interval and reconnect retries
+            idle_limit = 60 if self.rows_in_pipeline else 3
+            idle_polls = idle_polls + 1 if self.engine_is_idle() else 0
+            if idle_polls >= idle_limit:
+                self.logger.warning(f"[BATCH] Engine idle with {self.pending_rows} rows unaccounted for — moving on")
+                self.pending_rows = 0
+                self.rows_in_pipeline = 0
+
+    async def init_page(self, page, request):
+        # Page coroutines (resource blocking, stealth) from PLAYWRIGHT_PAGE_COROUTINES
+        if not hasattr(self, "page_coroutines"):
+            self.page_coroutines = PageCoroutineRunner(self.crawler)
+        await self.page_coroutines(page, request)
+
+        # Page load time on its own (homepage / hotel page), separate from the steps that follow it
+        opened = time.monotonic()
+
+        def record_load_time(_):
+            request.meta["page_load_seconds"] = time.monotonic() - opened
+
+        page.once("load", record_load_time)
+
+    def record_step_timings(self, meta):
+        # Turn the search/hotel page per-step timings into stats, to see where per-hotel latency goes
+        stats = self.crawler.stats
+        for name, timing in meta.get("step_timings", {}).items():
+            stats.inc_value(f"page_steps/{name}/count")
+            stats.inc_value(f"page_steps/{name}/ms_total", timing["ms"])
+            stats.max_value(f"page_steps/{name}/ms_max", timing["ms"])
+            if timing["fallback"]:
+                stats.inc_value(f"page_steps/{name}/fallback")
+            self.metrics.observe(f"step/{name}", timing["ms"] / 1000)
+        if "page_load_seconds" in meta:
+            load_stage = "homepage_load" if meta.get("page_type") == "search" else "hotel_page_load"
+            self.metrics.observe(load_stage, meta["page_load_seconds"])
+
+    def record_outcome(self, meta, outcome):
+        # A page still blocked after every CAPTCHA retry counts as CAPTCHA'd, whatever the parse made of it
+        if meta.get("block_verdict") not in (None, "ok"):
+            outcome = "captcha"
+        self.metrics.hotel(outcome)
+        return outcome
+
+    def record_failure(self, meta, reason, detail=None):
+        # Persistent, per input row: `-a mode=retry-failed` re-runs only these (agoda/failure_store.py)
+        status = self.failures.record(meta.get("row_index"), reason, meta.get("hotel_query"), detail)
+        self.crawler.stats.inc_value(f"failures/{reason}")
+        if status == GIVEN_UP:
+            self.logger.warning(f"[FAILURE] Giving up on hotel: {meta.get('hotel_query')} ({reason}, attempt limit reached)")
+        return status
+
+    @staticmethod
+    def failure_reason(failure):
+        if failure.check(PlaywrightTimeoutError, TwistedTimeoutError, TimeoutError):
+            return TIMEOUT
+        return ERROR
 
-    def close_spider(self, spider):
-        if hasattr(self, "failed_hotels"):
-            self.failed_hotels.close()
-            
     def log_stealth_debug(self, response, label="STEALTH DEBUG"):
         # to verify stealth was applied correctly (in test mode only)
         if self.settings.getbool("TEST_MODE"):
@@ -27,126 +178,408 @@ class AgodaSearchSpider(scrapy.Spider):
 
     async def start(self):
         input_file = self.settings.get("HOTELS_FILE")
-        batch_index = self.settings.getint("BATCH_INDEX", 0)
         batch_size = self.settings.getint("BATCH_SIZE", 1000)
+        log_dir = self.settings.get("BATCH_LOG_DIR")
 
-        with open(input_file, newline='', encoding="utf-8") as f:
-            reader = list(csv.DictReader(f, delimiter=","))
+        # Stream only this batch's rows: the reader seeks via a byte-offset index built once per CSV version
+        reader = HotelInputReader(input_file, self.settings.getint("HOTELS_INDEX_STRIDE", 100))
+        recorder = BatchRecorder(self.crawler, log_dir) if log_dir else None
+        self.checkpoints = {}
+        self.pending_rows = 0
+        self.rows_in_pipeline = 0  # rows whose item is waiting for the DB commit
+        self.crawler.signals.connect(self.item_lost, signal=signals.item_dropped)
+        self.crawler.signals.connect(self.item_lost, signal=signals.item_error)
+        self.screenshots = ScreenshotPolicy.from_crawler(self.crawler)
+        # Same rules as the middleware, run on the live page so a block page gets its screenshot
+        self.block_detector = BlockDetector.from_file(self.settings.get("BLOCK_RULES_FILE", "block_rules.json"))
+        self.extractor = get_extractor(self.settings.get("HOTEL_EXTRACTOR", "lxml"))
+        self.url_cache = HotelUrlCache(self.settings.get("RESOLUTION_CACHE_PATH", "output/resolution_cache.sqlite"))
+        self.metrics = get_metrics(self.crawler)
+        self.failures = get_failure_store(self.crawler)
+
+        if getattr(self, "mode", None) == "retry-failed":
+            async for request in self.start_retry_failed(reader):
+                yield request
+            return
+
+        if self.settings.get("WORK_QUEUE"):
+            async for request in self.start_from_queue(reader):
+                yield request
+            return
+
+        for batch_index in self.batch_indices():
+            if recorder:
+                recorder.begin(batch_index)
+            checkpoint = BatchCheckpoint(self.settings.get("CHECKPOINT_DIR", "output/checkpoints"), batch_index)
+            self.checkpoints[batch_index] = checkpoint
             start = batch_index * batch_size
             end = start + batch_size
-            
+
             # Log the batch range
             self.logger.info(f"Running batch {batch_index} — rows {start} to {end}")
-            
-            hotels = reader[start:end]
-            for row in hotels:
-                hotel_name = row["hotel_name"]
-                true_address = row["address"]
-                city = row["city_name"]
-                search_prompt = f'{hotel_name}, {city}'
-
-                yield scrapy.Request(
-                    url="https://www.agoda.com/",
-                    meta={
-                        "playwright": True,
-                        "playwright_page_methods": [
-                            # Dismiss cookie banner if present
-                            PageMethod(
-                                "evaluate",
-                                """() => {
-                                    const btn = document.querySelector("button[data-element-name='consent-banner-reject-btn']");
-                                    if (btn) btn.click();
-                                }"""
-                            ), 
-                            PageMethod("wait_for_timeout", 1000),
-                            PageMethod("screenshot", path=f"screenshots/{hotel_name}_1cookie.png"),
-                            
-                            # enter search prompt(format: hotel name, city) into search input box
-                            PageMethod("fill", "input[data-selenium='textInput']", search_prompt),
-                            PageMethod("wait_for_timeout", 1000),
-                            PageMethod("screenshot", path=f"screenshots/{hotel_name}_2inputPrompt.png"),
-                            
-                            # click the first listing from auto suggestion box
-                            PageMethod("click", 'li[data-selenium="topDestinationListItem"] >> nth=0'),
-                            PageMethod("wait_for_timeout", 1000),
-                            PageMethod("screenshot", path=f"screenshots/{hotel_name}_3suggestBox.png"),
-                            
-                            # click search button
-                            PageMethod("click","button[data-selenium='searchButton']"),
-                            PageMethod("wait_for_timeout", 3000),
-                            PageMethod("screenshot", path=f"screenshots/{hotel_name}_4searchButton.png"),
-                            
-                        ],
-                        "hotel_query": hotel_name,
-                        "true_address": true_address,
-                        "dont_retry": False
-                    },
-                    callback=self.parse_search_results,
-                    errback=self.errback_search
-                )
+            if checkpoint.completed:
+                self.logger.info(f"[CHECKPOINT] Resuming batch {batch_index} — skipping {len(checkpoint.completed)} completed rows")
+
+            rows_scheduled = 0
+            for row_index, row in reader.iter_batch(batch_index, batch_size, skip=checkpoint.completed):
+                self.pending_rows += 1
+                rows_scheduled += 1
+                yield self.resolve_request(row_index, row, batch_index)
+
+            await self.wait_for_batch()
+            self.logger.info(f"Finished batch {batch_index} — {rows_scheduled} rows scheduled")
+            if recorder:
+                recorder.end(batch_index, rows_scheduled)
+
+    async def start_retry_failed(self, reader):
+        """Re-run only the failed rows whose retry is due (`-a mode=retry-failed`)."""
+        due = self.failures.due()
+        self.logger.info(f"[RETRY] {len(due)} failed hotels due for retry — {self.failures.summary()}")
+        for row_index, row in reader.iter_indices(due):
+            self.pending_rows += 1
+            yield self.resolve_request(row_index, row, batch_index=None)
+        await self.wait_for_batch()
+        self.logger.info(f"[RETRY] Finished retry pass — {len(due)} rows scheduled")
+
+    async def start_from_queue(self, reader):
+        """Lease row chunks from the shared work queue until every chunk is done (WORK_QUEUE mode).
+
+        Any number of nodes can run this against the same queue; rows another node already finished
+        are skipped, and chunks of a node that died come back once their lease expires.
+        """
+        # Queue round trips run on the queue's own thread, never on the reactor
+        work_queue = ThreadedWorkQueue(lambda: open_work_queue(self.settings))
+        self.work_queue = work_queue
+        self.leased_chunks = set()
+        self.leases_renewed_at = time.monotonic()
+        self.renewing = False
+        await maybe_deferred_to_future(work_queue.opened)
+        chunk_size = self.settings.getint("WORK_QUEUE_CHUNK_SIZE", 25)
+        await maybe_deferred_to_future(work_queue.seed(reader.row_count, chunk_size))
+        poll_interval = self.settings.getfloat("WORK_QUEUE_POLL_INTERVAL", 30)
+        self.logger.info(f"[QUEUE] Node {self.work_queue.node_id} working on queue '{self.work_queue.queue_name}'")
+
+        while True:
+            chunks = await maybe_deferred_to_future(work_queue.lease(1))
+            if not chunks:
+                remaining = await maybe_deferred_to_future(work_queue.remaining())
+                if not remaining:
+                    break
+                # Everything left is leased by other nodes (their chunks come back here if a lease expires) or
+                # was released to wait out its failed rows' retry backoff
+                self.logger.info(f"[QUEUE] {remaining} chunks leased elsewhere or backing off "
+                                 f"— polling again in {poll_interval:.0f}s")
+                await asyncio.sleep(poll_interval)
+                continue
+
+            for chunk_index, row_start, row_end in chunks:
+                self.leased_chunks.add(chunk_index)
+                completed = await maybe_deferred_to_future(work_queue.completed_rows(row_start, row_end))
+                # Failed rows still inside their FAILURE_RETRY_POLICY backoff wait for a later lease
+                backing_off = self.failures.pending_retries(row_start, row_end)
+                rows_scheduled = 0
+                for row_index, row in reader.iter_rows(row_start, row_end, skip=completed | backing_off.keys()):
+                    self.pending_rows += 1
+                    rows_scheduled += 1
+                    yield self.resolve_request(row_index, row, batch_index=None, chunk_index=chunk_index)
+
+                await self.wait_for_batch(heartbeat=self.renew_leases)
+                # Done only if every row has a recorded outcome; rows that failed (and may still be retried),
+                # weren't stored or got lost send the chunk back to the queue for another attempt
+                completed = await maybe_deferred_to_future(work_queue.completed_rows(row_start, row_end))
+                missing = [i for i in range(row_start, row_end) if i not in completed]
+                if missing:
+                    delay = self.retry_delay(missing, self.failures.pending_retries(row_start, row_end))
+                    await maybe_deferred_to_future(work_queue.release([chunk_index], delay))
+                    self.crawler.stats.inc_value("work_queue/chunks_released")
+                    self.logger.warning(f"[QUEUE] Chunk {chunk_index} has {len(missing)} rows without an outcome "
+                                        f"— released for another attempt"
+                                        + (f" in {delay:.0f}s (retry backoff)" if delay else ""))
+                else:
+                    await maybe_deferred_to_future(work_queue.complete_chunk(chunk_index))
+                    self.logger.info(f"[QUEUE] Finished chunk {chunk_index} — rows {row_start} to {row_end}, "
+                                     f"{rows_scheduled} scheduled")
+                self.leased_chunks.discard(chunk_index)
+
+    @staticmethod
+    def retry_delay(missing, backing_off):
+        """Seconds before a released chunk is worth leasing again: none if one of its missing rows can run
+        now (lost / not stored), else until the first failed row's backoff is over."""
+        if any(row_index not in backing_off for row_index in missing):
+            return 0
+        return max(min(backing_off[row_index] for row_index in missing) - time.time(), 0)
+
+    def renew_leases(self):
+        # Heartbeat a few times per lease period, so a live node never loses its chunk to another one
+        lease_seconds = self.work_queue.lease_seconds
+        if self.renewing or time.monotonic() - self.leases_renewed_at < lease_seconds / 3:
+            return
+        self.renewing = True
+        asked = set(self.leased_chunks)
+
+        def renewed(held):
+            for chunk_index in asked - held:
+                self.logger.warning(f"[QUEUE] Lease on chunk {chunk_index} was lost — another node may re-run it")
+            self.leases_renewed_at = time.monotonic()
+
+        def done(_):
+            self.renewing = False
+
+        deferred = self.work_queue.renew(asked)
+        deferred.addCallbacks(renewed, self.queue_error, errbackArgs=("renew",))
+        deferred.addBoth(done)
+
+    def row_meta(self, row_index, row, batch_index, chunk_index=None):
+        # Per-hotel fields every request in the chain carries along
+        return {
+            "hotel_query": row["hotel_name"],
+            "city": row["city_name"],
+            "true_address": row["address"],
+            "row_index": row_index,
+            "batch_index": batch_index,
+            "chunk_index": chunk_index,
+            "dont_retry": False,
+            "screenshot_sampled": self.screenshots.sample(),
+        }
+
+    @staticmethod
+    def carry_meta(meta):
+        return {key: meta.get(key) for key in ROW_META_KEYS}
+
+    def resolve_request(self, row_index, row, batch_index, chunk_index=None):
+        """Skip the search UI when the property URL is already known (cache) or can be looked up over plain HTTP."""
+        meta = self.row_meta(row_index, row, batch_index, chunk_index)
+        if not self.settings.getbool("RESOLVER_ENABLED", True):
+            return self.search_request(meta)
+
+        cached_url = self.url_cache.get(meta["hotel_query"], meta["city"])
+        if cached_url:
+            self.crawler.stats.inc_value("resolver/cache_hit")
+            return self.hotel_request(cached_url, meta, resolved_via="cache")
+
+        return scrapy.Request(
+            url=autosuggest_url(self.settings.get("AUTOSUGGEST_URL", AUTOSUGGEST_URL), meta["hotel_query"], meta["city"]),
+            meta={**meta, "playwright": False},  # plain HTTP, no browser page
+            callback=self.parse_autosuggest,
+            errback=self.errback_autosuggest,
+            dont_filter=True
+        )
+
+    def parse_autosuggest(self, response):
+        try:
+            property_url = find_property_url(response.json())
+        except (AttributeError, ValueError):
+            property_url = None  # not a text response / not JSON (blocked, endpoint changed) → browser search
+
+        if not property_url:
+            self.crawler.stats.inc_value("resolver/autosuggest_miss")
+            return self.search_request(response.meta)
+
+        self.crawler.stats.inc_value("resolver/autosuggest_hit")
+        return self.hotel_request(response.urljoin(property_url), response.meta, resolved_via="autosuggest")
+
+    def errback_autosuggest(self, failure):
+        self.crawler.stats.inc_value("resolver/autosuggest_error")
+        return self.search_request(failure.request.meta)
+
+    def search_request(self, meta):
+        """Full browser search flow (homepage → autosuggest box → results), used when resolution misses."""
+        self.crawler.stats.inc_value("resolver/browser_search")
+        hotel_name = meta["hotel_query"]
+        search_prompt = f'{hotel_name}, {meta["city"]}'
+        step_timings = {}
+
+        return scrapy.Request(
+            url=self.settings.get("AGODA_BASE_URL", "https://www.agoda.com/"),
+            meta={
+                **self.carry_meta(meta),
+                "playwright": True,
+                "playwright_page_init_callback": self.init_page,
+                "page_type": "search",
+                # Event-driven steps (no fixed sleeps); per-step durations land in step_timings → stats
+                "playwright_page_methods": search_page_methods(
+                    search_prompt, step_timings, self.settings,
+                    screenshots=self.screenshots.for_hotel(hotel_name, meta.get("screenshot_sampled", False)),
+                    block_detector=self.block_detector,
+                ),
+                "step_timings": step_timings,
+            },
+            callback=self.parse_search_results,
+            errback=self.errback_search,
+            dont_filter=True
+        )
+
+    def hotel_request(self, url, meta, resolved_via):
+        """Hotel detail page: plain HTTP first (HTTP_FIRST_ENABLED), the browser only when that isn't enough."""
+        if self.settings.getbool("HTTP_FIRST_ENABLED", True):
+            return self.hotel_http_request(url, meta, resolved_via)
+        return self.hotel_browser_request(url, meta, resolved_via)
+
+    def hotel_http_request(self, url, meta, resolved_via):
+        # Same proxy, UA and chrome_headers.json profile as browser requests (ProxyUserAgentAndCaptchaMiddleware)
+        return scrapy.Request(
+            url,
+            meta={
+                **self.carry_meta(meta),
+                "playwright": False,
+                "page_type": "hotel_http",
+                "resolved_via": resolved_via,
+            },
+            callback=self.parse_hotel_http,
+            errback=self.errback_hotel_http,
+            dont_filter=True
+        )
+
+    def hotel_browser_request(self, url, meta, resolved_via):
+        step_timings = {}
+        return scrapy.Request(
+            url,
+            meta={
+                **self.carry_meta(meta),
+                "playwright": True,
+                "playwright_page_init_callback": self.init_page,
+                "page_type": "hotel",
+                "playwright_page_methods": hotel_page_methods(
+                    step_timings, self.settings,
+                    screenshots=self.screenshots.for_hotel(meta["hotel_query"], meta.get("screenshot_sampled", False)),
+                    block_detector=self.block_detector,
+                ),
+                "step_timings": step_timings,
+                "resolved_via": resolved_via,
+            },
+            callback=self.parse_hotel_page,
+            errback=self.errback_search
+        )
 
     def errback_search(self, failure):
-        hotel_query = failure.request.meta.get("hotel_query", "UNKNOWN")
+        meta = failure.request.meta
+        hotel_query = meta.get("hotel_query", "UNKNOWN")
+        self.record_step_timings(meta)
+
+        # A cached/looked-up URL that fails may be stale: forget it and fall back to the browser search
+        if meta.get("resolved_via") in ("cache", "autosuggest"):
+            self.logger.warning(f"[RESOLVER] Direct URL failed for hotel: {hotel_query} — falling back to search")
+            self.url_cache.invalidate(hotel_query, meta.get("city"))
+            return self.search_request(meta)
+
         self.logger.warning(f"[ERRBACK] Request failed for hotel: {hotel_query}")
-        if hasattr(self, "failed_writer"):
-            self.failed_writer.writerow([hotel_query, "Request failed or timeout"])
+        reason = self.failure_reason(failure)
+        if self.record_failure(meta, reason, detail=repr(failure.value)) == GIVEN_UP:
+            # Out of attempts: an outcome, so its queue chunk can be done; otherwise the chunk is re-leased
+            self.record_queue_outcome(meta.get("row_index"), f"{GIVEN_UP}/{reason}")
+        self.metrics.hotel("failed")
+        self.finish_row()
 
     async def parse_search_results(self, response):
         self.log_stealth_debug(response, label="STEALTH DEBUG [SEARCH]")
+        self.record_step_timings(response.meta)
                 
         hotel_query = response.meta["hotel_query"]
         first_result = response.css("li.PropertyCard a::attr(href)").get()
         if not first_result:
             self.logger.warning(f"[NOT FOUND] No listing found for hotel: {hotel_query}")
-            self.failed_writer.writerow([hotel_query, "No listing found"])
+            outcome = self.record_outcome(response.meta, "not_found")
+            self.record_failure(response.meta, CAPTCHA if outcome == "captcha" else NO_LISTING)
+            self.mark_row_done(response, outcome=outcome)
             return
 
-        yield response.follow(
-            response.urljoin(first_result),
-            meta={
-                "playwright": True,
-                "playwright_page_methods": [
-                    PageMethod("wait_for_selector", "img"),  # wait for initial page load
-                    PageMethod("click", 'button[data-element-name="hotel-mosaic-see-all-photos"]'),
-                    # PageMethod("wait_for_timeout", 2000),  # waits 2 seconds
-                    PageMethod("wait_for_selector", "img"),  # wait again for images to load after click
-                ],
-                "hotel_query": hotel_query,
-                "true_address": response.meta.get("true_address"),
-                "dont_retry": False
-            },
-            callback=self.parse_hotel_page,
-            errback=self.errback_search
-        )
+        yield self.hotel_request(response.urljoin(first_result), response.meta, resolved_via="search")
+
+    def http_fallback(self, meta, url, reason):
+        # Plain HTTP wasn't enough for this hotel: render it in the browser
+        stats = self.crawler.stats
+        stats.inc_value("http_first/fallback")
+        stats.inc_value(f"http_first/fallback/{reason}")
+        stats.set_value("http_first/fallback_rate",
+                        round(stats.get_value("http_first/fallback") / stats.get_value("http_first/attempts"), 4))
+        return self.hotel_browser_request(url, meta, meta.get("resolved_via"))
+
+    def parse_hotel_http(self, response):
+        stats = self.crawler.stats
+        stats.inc_value("http_first/attempts")
+        if response.meta.get("block_verdict") not in (None, "ok"):
+            return self.http_fallback(response.meta, response.url, "blocked")
+
+        # Server-rendered DOM first, embedded JSON (JSON-LD / app state) fills the gaps
+        started = time.monotonic()
+        data = merge_results(self.extractor.extract(response.body, response.url),
+                             extract_embedded_state(response.body, response.url))
+        self.metrics.observe("extraction_http", time.monotonic() - started)
+
+        required = self.settings.getlist("HTTP_FIRST_REQUIRED_FIELDS", ["name", "address", "image_urls"])
+        missing = [field for field in required if not data.get(field)]
+        # The gallery holds more photos than the static page shows; too few means the browser must open it
+        if len(data["image_urls"]) < self.settings.getint("HTTP_FIRST_MIN_IMAGES", 5):
+            missing.append("image_urls")
+        if missing:
+            for field in set(missing):
+                stats.inc_value(f"http_first/missing/{field}")
+            return self.http_fallback(response.meta, response.url, "missing_fields")
+
+        stats.inc_value("http_first/success")
+        stats.set_value("http_first/fallback_rate",
+                        round(stats.get_value("http_first/fallback", 0) / stats.get_value("http_first/attempts"), 4))
+        return self.hotel_item(response, data)
+
+    def errback_hotel_http(self, failure):
+        self.crawler.stats.inc_value("http_first/attempts")
+        return self.http_fallback(failure.request.meta, failure.request.url, "error")
 
     async def parse_hotel_page(self, response): 
         self.log_stealth_debug(response, label="STEALTH DEBUG [HOTEL PAGE]")
-                   
+        self.record_step_timings(response.meta)
+
+        # One DOM parse, precompiled selectors, largest srcset candidate per image (agoda/extractors.py)
+        started = time.monotonic()
+        data = self.extractor.extract(response.body, response.url)
+        self.metrics.observe("extraction", time.monotonic() - started)
+
+        item = self.hotel_item(response, data)
+        if item:
+            yield item
+
+    def hotel_item(self, response, data):
+        """Turn extracted fields into a HotelItem and settle the row's outcome (None when there's nothing to store)."""
         hotel_query = response.meta["hotel_query"]
         known_address = response.meta["true_address"]
 
         item = HotelItem()
         item["name_original"] = hotel_query
-        item["name_agoda"] = response.css("h1[data-selenium='hotel-header-name']::text").get()
+        item["name_agoda"] = data["name"]
         item["url"] = response.url
         item["location_original"] = known_address
-        item["location_agoda"] = response.css("span[data-selenium='hotel-address-map']::text").get()
-        item["description"] = response.css("span[data-element-name='property-short-description']::text").get().strip()
-        item["facilities"] = response.css("div[data-element-name='atf-top-amenities-item'] p::text").getall()
-
-        # image url extraction
-        image_sources = (
-            "pix8.agoda.net/hotelImages",
-            "pix8.agoda.net/property",
-            "bstatic.com/xdata/images/hotel/"
-        )
-        image_urls = []
-        for img in response.css("img"):
-            srcset = img.attrib.get("srcset")
-            if srcset and any(src in srcset for src in image_sources):
-                largest = srcset.split(",")[-1].strip().split(" ")[0]
-                full_url = response.urljoin(largest)
-                image_urls.append(full_url)
-        item["image_urls"] = image_urls
-        
-        yield item
\ No newline at end of file
+        item["location_agoda"] = data["address"]
+        item["description"] = data["description"]
+        item["facilities"] = data["facilities"]
+        item["image_urls"] = data["image_urls"]
+        item["row_index"] = response.meta.get("row_index")
+        item["batch_index"] = response.meta.get("batch_index")
+
+        # Next run resolves this hotel straight from the cache: one page load instead of two. Only when the page
+        # is the hotel asked for: a wrong autosuggest/search pick must not be reused on every later run
+        if item["name_agoda"]:
+            if names_match(hotel_query, item["name_agoda"]):
+                self.url_cache.put(hotel_query, response.meta.get("city"), response.url,
+                                   response.meta.get("resolved_via"))
+            else:
+                self.crawler.stats.inc_value("resolver/name_mismatch")
+                if response.meta.get("resolved_via") == "cache":
+                    self.url_cache.invalidate(hotel_query, response.meta.get("city"))
+
+        outcome = self.record_outcome(response.meta, "found")
+        if outcome == "captcha":
+            # Still blocked after every retry: the page is a CAPTCHA, not the hotel, so nothing to store
+            self.record_failure(response.meta, CAPTCHA)
+            self.mark_row_done(response, outcome=outcome)
+            return None
+        if item["name_agoda"]:
+            self.failures.resolve(response.meta.get("row_index"))
+        else:
+            self.record_failure(response.meta, SELECTOR_MISSING, detail=response.url)
+
+        if self.storage_acknowledged():
+            # Checkpointed once the DB writer committed it, not now: a crash must not skip an unsaved row
+            self.rows_in_pipeline += 1
+        else:
+            self.mark_row_done(response)
+        return item
\ No newline at end of file
@@ -0,0 +1,381 @@
+"""Shared work queue for running the crawl on several nodes at once (WORK_QUEUE setting).
+
+The input CSV is split into small chunks of rows. Nodes lease chunks with a visibility timeout; a lease
+that isn't renewed (node died) expires and the chunk goes back to the queue. Every finished row gets a
+completion record, so a re-leased chunk only re-runs rows nobody finished and no hotel is scraped twice.
+A chunk released with a delay (its failed rows are backing off) keeps `lease_expires_at` as the time
+before which no node leases it again.
+
+Backends share one interface:
+  PostgresWorkQueue  shared by all nodes (SELECT ... FOR UPDATE SKIP LOCKED)
+  SQLiteWorkQueue    local stand-in, several processes on one machine / tests
+
+The spider talks to them through ThreadedWorkQueue: every call runs on one dedicated thread and returns
+a Deferred, so queue round trips never block the reactor.
+"""
+import os
+import time
+import socket
+import sqlite3
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+
+
+def default_node_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class PostgresWorkQueue:
+    def __init__(self, connect, queue_name, node_id, lease_seconds=600):
+        import psycopg2
+        self.connection_errors = (psycopg2.OperationalError, psycopg2.InterfaceError)
+        self.connect = connect
+        self.connection = self.open_connection()
+        self.queue_name = queue_name
+        self.node_id = node_id
+        self.lease_seconds = lease_seconds
+        self.create_tables()
+
+    def open_connection(self):
+        connection = self.connect()
+        connection.autocommit = True  # every call is its own short transaction
+        return connection
+
+    def reconnect(self):
+        try:
+            self.connection.close()
+        except Exception:
+            pass  # already gone
+        self.connection = self.open_connection()
+
+    def execute(self, statement, params=None, fetch=None):
+        """Run one statement; a dropped connection is reopened and the statement retried once.
+
+        Every statement is idempotent or lease-guarded, so a retry after a commit whose reply was lost
+        is harmless (at worst a chunk stays leased by us until its lease expires).
+        """
+        for attempt in (1, 2):
+            try:
+                with self.connection.cursor() as cursor:
+                    cursor.execute(statement, params)
+                    if fetch == "all":
+                        return cursor.fetchall()
+                    if fetch == "one":
+                        return cursor.fetchone()
+                    return None
+            except self.connection_errors:
+                if attempt == 2:
+                    raise
+                self.reconnect()
+
+    def create_tables(self):
+        self.execute("""
+            CREATE TABLE IF NOT EXISTS crawl_queue (
+                queue TEXT NOT NULL,
+                chunk_index INT NOT NULL,
+                row_start INT NOT NULL,
+                row_end INT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                lease_owner TEXT,
+                lease_expires_at TIMESTAMPTZ,
+                attempts INT NOT NULL DEFAULT 0,
+                completed_at TIMESTAMPTZ,
+                PRIMARY KEY (queue, chunk_index)
+            );
+            CREATE TABLE IF NOT EXISTS crawl_queue_rows (
+                queue TEXT NOT NULL,
+                row_index INT NOT NULL,
+                node TEXT,
+                outcome TEXT,
+                completed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                PRIMARY KEY (queue, row_index)
+            );
+        """)
+
+    def seed(self, row_count, chunk_size):
+        """Create the chunks once; every node may call this, existing chunks are left alone."""
+        self.execute("""
+            INSERT INTO crawl_queue (queue, chunk_index, row_start, row_end)
+            SELECT %(queue)s, i, i * %(size)s, LEAST((i + 1) * %(size)s, %(rows)s)
+            FROM generate_series(0, CEIL(%(rows)s::numeric / %(size)s)::int - 1) AS i
+            ON CONFLICT DO NOTHING;
+        """, {"queue": self.queue_name, "size": chunk_size, "rows": row_count})
+
+    def lease(self, limit=1):
+        """Lease up to `limit` pending (or expired) chunks → [(chunk_index, row_start, row_end)]."""
+        # SKIP LOCKED: concurrent nodes never wait on, or get, the same chunk
+        return sorted(self.execute("""
+            UPDATE crawl_queue q
+            SET status = 'leased', lease_owner = %(node)s, attempts = q.attempts + 1,
+                lease_expires_at = now() + make_interval(secs => %(lease)s)
+            FROM (
+                SELECT chunk_index FROM crawl_queue
+                WHERE queue = %(queue)s
+                  AND ((status = 'pending' AND (lease_expires_at IS NULL OR lease_expires_at < now()))
+                       OR (status = 'leased' AND lease_expires_at < now()))
+                ORDER BY chunk_index
+                LIMIT %(limit)s
+                FOR UPDATE SKIP LOCKED
+            ) free
+            WHERE q.queue = %(queue)s AND q.chunk_index = free.chunk_index
+            RETURNING q.chunk_index, q.row_start, q.row_end;
+        """, {"queue": self.queue_name, "node": self.node_id, "lease": self.lease_seconds, "limit": limit},
+            fetch="all"))
+
+    def renew(self, chunk_indices):
+        """Extend our leases (heartbeat); returns the chunks we still hold."""
+        rows = self.execute("""
+            UPDATE crawl_queue SET lease_expires_at = now() + make_interval(secs => %(lease)s)
+            WHERE queue = %(queue)s AND chunk_index = ANY(%(chunks)s)
+              AND status = 'leased' AND lease_owner = %(node)s
+            RETURNING chunk_index;
+        """, {"queue": self.queue_name, "node": self.node_id, "lease": self.lease_seconds,
+              "chunks": list(chunk_indices)}, fetch="all")
+        return {row[0] for row in rows}
+
+    def completed_rows(self, row_start, row_end):
+        rows = self.execute(
+            "SELECT row_index FROM crawl_queue_rows WHERE queue = %s AND row_index >= %s AND row_index < %s;",
+            (self.queue_name, row_start, row_end), fetch="all",
+        )
+        return {row[0] for row in rows}
+
+    def complete_row(self, row_index, outcome):
+        self.execute("""
+            INSERT INTO crawl_queue_rows (queue, row_index, node, outcome) VALUES (%s, %s, %s, %s)
+            ON CONFLICT DO NOTHING;
+        """, (self.queue_name, row_index, self.node_id, outcome))
+
+    def complete_chunk(self, chunk_index):
+        self.execute("""
+            UPDATE crawl_queue SET status = 'done', completed_at = now(), lease_expires_at = NULL
+            WHERE queue = %s AND chunk_index = %s AND lease_owner = %s;
+        """, (self.queue_name, chunk_index, self.node_id))
+
+    def release(self, chunk_indices, delay=0):
+        """Hand unfinished chunks back instead of waiting for the lease to expire: right away (clean
+        shutdown), or leasable again only after `delay` seconds (failed rows waiting out a retry backoff)."""
+        self.execute("""
+            UPDATE crawl_queue SET status = 'pending', lease_owner = NULL,
+                lease_expires_at = CASE WHEN %(delay)s > 0 THEN now() + make_interval(secs => %(delay)s) END
+            WHERE queue = %(queue)s AND chunk_index = ANY(%(chunks)s) AND status = 'leased' AND lease_owner = %(node)s;
+        """, {"queue": self.queue_name, "chunks": list(chunk_indices), "node": self.node_id, "delay": delay})
+
+    def remaining(self):
+        """Chunks not done yet (pending or leased by any node)."""
+        return self.execute("SELECT count(*) FROM crawl_queue WHERE queue = %s AND status != 'done';",
+                            (self.queue_name,), fetch="one")[0]
+
+    def close(self):
+        self.connection.close()
+
+
+class SQLiteWorkQueue:
+    """Same semantics on a local SQLite file: BEGIN IMMEDIATE serialises lessors across processes."""
+
+    def __init__(self, path, queue_name, node_id, lease_seconds=600):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Opened on the reactor thread, then only ever used from ThreadedWorkQueue's one thread
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.queue_name = queue_name
+        self.node_id = node_id
+        self.lease_seconds = lease_seconds
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS crawl_queue (
+                queue TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                row_start INTEGER NOT NULL,
+                row_end INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                lease_owner TEXT,
+                lease_expires_at REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                completed_at REAL,
+                PRIMARY KEY (queue, chunk_index)
+            );
+            CREATE TABLE IF NOT EXISTS crawl_queue_rows (
+                queue TEXT NOT NULL,
+                row_index INTEGER NOT NULL,
+                node TEXT,
+                outcome TEXT,
+                completed_at REAL NOT NULL,
+                PRIMARY KEY (queue, row_index)
+            );
+        """)
+
+    def seed(self, row_count, chunk_size):
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO crawl_queue (queue, chunk_index, row_start, row_end) VALUES (?, ?, ?, ?)",
+            ((self.queue_name, i, start, min(start + chunk_size, row_count))
+             for i, start in enumerate(range(0, row_count, chunk_size))),
+        )
+
+    def lease(self, limit=1):
+        now = time.time()
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            chunks = self.connection.execute("""
+                SELECT chunk_index, row_start, row_end FROM crawl_queue
+                WHERE queue = ? AND ((status = 'pending' AND (lease_expires_at IS NULL OR lease_expires_at < ?))
+                                     OR (status = 'leased' AND lease_expires_at < ?))
+                ORDER BY chunk_index LIMIT ?
+            """, (self.queue_name, now, now, limit)).fetchall()
+            self.connection.executemany("""
+                UPDATE crawl_queue SET status = 'leased', lease_owner = ?, lease_expires_at = ?, attempts = attempts + 1
+                WHERE queue = ? AND chunk_index = ?
+            """, [(self.node_id, now + self.lease_seconds, self.queue_name, c[0]) for c in chunks])
+            self.connection.execute("COMMIT")
+        except BaseException:
+            self.connection.execute("ROLLBACK")
+            raise
+        return chunks
+
+    def renew(self, chunk_indices):
+        held = set()
+        for chunk_index in chunk_indices:
+            cursor = self.connection.execute("""
+                UPDATE crawl_queue SET lease_expires_at = ?
+                WHERE queue = ? AND chunk_index = ? AND status = 'leased' AND lease_owner = ?
+            """, (time.time() + self.lease_seconds, self.queue_name, chunk_index, self.node_id))
+            if cursor.rowcount:
+                held.add(chunk_index)
+        return held
+
+    def completed_rows(self, row_start, row_end):
+        rows = self.connection.execute(
+            "SELECT row_index FROM crawl_queue_rows WHERE queue = ? AND row_index >= ? AND row_index < ?",
+            (self.queue_name, row_start, row_end),
+        )
+        return {row[0] for row in rows}
+
+    def complete_row(self, row_index, outcome):
+        self.connection.execute(
+            "INSERT OR IGNORE INTO crawl_queue_rows (queue, row_index, node, outcome, completed_at) VALUES (?, ?, ?, ?, ?)",
+            (self.queue_name, row_index, self.node_id, outcome, time.time()),
+        )
+
+    def complete_chunk(self, chunk_index):
+        self.connection.execute("""
+            UPDATE crawl_queue SET status = 'done', completed_at = ?, lease_expires_at = NULL
+            WHERE queue = ? AND chunk_index = ? AND lease_owner = ?
+        """, (time.time(), self.queue_name, chunk_index, self.node_id))
+
+    def release(self, chunk_indices, delay=0):
+        not_before = time.time() + delay if delay > 0 else None
+        for chunk_index in chunk_indices:
+            self.connection.execute("""
+                UPDATE crawl_queue SET status = 'pending', lease_owner = NULL, lease_expires_at = ?
+                WHERE queue = ? AND chunk_index = ? AND status = 'leased' AND lease_owner = ?
+            """, (not_before, self.queue_name, chunk_index, self.node_id))
+
+    def remaining(self):
+        return self.connection.execute(
+            "SELECT count(*) FROM crawl_queue WHERE queue = ? AND status != 'done'", (self.queue_name,)
+        ).fetchone()[0]
+
+    def close(self):
+        self.connection.close()
+
+
+def open_work_queue(settings):
+    """WORK_QUEUE = "postgres" (POSTGRES_* settings) or "sqlite:///path/to/queue.sqlite"."""
+    backend = settings.get("WORK_QUEUE")
+    queue_name = settings.get("WORK_QUEUE_NAME") or os.path.basename(settings.get("HOTELS_FILE", "hotels.csv"))
+    node_id = settings.get("WORK_QUEUE_NODE_ID") or default_node_id()
+    lease_seconds = settings.getint("WORK_QUEUE_LEASE_SECONDS", 600)
+
+    if backend == "postgres":
+        import psycopg2
+
+        def connect():
+            return psycopg2.connect(
+                host=settings.get("POSTGRES_HOST"),
+                database=settings.get("POSTGRES_DB"),
+                user=settings.get("POSTGRES_USER"),
+                password=settings.get("POSTGRES_PASSWORD"),
+            )
+
+        return PostgresWorkQueue(connect, queue_name, node_id, lease_seconds)
+    if backend.startswith("sqlite:///"):
+        return SQLiteWorkQueue(backend[len("sqlite:///"):], queue_name, node_id, lease_seconds)
+    raise ValueError(f"Unknown WORK_QUEUE backend: {backend!r} (expected 'postgres' or 'sqlite:///<path>')")
+
+
+class ThreadedWorkQueue:
+    """Runs a backend's calls on one dedicated thread; every method returns a Deferred.
+
+    One thread, so the backend's connection is never shared and calls run in the order they were made
+    (a fire-and-forget complete_row is always recorded before a later completed_rows reads it). The
+    backend itself is opened on that thread too: `open_backend` is e.g. `lambda: open_work_queue(settings)`.
+    """
+
+    def __init__(self, open_backend):
+        from twisted.python.threadpool import ThreadPool
+        self.backend = None
+        self.pool = ThreadPool(1, 1, name="work-queue")
+        self.pool.start()
+        self.opened = self.call(self.open, open_backend)
+
+    def open(self, open_backend):
+        self.backend = open_backend()
+        return self
+
+    def call(self, method, *args):
+        from twisted.internet import reactor, threads  # the reactor must already be installed by Scrapy
+        return threads.deferToThreadPool(reactor, self.pool, method, *args)
+
+    def run(self, name, *args):
+        # On the queue thread: the backend is looked up here, after open() has run
+        return getattr(self.backend, name)(*args)
+
+    @property
+    def node_id(self):
+        return self.backend.node_id
+
+    @property
+    def queue_name(self):
+        return self.backend.queue_name
+
+    @property
+    def lease_seconds(self):
+        return self.backend.lease_seconds
+
+    def seed(self, row_count, chunk_size):
+        return self.call(self.run, "seed", row_count, chunk_size)
+
+    def lease(self, limit=1):
+        return self.call(self.run, "lease", limit)
+
+    def renew(self, chunk_indices):
+        return self.call(self.run, "renew", set(chunk_indices))
+
+    def completed_rows(self, row_start, row_end):
+        return self.call(self.run, "completed_rows", row_start, row_end)
+
+    def complete_row(self, row_index, outcome):
+        return self.call(self.run, "complete_row", row_index, outcome)
+
+    def complete_chunk(self, chunk_index):
+        return self.call(self.run, "complete_chunk", chunk_index)
+
+    def release(self, chunk_indices, delay=0):
+        return self.call(self.run, "release", set(chunk_indices), delay)
+
+    def remaining(self):
+        return self.call(self.run, "remaining")
+
+    def close(self):
+        """Close the backend once every queued call has run, then stop the thread."""
+        deferred = self.call(self.close_backend)
+        deferred.addBoth(self.stop)
+        return deferred
+
+    def close_backend(self):
+        if self.backend is not None:
+            self.backend.close()
+
+    def stop(self, result):
+        self.pool.stop()
+        return result
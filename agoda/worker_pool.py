@@ -0,0 +1,43 @@
+class BrowserWorker:
+    """One isolated browser context: its own proxy, cookie state and request counter."""
+
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+        self.proxy = None
+        self.request_count = 0  # requests sent through the current proxy
+        self.in_flight = 0
+
+    @property
+    def download_slot(self):
+        # Separate Scrapy download slot per worker, so DOWNLOAD_DELAY applies per worker not globally
+        return f"worker-{self.worker_id}"
+
+    @property
+    def context_name(self):
+        # Base name only: a context is bound to one proxy for its whole life (Playwright sets the proxy at
+        # context creation), so a proxy rotation retires it and BrowserLifecycle opens the next generation
+        return f"worker-{self.worker_id}"
+
+
+class BrowserWorkerPool:
+    """Assigns requests to N workers; a hotel's follow-up requests stay on the worker that started it."""
+
+    def __init__(self, size):
+        self.size = max(1, size)
+        self.workers = [BrowserWorker(i) for i in range(self.size)]
+
+    @property
+    def isolated(self):
+        # With a single worker everything keeps running in scrapy-playwright's default context
+        return self.size > 1
+
+    def worker_for(self, request):
+        worker_id = request.meta.get("worker_id")
+        if worker_id is None or worker_id >= self.size:
+            # New hotel → least busy worker
+            worker_id = min(self.workers, key=lambda w: w.in_flight).worker_id
+            request.meta["worker_id"] = worker_id
+        return self.workers[worker_id]
+
+    def proxies_in_use(self):
+        return {w.proxy for w in self.workers if w.proxy}
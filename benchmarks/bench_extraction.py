@@ -0,0 +1,113 @@
+"""Micro-benchmark: legacy parse_hotel_page extraction vs agoda/extractors.py over saved hotel pages.
+
+Save rendered hotel pages as HTML (e.g. `page.content()` in TEST_MODE, or "Save page as" in DevTools)
+and point the script at them:
+
+    python benchmarks/bench_extraction.py benchmarks/fixtures/*.html --repeat 20
+
+A generated gallery-heavy page (`--large`, 3000 <img> by default) always runs too, as the stand-in
+for the biggest hotel pages: srcset/data-srcset/data-src variants of every photo plus non-hotel images.
+"""
+import os
+import sys
+import time
+import argparse
+from parsel import Selector
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from agoda.extractors import EXTRACTORS, IMAGE_SOURCES  # noqa: E402
+
+BASE_URL = "https://www.agoda.com/"
+# One gallery tile per photo, cycling through the markup variants seen on hotel pages
+LARGE_PAGE_TILES = (
+    '<img srcset="https://pix8.agoda.net/hotelImages/{h}/-1/{p}.jpg?ca=9&amp;s=312x 312w, '
+    'https://pix8.agoda.net/hotelImages/{h}/-1/{p}.jpg?ca=9&amp;s=768x 768w, '
+    'https://pix8.agoda.net/hotelImages/{h}/-1/{p}.jpg?ca=9&amp;s=1024x768 1024w" alt="Photo {i}">',
+    '<img src="data:image/gif;base64,R0lGODlhAQABAAAAACw=" '
+    'data-srcset="https://pix8.agoda.net/property/{h}/{p}.jpg?s=800x 1x, '
+    'https://pix8.agoda.net/property/{h}/{p}.jpg?s=1600x 2x" alt="Photo {i}">',
+    '<img data-src="https://pix8.agoda.net/hotelImages/{h}/-1/{p}.jpg?s=1024x768" alt="Photo {i}">',
+    '<img srcset="https://cf.bstatic.com/xdata/images/hotel/max500/{p}.jpg?k={i} 500w, '
+    'https://cf.bstatic.com/xdata/images/hotel/max1024x768/{p}.jpg?k={i} 1024w" alt="Photo {i}">',
+    '<img src="//pix8.agoda.net/property/{h}/{p}.jpg" alt="Photo {i}">',
+    '<img src="https://cdn6.agoda.net/images/reviews/avatar-{i}.png" alt="">',
+)
+
+
+def legacy_extract(body, base_url):
+    """The original parse_hotel_page logic, kept here as the baseline."""
+    response = Selector(text=body.decode("utf-8", "replace"))
+    description = response.css("span[data-element-name='property-short-description']::text").get()
+    data = {
+        "name": response.css("h1[data-selenium='hotel-header-name']::text").get(),
+        "address": response.css("span[data-selenium='hotel-address-map']::text").get(),
+        "description": description.strip() if description else None,
+        "facilities": response.css("div[data-element-name='atf-top-amenities-item'] p::text").getall(),
+    }
+    image_urls = []
+    for img in response.css("img"):
+        srcset = img.attrib.get("srcset")
+        if srcset and any(src in srcset for src in IMAGE_SOURCES):
+            largest = srcset.split(",")[-1].strip().split(" ")[0]
+            image_urls.append(largest)
+    data["image_urls"] = image_urls
+    return data
+
+
+def large_page(images):
+    tiles = "\n".join(LARGE_PAGE_TILES[i % len(LARGE_PAGE_TILES)].format(h=771 + i % 7, p=f"{i:08x}", i=i)
+                      for i in range(images))
+    return (
+        "<!DOCTYPE html><html><head><title>Large gallery</title></head><body>"
+        '<h1 data-selenium="hotel-header-name">Large Gallery Hotel</h1>'
+        '<span data-selenium="hotel-address-map">1 Example Rd, Bangkok, Thailand</span>'
+        '<span data-element-name="property-short-description">A page with a very long photo gallery.</span>'
+        + '<div data-element-name="atf-top-amenities-item"><p>Free Wi-Fi</p></div>' * 20
+        + f'<div class="gallery">{tiles}</div></body></html>'
+    ).encode()
+
+
+def bench(extract, pages, repeat):
+    """ms per extraction and image count, per page."""
+    results = {}
+    for name, body in pages.items():
+        started = time.perf_counter()
+        for _ in range(repeat):
+            extract(body, BASE_URL)
+        results[name] = ((time.perf_counter() - started) / repeat * 1000, len(extract(body, BASE_URL)["image_urls"]))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fixtures", nargs="*", help="saved hotel page HTML files")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--large", type=int, default=3000, help="<img> tags on the generated page (0 = skip it)")
+    args = parser.parse_args()
+
+    pages = {}
+    if args.large:
+        pages[f"generated ({args.large} img)"] = large_page(args.large)
+    for path in args.fixtures:
+        with open(path, "rb") as f:
+            pages[os.path.basename(path)] = f.read()
+
+    engines = {"legacy (parsel)": legacy_extract}
+    for name, cls in EXTRACTORS.items():
+        try:
+            engines[name] = cls().extract
+        except ImportError:
+            print(f"[SKIP] {name}: not installed")
+
+    results = {name: bench(extract, pages, args.repeat) for name, extract in engines.items()}
+    baseline = results["legacy (parsel)"]
+
+    print(f"{len(pages)} pages × {args.repeat} runs")
+    for page in pages:
+        print(f"\n{page}\n{'engine':<18}{'ms/page':>10}{'speedup':>10}{'images':>10}")
+        for name, per_page in results.items():
+            ms, images = per_page[page]
+            print(f"{name:<18}{ms:>10.2f}{baseline[page][0] / ms:>9.1f}x{images:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Micro-benchmark: ProxyUserAgentAndCaptchaMiddleware.process_request alone, vs the old per-request decoration.
+
+No network and no browser: pre-built requests are decorated in a loop, with the repo's user_agents.txt,
+chrome_headers.json and proxies.txt (or --proxies N fake ones) and a cookie session for every proxy.
+
+    python benchmarks/bench_middleware.py --requests 50000 --workers 4
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import datetime
+import tempfile
+from scrapy import Request, Spider
+from scrapy.settings import Settings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from agoda.middlewares import ProxyUserAgentAndCaptchaMiddleware  # noqa: E402
+from agoda.header_profiles import HeaderProfiles  # noqa: E402
+from agoda.proxy_scheduler import ProxyScheduler  # noqa: E402
+from agoda.cookie_store import CookieStore  # noqa: E402
+
+URLS = [
+    "https://www.agoda.com/api/cronos/search/GetUnifiedSuggestResult/3/1/1/0/en-us/?searchText=hotel",
+    "https://www.agoda.com/some-hotel/hotel/bangkok-th.html",
+    "https://www.agoda.com/search?city=9395",
+]
+COOKIES = {"agoda.user.03": "UserId=1234", "agoda.version.03": "CookieId=5678", "agoda.prius": "PriusID=0",
+           "ASP.NET_SessionId": "abcdef", "agoda.lastclicks": "1891475||abc"}
+
+
+class LegacyDecorator:
+    """The original process_request header/cookie logic, kept here as the baseline."""
+
+    def __init__(self, user_agents, chrome_headers, proxies, cookie_jar):
+        self.agoda_user_agents = user_agents
+        self.chrome_headers = chrome_headers
+        self.proxies = proxies
+        self.cookie_jar = cookie_jar
+        self.request_count = 0
+        self.proxy = None
+
+    def process_request(self, request, spider):
+        if not self.proxy or self.request_count >= 5:
+            self.proxy = random.choice(self.proxies)
+            self.request_count = 0
+            if spider.settings.getbool("TEST_MODE"):
+                spider.logger.info(f"[PROXY] Rotated to new proxy: {self.proxy}")
+        self.request_count += 1
+        request.meta["proxy"] = self.proxy
+
+        proxy_data = self.cookie_jar.get(self.proxy)
+        if proxy_data:
+            age = datetime.datetime.utcnow() - datetime.datetime.fromisoformat(proxy_data["last_updated"])
+            if age.total_seconds() < 86400:
+                cookie_str = "; ".join(f"{k}={v}" for k, v in proxy_data["cookies"].items())
+                request.headers["Cookie"] = cookie_str
+                if spider.settings.getbool("TEST_MODE"):
+                    spider.logger.info(f"[COOKIES] Injected for proxy {self.proxy}: {cookie_str}")
+
+        if any(domain in request.url for domain in ("agoda.com",)):
+            ua = random.choice(self.agoda_user_agents)
+            hdr_extra = self.chrome_headers.get(ua, {})
+            if spider.settings.getbool("TEST_MODE"):
+                spider.logger.info(f"[UA] {ua}")
+                spider.logger.info(f"[Headers] {hdr_extra}")
+            request.headers["User-Agent"] = ua
+            request.meta["user_agent"] = ua
+            for k, v in hdr_extra.items():
+                request.headers[k] = v
+
+
+def bench(decorator, spider, count):
+    # Requests are built before the clock starts: Request() alone costs about as much as the decoration
+    requests = [Request(URLS[i % len(URLS)]) for i in range(count)]
+    process_request = decorator.process_request
+    started = time.perf_counter()
+    for request in requests:
+        process_request(request, spider)
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--proxies", type=int, default=0, help="use N fake proxies instead of proxies.txt")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    profiles = HeaderProfiles.from_files("user_agents.txt", "chrome_headers.json")
+    if args.proxies:
+        proxies = [f"http://10.0.{i // 256}.{i % 256}:8080" for i in range(args.proxies)]
+    else:
+        with open("proxies.txt") as pf:
+            proxies = [line.strip() for line in pf if line.strip()]
+
+    tmp = tempfile.mkdtemp(prefix="bench_middleware_")
+    cookie_store = CookieStore(os.path.join(tmp, "cookies.json"), "https://www.agoda.com/")
+    cookie_store.schedule_save = lambda: None  # no reactor here; nothing needs saving
+    now = time.time()
+    for proxy in proxies:
+        cookie_store.update_from_storage_state(proxy, {"cookies": [
+            {"name": k, "value": v, "domain": ".agoda.com", "path": "/", "expires": now + 3600}
+            for k, v in COOKIES.items()]})
+    legacy_jar = {proxy: {"cookies": dict(COOKIES), "last_updated": datetime.datetime.utcnow().isoformat()}
+                  for proxy in proxies}
+
+    middleware = ProxyUserAgentAndCaptchaMiddleware(
+        profiles, proxies, retry_times=3, workers=args.workers,
+        scheduler=ProxyScheduler(proxies, os.path.join(tmp, "proxy_health.json")),
+        cookie_store=cookie_store,
+    )
+    legacy = LegacyDecorator([p.user_agent for p in profiles.profiles],
+                             {p.user_agent: dict(p.headers) for p in profiles.profiles}, proxies, legacy_jar)
+    spider = Spider(name="bench")
+    spider.settings = Settings({"TEST_MODE": False})
+
+    def run(decorator):
+        return min(bench(decorator, spider, args.requests) for _ in range(args.repeat))
+
+    results = {"legacy": run(legacy), "middleware": run(middleware)}
+    print(f"{args.requests} requests × best of {args.repeat}, {len(proxies)} proxies, "
+          f"{len(profiles)} header profiles, {args.workers} workers\n")
+    print(f"{'decorator':<14}{'µs/request':>12}{'speedup':>10}")
+    for name, us in results.items():
+        print(f"{name:<14}{us:>12.2f}{results['legacy'] / us:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""Offline end-to-end benchmark: runs AgodaSearchSpider against recorded pages served locally.
+
+No agoda.com, no paid proxies: the replay server (benchmarks/replay_server.py) stands in for the site
+and for the proxy, Playwright renders the recorded pages, and items go to a SQLite stand-in
+(default) or to the real HotelDataPipeline (--db postgres, uses POSTGRES_* from .env).
+
+    python benchmarks/replay_bench.py --fixtures benchmarks/fixtures --hotels 50
+    python benchmarks/replay_bench.py --fixtures benchmarks/fixtures --captcha-rate 0.1 --compare results/old.json
+
+Reports hotels/sec, p50/p95 per stage, peak RSS and bytes transferred, and saves everything as JSON
+(benchmarks/results/<timestamp>.json) so two builds can be compared.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import sqlite3
+import argparse
+import datetime
+import resource
+import threading
+import tempfile
+import subprocess
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from benchmarks.replay_server import ReplayState, start_server  # noqa: E402
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(round(q * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+class StageCollector:
+    """Collects per-stage latency samples from responses (download) and page step timings."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.first_item_at = None
+        self.items = 0
+
+    def response_received(self, response, request, spider):
+        meta = request.meta
+        stage = meta.get("page_type") or ("autosuggest" if meta.get("playwright") is False else "other")
+        if "download_latency" in meta:
+            self.samples[f"{stage}_page"].append(meta["download_latency"])
+        for name, timing in meta.get("step_timings", {}).items():
+            self.samples[f"step_{name}"].append(timing["ms"] / 1000)
+
+    def item_scraped(self, item, response, spider):
+        self.items += 1
+
+
+class RssSampler:
+    """Peak RSS of the live browser process tree (Playwright driver + Chromium), sampled while the crawl
+    runs. RUSAGE_CHILDREN only covers children that have already exited and been waited for."""
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.peak = None
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="rss-sampler", daemon=True)
+
+    def run(self):
+        from agoda.browser_lifecycle import process_tree_rss
+        while not self.stopped.is_set():
+            rss = process_tree_rss()
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+            self.stopped.wait(self.interval)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        return self.peak
+
+
+class SQLiteHotelPipeline:
+    """SQLite stand-in for HotelDataPipeline: same row mapping, batched inserts, flush timings in stats."""
+
+    def open_spider(self, spider):
+        from agoda.pipelines import HotelDataPipeline, STAGING_COLUMNS
+        self.row_from_item = HotelDataPipeline.row_from_item
+        self.columns = STAGING_COLUMNS
+        self.connection = sqlite3.connect(spider.settings.get("BENCH_SQLITE_PATH"))
+        self.connection.execute(f"CREATE TABLE IF NOT EXISTS hotels ({', '.join(self.columns)}, UNIQUE(url))")
+        self.buffer = []
+        self.buffer_size = spider.settings.getint("DB_FLUSH_SIZE", 100)
+        self.flush_times = []
+        self.stats = spider.crawler.stats
+
+    def process_item(self, item, spider):
+        row = self.row_from_item(item)
+        self.buffer.append(tuple(json.dumps(v) if isinstance(v, list) else v for v in row))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+        return item
+
+    def flush(self):
+        started = time.perf_counter()
+        placeholders = ", ".join("?" for _ in self.columns)
+        self.connection.executemany(
+            f"INSERT OR IGNORE INTO hotels ({', '.join(self.columns)}) VALUES ({placeholders})", self.buffer
+        )
+        self.connection.commit()
+        self.flush_times.append(time.perf_counter() - started)
+        self.buffer.clear()
+
+    def close_spider(self, spider):
+        if self.buffer:
+            self.flush()
+        self.stats.set_value("bench/db_flush_times", self.flush_times)
+        self.connection.close()
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def write_inputs(workdir, hotels, fixtures):
+    names = sorted(n[:-5] for n in os.listdir(fixtures) if n.endswith(".html"))
+    hotels_file = os.path.join(workdir, "hotels.csv")
+    with open(hotels_file, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["hotel_name", "address", "city_name"])
+        for i in range(hotels):
+            writer.writerow([f"{names[i % len(names)]} {i}", f"{i} Replay Street", "Replay City"])
+    return hotels_file
+
+
+def run(args):
+    state = ReplayState(args.fixtures, captcha_rate=args.captcha_rate,
+                        autosuggest_hit_rate=args.autosuggest_hit_rate, seed=args.seed)
+    server, base_url = start_server(state)
+    workdir = tempfile.mkdtemp(prefix="agoda-bench-")
+
+    proxies_file = os.path.join(workdir, "proxies.txt")
+    with open(proxies_file, "w") as f:
+        f.write(base_url.rstrip("/") + "\n")  # the replay server doubles as the proxy
+
+    # settings.py reads these at import time
+    os.environ.update({
+        "TEST_MODE": "false",
+        "HOTELS_FILE": write_inputs(workdir, args.hotels, args.fixtures),
+        "PROXIES_FILE": proxies_file,
+        "BATCH_INDEX": "0",
+        "BATCH_SIZE": str(args.hotels),
+        "AGODA_BASE_URL": base_url,
+        "PLAYWRIGHT_WORKERS": str(args.workers),
+    })
+    if args.db == "sqlite":
+        os.environ.setdefault("POSTGRES_USER", "bench")
+        os.environ.setdefault("POSTGRES_PASSWORD", "bench")
+
+    from scrapy import signals
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+    from agoda.spiders.hotel_search_browser import AgodaSearchSpider
+
+    os.chdir(ROOT)
+    settings = get_project_settings()
+    settings.setdict({
+        "LOG_LEVEL": args.log_level,
+        "DOWNLOAD_DELAY": 0,
+        "FEEDS": {},
+        "HEADER_DOMAINS": ["127.0.0.1"],
+        "AUTOSUGGEST_URL": base_url + "api/cronos/search/?searchText={query}",
+        "RESOLVER_ENABLED": args.autosuggest_hit_rate > 0,
+        "RESOLUTION_CACHE_PATH": os.path.join(workdir, "resolution_cache.sqlite"),
+        "CHECKPOINT_DIR": os.path.join(workdir, "checkpoints"),
+        "PROXY_HEALTH_FILE": os.path.join(workdir, "proxy_health.json"),
+        "DB_DEAD_LETTER_FILE": os.path.join(workdir, "db_dead_letter.ndjson"),
+        "FAILURE_STORE_PATH": os.path.join(workdir, "failures.sqlite"),
+        "COOKIE_JAR_FILE": os.path.join(workdir, "cookies.json"),
+        "IMAGE_MANIFEST_DIR": os.path.join(workdir, "image_manifests"),
+        "SCREENSHOT_MODE": "off",
+        "CAPTCHA_RETRY_TIMES": args.captcha_retries,
+        "PLAYWRIGHT_LAUNCH_OPTIONS": {"headless": True},
+        "BENCH_SQLITE_PATH": os.path.join(workdir, "hotels.sqlite"),
+    }, priority="cmdline")
+    # Nothing may leave the machine: abort every request that isn't for the replay server
+    offline = {"resource_types": ["image", "media", "font"], "url_patterns": [r"^https?://(?!127\.0\.0\.1)"]}
+    settings.set("PLAYWRIGHT_BLOCKING", {"search": offline, "hotel": offline}, priority="cmdline")
+    if args.db == "sqlite":
+        settings.set("ITEM_PIPELINES", {"benchmarks.replay_bench.SQLiteHotelPipeline": 300}, priority="cmdline")
+
+    collector = StageCollector()
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(AgodaSearchSpider)
+    crawler.signals.connect(collector.response_received, signal=signals.response_received)
+    crawler.signals.connect(collector.item_scraped, signal=signals.item_scraped)
+
+    sampler = RssSampler()
+    sampler.start()
+    started = time.perf_counter()
+    process.crawl(crawler)
+    process.start()
+    elapsed = time.perf_counter() - started
+    browser_rss = sampler.stop()
+    server.shutdown()
+
+    stats = crawler.stats.get_stats()
+    samples = dict(collector.samples)
+    if stats.get("bench/db_flush_times"):
+        samples["db_flush"] = stats["bench/db_flush_times"]
+
+    # ru_maxrss is KB on Linux, bytes on macOS
+    rss_unit = 1024 if sys.platform != "darwin" else 1
+    return {
+        "build": git_revision(),
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("compare", "output")},
+        "hotels": args.hotels,
+        "items": collector.items,
+        "elapsed_seconds": round(elapsed, 3),
+        "hotels_per_second": round(collector.items / elapsed, 4) if elapsed else None,
+        "stages": {
+            name: {"count": len(values),
+                   "p50": round(percentile(values, 0.5), 4),
+                   "p95": round(percentile(values, 0.95), 4)}
+            for name, values in sorted(samples.items()) if values
+        },
+        "peak_rss_mb": {
+            "spider": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_unit / 2**20, 1),
+            "browser": round(browser_rss / 2**20, 1) if browser_rss is not None else None,
+        },
+        "bytes_transferred": state.bytes_sent,
+        "server_requests": state.requests,
+        "captchas_injected": state.captchas_injected,
+        "scrapy_stats": {k: v for k, v in stats.items()
+                         if isinstance(v, (int, float)) and not isinstance(v, bool)},
+    }
+
+
+def compare(current, previous):
+    def delta(new, old):
+        if new is None or old is None:
+            return ""
+        return f"{new - old:+.4f}" + (f" ({(new - old) / old * 100:+.1f}%)" if old else "")
+
+    print(f"\nvs {previous.get('build')} ({previous.get('timestamp')}):")
+    print(f"  hotels/sec      {current['hotels_per_second']}  {delta(current['hotels_per_second'], previous['hotels_per_second'])}")
+    print(f"  bytes           {current['bytes_transferred']}  {delta(current['bytes_transferred'], previous['bytes_transferred'])}")
+    for kind in ("spider", "browser"):
+        print(f"  peak RSS {kind:<7}{current['peak_rss_mb'][kind]} MB  "
+              f"{delta(current['peak_rss_mb'][kind], previous['peak_rss_mb'][kind])}")
+    for stage, figures in current["stages"].items():
+        old = previous.get("stages", {}).get(stage, {})
+        print(f"  {stage:<24} p50 {figures['p50']} {delta(figures['p50'], old.get('p50'))}"
+              f"  p95 {figures['p95']} {delta(figures['p95'], old.get('p95'))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--fixtures", required=True, help="directory of recorded hotel pages (*.html)")
+    parser.add_argument("--hotels", type=int, default=20, help="input rows to crawl")
+    parser.add_argument("--workers", type=int, default=1, help="PLAYWRIGHT_WORKERS")
+    parser.add_argument("--captcha-rate", type=float, default=0.0, help="share of HTML pages served as CAPTCHA")
+    parser.add_argument("--captcha-retries", type=int, default=1, help="CAPTCHA_RETRY_TIMES")
+    parser.add_argument("--autosuggest-hit-rate", type=float, default=0.0,
+                        help="share of autosuggest lookups that resolve a URL (0 disables the resolver)")
+    parser.add_argument("--db", choices=("sqlite", "postgres"), default="sqlite")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", default=None, help="defaults to benchmarks/results/<timestamp>.json")
+    parser.add_argument("--compare", default=None, help="previous result JSON to compare against")
+    args = parser.parse_args()
+
+    result = run(args)
+    output = args.output or os.path.join(ROOT, "benchmarks", "results",
+                                         f"{datetime.datetime.now():%Y-%m-%d_%H-%M-%S}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(f"{result['items']}/{result['hotels']} hotels in {result['elapsed_seconds']}s "
+          f"→ {result['hotels_per_second']} hotels/sec")
+    print(f"bytes transferred: {result['bytes_transferred']}  captchas injected: {result['captchas_injected']}")
+    print(f"peak RSS: spider {result['peak_rss_mb']['spider']} MB, browser {result['peak_rss_mb']['browser']} MB")
+    for stage, figures in result["stages"].items():
+        print(f"  {stage:<24} n={figures['count']:<5} p50={figures['p50']}s  p95={figures['p95']}s")
+    print(f"saved → {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
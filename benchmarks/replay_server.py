@@ -0,0 +1,143 @@
+"""Local stand-in for agoda.com used by the replay benchmark.
+
+Serves:
+  /                      stub homepage with the same selectors as Agoda's search box (consent banner,
+                         text input, suggestion list, search button)
+  /graphql/search        the "search results" API call the search step waits for
+  /search?text=...       results page with one li.PropertyCard linking to a recorded hotel page
+  /hotel/<name>.html     recorded hotel pages (saved HTML) from the fixtures directory
+  /api/cronos/...        autosuggest JSON, returning a hotel URL for `autosuggest_hit_rate` of queries
+
+Any HTML page is swapped for a CAPTCHA page at `captcha_rate`. Requests in proxy form
+(absolute URI) are accepted too, so the server can also be listed as the proxy.
+"""
+import os
+import json
+import random
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, quote
+
+HOMEPAGE = """<!doctype html>
+<html><head><title>Agoda (replay)</title></head><body>
+<button data-element-name="consent-banner-reject-btn" onclick="this.remove()">Reject</button>
+<input data-selenium="textInput" id="q">
+<ul id="suggestions" style="display:none">
+  <li data-selenium="topDestinationListItem">first suggestion</li>
+</ul>
+<button data-selenium="searchButton">Search</button>
+<script>
+  const q = document.getElementById("q"), list = document.getElementById("suggestions");
+  q.addEventListener("input", () => { list.style.display = q.value ? "block" : "none"; });
+  list.querySelector("li").addEventListener("click", () => { list.style.display = "none"; });
+  document.querySelector("[data-selenium=searchButton]").addEventListener("click", async () => {
+    const text = encodeURIComponent(q.value);
+    await fetch("/graphql/search?text=" + text);
+    location.href = "/search?text=" + text;
+  });
+</script>
+</body></html>"""
+
+RESULTS_PAGE = """<!doctype html>
+<html><head><title>Search results (replay)</title></head><body>
+<ul><li class="PropertyCard"><a href="{href}">{name}</a></li></ul>
+</body></html>"""
+
+CAPTCHA_PAGE = """<!doctype html>
+<html><head><title>Verify</title></head><body>
+<div class="g-recaptcha" data-sitekey="replay"></div>
+</body></html>"""
+
+
+class ReplayState:
+    def __init__(self, fixtures_dir, captcha_rate=0.0, autosuggest_hit_rate=0.0, seed=0):
+        self.hotels = {}
+        for name in sorted(os.listdir(fixtures_dir)):
+            if name.endswith(".html"):
+                with open(os.path.join(fixtures_dir, name), "rb") as f:
+                    self.hotels[name] = f.read()
+        if not self.hotels:
+            raise ValueError(f"No recorded hotel pages (*.html) in {fixtures_dir}")
+        self.names = list(self.hotels)
+        self.captcha_rate = captcha_rate
+        self.autosuggest_hit_rate = autosuggest_hit_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.bytes_sent = 0
+        self.requests = 0
+        self.captchas_injected = 0
+
+    def hotel_for(self, query):
+        # Same query → same recorded page, so re-runs are comparable
+        digest = hashlib.sha1(query.encode("utf-8")).digest()
+        return self.names[int.from_bytes(digest[:4], "big") % len(self.names)]
+
+    def roll(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+    def count(self, size, captcha=False):
+        with self.lock:
+            self.bytes_sent += size
+            self.requests += 1
+            self.captchas_injected += captcha
+
+
+def make_handler(state):
+    class ReplayHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass  # keep benchmark output clean
+
+        def do_GET(self):
+            url = urlsplit(self.path)  # absolute URI when used as a proxy
+            query = parse_qs(url.query)
+            text = query.get("text", query.get("searchText", [""]))[0]
+
+            if url.path == "/":
+                self.html(HOMEPAGE.encode("utf-8"))
+            elif url.path.startswith("/graphql/search"):
+                self.send(200, b'{"data": {"search": "ok"}}', "application/json")
+            elif url.path == "/search":
+                name = state.hotel_for(text)
+                page = RESULTS_PAGE.format(href=f"/hotel/{quote(name)}", name=name)
+                self.html(page.encode("utf-8"))
+            elif url.path.startswith("/hotel/"):
+                body = state.hotels.get(os.path.basename(url.path))
+                if body is None:
+                    self.send(404, b"not found", "text/plain")
+                else:
+                    self.html(body)
+            elif url.path.startswith("/api/cronos/"):
+                payload = {}
+                if state.roll(state.autosuggest_hit_rate):
+                    payload = {"ViewModelList": [{"Url": f"/hotel/{quote(state.hotel_for(text))}"}]}
+                self.send(200, json.dumps(payload).encode("utf-8"), "application/json")
+            else:
+                self.send(404, b"not found", "text/plain")
+
+        def html(self, body):
+            if state.roll(state.captcha_rate):
+                self.send(200, CAPTCHA_PAGE.encode("utf-8"), "text/html; charset=utf-8", captcha=True)
+            else:
+                self.send(200, body, "text/html; charset=utf-8")
+
+        def send(self, status, body, content_type, captcha=False):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            state.count(len(body), captcha)
+
+    return ReplayHandler
+
+
+def start_server(state, host="127.0.0.1", port=0):
+    """Start the replay server in a daemon thread; returns (server, base_url)."""
+    server = ThreadingHTTPServer((host, port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="replay-server", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/"
@@ -23,8 +23,11 @@ fi
 # ----------- Handle CLI Options ----------
 MODE="test"
 RUN_ALL=false
+RANGE="0-254" # adjust it for production mode based on data size
 CLI_BATCH_INDEX=""
 SETUP=false
+USE_QUEUE=false
+RETRY_FAILED=false
 
 while [[ "$#" -gt 0 ]]; do
     case $1 in
@@ -32,7 +35,10 @@ while [[ "$#" -gt 0 ]]; do
         --test) MODE="test" ;;
         --all) RUN_ALL=true ;;
         --batch=*) CLI_BATCH_INDEX="${1#*=}" ;;
+        --range=*) RUN_ALL=true; RANGE="${1#*=}" ;;
         --setup) SETUP=true ;;
+        --queue) USE_QUEUE=true ;;
+        --retry-failed) RETRY_FAILED=true ;;
         *) echo "⚠️ Unknown option: $1" ;;
     esac
     shift
@@ -86,6 +92,9 @@ timestamp=$(date +"%Y-%m-%d_%H-%M-%S")
 mkdir -p logs/$timestamp
 
 # ----------- Batch Mode ------------------
+FIRST_BATCH="${RANGE%-*}"
+LAST_BATCH="${RANGE#*-}"
+
 # BATCH_INDEX Precedence order: Use CLI value > fallback to .env value > fallback to default (0)
 if [ -n "$CLI_BATCH_INDEX" ]; then
     export BATCH_INDEX="$CLI_BATCH_INDEX"
@@ -93,18 +102,24 @@ elif [ -z "$BATCH_INDEX" ]; then
     export BATCH_INDEX=0
 fi
 
-if [ "$RUN_ALL" = true ]; then
-    echo "🔁 Running all batches..."
-    for i in {0..254}; do # adjust it for production mode based on data size
-        export BATCH_INDEX=$i
-        echo "▶️ Batch $BATCH_INDEX"
-        LOG_FILE=logs/$timestamp/batch_$BATCH_INDEX.log
-        scrapy crawl agoda_search_browser -s LOG_FILE=$LOG_FILE
-    done
+if [ "$RETRY_FAILED" = true ]; then
+    # Recovery pass: only hotels recorded in output/failures.sqlite whose retry is due
+    echo "🔂 Retrying failed hotels..."
+    scrapy crawl agoda_search_browser -a mode=retry-failed -s LOG_FILE=logs/$timestamp/retry_failed.log
+elif [ "$USE_QUEUE" = true ]; then
+    # Distributed mode: start this on as many machines as needed, they share the work queue (WORK_QUEUE in .env)
+    export WORK_QUEUE="${WORK_QUEUE:-postgres}"
+    echo "📬 Working from the shared queue ($WORK_QUEUE)..."
+    scrapy crawl agoda_search_browser -s LOG_FILE=logs/$timestamp/queue.log
+elif [ "$RUN_ALL" = true ]; then
+    # One long-running process for every batch: browser, DB connection and proxy/UA/header files are set up once.
+    # Per-batch logs/stats still land in logs/$timestamp/batch_N.log and batch_N.stats.json
+    echo "🔁 Running all batches ($FIRST_BATCH..$LAST_BATCH) in one process..."
+    python -m agoda.batch_runner --start $FIRST_BATCH --end $LAST_BATCH --log-dir logs/$timestamp
 else
     echo "▶️ Running single batch (BATCH_INDEX=$BATCH_INDEX)"
     LOG_FILE=logs/$timestamp/batch_$BATCH_INDEX.log
-    scrapy crawl agoda_search_browser -s LOG_FILE=$LOG_FILE
+    scrapy crawl agoda_search_browser -s LOG_FILE=$LOG_FILE -s BATCH_LOG_DIR=logs/$timestamp
 fi
 
 echo "✅ Done"
@@ -115,5 +130,8 @@ echo "✅ Done"
 # | .env batch val, then 0  | `./launch.sh`                   |
 # | Test batch 10           | `./launch.sh --batch=10`        |
 # | All batches             | `./launch.sh --all`             |
+# | Batches 10 to 20        | `./launch.sh --range=10-20`     |
 # | Production mode         | `./launch.sh --prod`            |
 # | Prod batch 20           | `./launch.sh --prod --batch=20` |
+# | Node of a shared queue  | `./launch.sh --prod --queue`    |
+# | Retry failed hotels     | `./launch.sh --retry-failed`    |
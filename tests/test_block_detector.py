@@ -0,0 +1,56 @@
+import os
+import pytest
+from conftest import ROOT, read_fixture
+from agoda.block_detector import BlockDetector, OK, CAPTCHA, SOFT_BLOCK
+
+HOTEL_URL = "https://www.agoda.com/baan-chaweng-beach-resort-spa/hotel/koh-samui-th.html"
+
+
+@pytest.fixture(scope="module")
+def detector():
+    return BlockDetector.from_file(os.path.join(ROOT, "block_rules.json"))
+
+
+def classify_page(detector, name, status=200, url=HOTEL_URL):
+    return detector.classify(status, url, read_fixture("block_pages", name))
+
+
+@pytest.mark.parametrize("name, verdict", [
+    ("captcha_hard.html", CAPTCHA),
+    ("soft_block.html", SOFT_BLOCK),
+    ("hotel_ok.html", OK),
+    ("hotel_verified_reviews.html", OK),  # "verified", "access", "blocked out" in guest reviews
+])
+def test_classify_saved_pages(detector, name, verdict):
+    assert classify_page(detector, name)[0] == verdict
+
+
+def test_captcha_marker_after_large_head(detector):
+    body = read_fixture("block_pages", "captcha_after_large_head.html")
+    assert body.index(b"</head>") > detector.head_bytes  # the marker is outside the first window
+    verdict, reason = detector.classify(200, HOTEL_URL, body)
+    assert verdict == CAPTCHA
+    assert reason == "marker sec-if-cpt-container"
+
+
+def test_marker_past_both_windows_is_ignored(detector):
+    body = read_fixture("block_pages", "hotel_ok.html").replace(
+        b"</body>", b"<p>" + b"x" * (2 * detector.head_bytes) + b"</p><div class=\"g-recaptcha\"></div></body>")
+    assert detector.classify(200, HOTEL_URL, body) == (OK, None)
+
+
+def test_marker_cut_at_window_boundary(detector):
+    # Short <head>, and a marker straddling the end of the first window: the second window overlaps it
+    prefix = b"<html><head></head><body><p>"
+    filler = b"x" * (detector.head_bytes - 10 - len(prefix))
+    body = prefix + filler + b"<div id=\"sec-if-cpt-container\"></div></p></body></html>"
+    assert detector.classify(200, HOTEL_URL, body)[0] == CAPTCHA
+
+
+def test_status_checked_before_body(detector):
+    assert classify_page(detector, "hotel_ok.html", status=429) == (SOFT_BLOCK, "status 429")
+
+
+def test_url_patterns(detector):
+    assert classify_page(detector, "hotel_ok.html", url="https://www.agoda.com/sec-cp-challenge?x=1")[0] == CAPTCHA
+    assert classify_page(detector, "hotel_ok.html", url="https://www.agoda.com/AccessDenied")[0] == SOFT_BLOCK
@@ -0,0 +1,65 @@
+import asyncio
+
+from scrapy import Request
+from scrapy.utils.test import get_crawler
+
+from agoda.browser_lifecycle import BrowserLifecycle
+from agoda.metrics import get_metrics
+
+
+class FakeContext:
+    browser = None
+
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+class FakePage:
+    def __init__(self, context):
+        self.context = context
+        self.listeners = {}
+
+    def once(self, event, callback):
+        self.listeners[event] = callback
+
+    def close(self):
+        self.listeners.pop("close")(self)
+
+
+def open_page(lifecycle, stats, name):
+    # What scrapy-playwright does for a request in a new context, then the page init coroutine
+    stats.inc_value("playwright/context_count")
+    page = FakePage(FakeContext())
+    lifecycle.track(page, Request("https://www.agoda.com/", meta={"playwright_context": name}))
+    return page
+
+
+def test_contexts_gauge_drops_when_a_retired_generation_closes():
+    crawler = get_crawler()
+    stats = crawler.stats
+    lifecycle = BrowserLifecycle(crawler, max_pages=0, sample_interval=0)
+    metrics = get_metrics(crawler)
+
+    def contexts():
+        return metrics.snapshot()["gauges"]["browser_contexts"]
+
+    async def run():
+        page = open_page(lifecycle, stats, "worker-0")
+        open_page(lifecycle, stats, "worker-1")
+        assert contexts() == 2
+
+        lifecycle.retire("worker-0")
+        assert contexts() == 2  # still has an open page
+        page.close()
+        await asyncio.sleep(0)
+        assert page.context.closed and contexts() == 1
+
+        open_page(lifecycle, stats, lifecycle.context_name("worker-0"))
+        assert contexts() == 2
+        lifecycle.browser_disconnected()
+        assert contexts() == 0
+
+    asyncio.run(run())
@@ -0,0 +1,84 @@
+import pytest
+from conftest import read_fixture
+from agoda.extractors import (EXTRACTORS, LxmlExtractor, SelectolaxExtractor, parse_srcset, largest_candidate,
+                              image_key)
+
+BASE_URL = "https://www.agoda.com/riverside-boutique-hotel/hotel/chiang-mai-th.html"
+PAGES = ["hotel_gallery.html"]
+
+
+@pytest.mark.parametrize("page", PAGES)
+def test_backends_agree(page):
+    pytest.importorskip("selectolax", reason="optional selectolax backend not installed")
+    body = read_fixture("hotel_pages", page)
+    assert LxmlExtractor().extract(body, BASE_URL) == SelectolaxExtractor().extract(body, BASE_URL)
+
+
+def test_gallery_page():
+    result = LxmlExtractor().extract(read_fixture("hotel_pages", "hotel_gallery.html"), BASE_URL)
+    assert result["name"] == "Riverside Boutique Hotel "  # direct text only, like parsel's ::text
+    assert result["address"] == "12 Charoenrat Rd, Wat Ket, Chiang Mai, Thailand, 50000"
+    assert result["description"] == "Quiet rooms on the Ping River, 10 minutes from the Night Bazaar."
+    assert result["facilities"] == ["Free Wi-Fi in all rooms", "Airport transfer", "Front desk [24-hour]"]
+    assert result["image_urls"] == [
+        "https://pix8.agoda.net/hotelImages/771/-1/aaa111.jpg?ca=9&s=1024x768",
+        "https://pix8.agoda.net/property/771/bbb222.jpg?s=1600x",
+        "https://cf.bstatic.com/xdata/images/hotel/max1024x768/ccc,333.jpg?k=1",
+        "https://pix8.agoda.net/hotelImages/771/-1/ddd444.jpg?s=1200x",
+        "https://pix8.agoda.net/hotelImages/771/-1/eee555.jpg?s=1024x768",
+        "https://pix8.agoda.net/property/771/fff666.jpg",
+        "https://pix8.agoda.net/hotelImages/771/-1/ggg777.jpg?s=500x",
+    ]
+
+
+@pytest.mark.parametrize("name", sorted(EXTRACTORS))
+def test_empty_body(name):
+    if name == "selectolax":
+        pytest.importorskip("selectolax", reason="optional selectolax backend not installed")
+    result = EXTRACTORS[name]().extract(b"", BASE_URL)
+    assert result["name"] is None and result["image_urls"] == []
+
+
+@pytest.mark.parametrize("srcset, expected", [
+    ("a.jpg 1x, b.jpg 2x", [("a.jpg", None, 1.0), ("b.jpg", None, 2.0)]),
+    ("a.jpg 300w,b.jpg 600w", [("a.jpg", 300, None), ("b.jpg", 600, None)]),
+    ("a.jpg", [("a.jpg", None, None)]),
+    ("  a.jpg  ,  b.jpg 2x  ", [("a.jpg", None, None), ("b.jpg", None, 2.0)]),
+    ("a.jpg, b.jpg", [("a.jpg", None, None), ("b.jpg", None, None)]),  # trailing comma ends a bare URL
+    ("img,1.jpg 1x, img,2.jpg 2x", [("img,1.jpg", None, 1.0), ("img,2.jpg", None, 2.0)]),  # commas in URLs
+    ("a.jpg 100w 2x", [("a.jpg", 100, 2.0)]),
+    ("a.jpg widew, b.jpg 1.5x", [("a.jpg", None, None), ("b.jpg", None, 1.5)]),  # malformed descriptor
+    (",,, a.jpg 1x,,", [("a.jpg", None, 1.0)]),
+    ("", []),
+    ("   ", []),
+])
+def test_parse_srcset(srcset, expected):
+    assert parse_srcset(srcset) == expected
+
+
+@pytest.mark.parametrize("candidates, expected", [
+    ([], (None, None)),
+    ([("a.jpg", 300, None), ("b.jpg", 900, None), ("c.jpg", None, 3.0)], ("b.jpg", 900)),  # w wins over x
+    ([("a.jpg", None, 2.0), ("b.jpg", None, None)], ("a.jpg", None)),
+    ([("a.jpg", None, 0.5), ("b.jpg", None, None)], ("b.jpg", None)),  # a bare URL counts as 1x
+])
+def test_largest_candidate(candidates, expected):
+    assert largest_candidate(candidates) == expected
+
+
+@pytest.mark.parametrize("url, key", [
+    ("https://pix8.agoda.net/hotelImages/771/-1/a.jpg?ca=9&s=1024x768", "pix.agoda.net/hotelImages/771/-1/a.jpg"),
+    ("https://pix6.agoda.net/hotelImages/771/-1/a.jpg?s=312x", "pix.agoda.net/hotelImages/771/-1/a.jpg"),
+    ("https://PIX.agoda.net/property/771/b.jpg", "pix.agoda.net/property/771/b.jpg"),
+    ("https://cf.bstatic.com/xdata/images/hotel/max1024x768/c.jpg?k=1", "bstatic.com/xdata/images/hotel/c.jpg"),
+    ("https://q-xx.bstatic.com/xdata/images/hotel/square60/c.jpg", "bstatic.com/xdata/images/hotel/c.jpg"),
+    ("https://cf.bstatic.com/xdata/images/hotel/max1280x900_ao/c.jpg", "bstatic.com/xdata/images/hotel/c.jpg"),
+    ("https://cdn6.agoda.net/images/logo.svg", "cdn6.agoda.net/images/logo.svg"),
+    # not plain scheme://host/path: split by urlsplit instead, same keys
+    ("https://pix8.agoda.net:443/property/771/b.jpg", "pix.agoda.net/property/771/b.jpg"),
+    ("HTTPS://user@pix8.agoda.net/property/771/b.jpg#x", "pix.agoda.net/property/771/b.jpg"),
+    ("//pix8.agoda.net/property/771/b.jpg", "pix.agoda.net/property/771/b.jpg"),
+])
+def test_image_key(url, key):
+    assert image_key(url) == key
+
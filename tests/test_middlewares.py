@@ -0,0 +1,143 @@
+import asyncio
+import os
+
+from scrapy import Request, Spider
+from scrapy.http import HtmlResponse
+from scrapy.statscollectors import MemoryStatsCollector
+from scrapy.utils.test import get_crawler
+from scrapy_playwright.headers import use_scrapy_headers
+
+from conftest import ROOT, read_fixture
+from agoda.block_detector import BlockDetector
+from agoda.browser_lifecycle import BrowserLifecycle
+from agoda.cookie_store import CookieStore
+from agoda.header_profiles import HeaderProfiles
+from agoda.middlewares import RESOURCE_SIZE_ESTIMATES, ProxyUserAgentAndCaptchaMiddleware, ResourceBlockingMiddleware
+from agoda.proxy_scheduler import ProxyScheduler
+
+HOTEL_URL = "https://www.agoda.com/riverside-boutique-hotel/hotel/chiang-mai-th.html"
+BLOCKING = {"hotel": {"resource_types": ["image", "media", "font"], "url_patterns": [r"googletagmanager\.com"]}}
+UA = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36"
+
+
+class FakePlaywrightRequest:
+    def __init__(self, url, resource_type):
+        self.url = url
+        self.resource_type = resource_type
+
+    def is_navigation_request(self):
+        return self.resource_type == "document"
+
+    async def all_headers(self):
+        return {"user-agent": "HeadlessChrome/126.0.0.0", "accept": "*/*"}
+
+
+class FakeRoute:
+    """Walks the page's route handlers newest first, the way Playwright does."""
+
+    def __init__(self, handlers, request):
+        self.handlers = list(reversed(handlers))
+        self.request = request
+        self.outcome = None
+        self.sent_headers = None
+
+    async def run(self):
+        while self.outcome is None and self.handlers:
+            await self.handlers.pop(0)(self)
+        return self
+
+    async def abort(self):
+        self.outcome = "aborted"
+
+    async def fallback(self):
+        pass  # leave outcome unset so the next (older) handler runs
+
+    async def continue_(self, headers=None):
+        self.outcome = "sent"
+        self.sent_headers = headers if headers is not None else await self.request.all_headers()
+
+
+class FakePage:
+    def __init__(self):
+        self.handlers = []
+
+    async def route(self, pattern, handler):
+        self.handlers.append(handler)
+
+    async def load(self, url, resource_type):
+        return await FakeRoute(self.handlers, FakePlaywrightRequest(url, resource_type)).run()
+
+
+def scrapy_playwright_handler(request):
+    # Mirrors scrapy-playwright's per-page handler: Scrapy's headers win for the navigation request
+    async def handle(route):
+        headers = await use_scrapy_headers(browser_type_name="chromium", playwright_request=route.request,
+                                           scrapy_request_data={"headers": request.headers})
+        await route.continue_(headers=headers)
+    return handle
+
+
+def load_with_blocking(request, url, resource_type):
+    async def run():
+        page = FakePage()
+        await page.route("**", scrapy_playwright_handler(request))  # scrapy-playwright registers first
+        stats = MemoryStatsCollector(get_crawler())
+        blocking = ResourceBlockingMiddleware(stats, BLOCKING, RESOURCE_SIZE_ESTIMATES)
+        await blocking(page, request)
+        return await page.load(url, resource_type)
+    return asyncio.run(run())
+
+
+def hotel_request():
+    return Request(HOTEL_URL, meta={"page_type": "hotel"},
+                   headers={"User-Agent": UA, "Cookie": "agoda.user.03=abc", "Accept-Language": "en-US,en;q=0.9"})
+
+
+def test_allowed_navigation_sends_scrapy_headers():
+    route = load_with_blocking(hotel_request(), HOTEL_URL, "document")
+    assert route.outcome == "sent"
+    assert route.sent_headers["user-agent"] == UA
+    assert route.sent_headers["cookie"] == "agoda.user.03=abc"
+    assert route.sent_headers["accept-language"] == "en-US,en;q=0.9"
+
+
+def test_blocked_image_is_aborted():
+    route = load_with_blocking(hotel_request(), "https://pix8.agoda.net/hotelImages/771/-1/aaa111.jpg", "image")
+    assert route.outcome == "aborted"
+    assert route.sent_headers is None
+
+
+def captcha_middleware(tmp_path):
+    crawler = get_crawler()
+    proxies = ["http://10.0.0.1:8080", "http://10.0.0.2:8080", "http://10.0.0.3:8080"]
+    return ProxyUserAgentAndCaptchaMiddleware(
+        HeaderProfiles.from_files(os.path.join(ROOT, "user_agents.txt"), os.path.join(ROOT, "chrome_headers.json")),
+        proxies, retry_times=3, workers=2,
+        # One CAPTCHA quarantines a proxy, so the retry deterministically lands on another one
+        scheduler=ProxyScheduler(proxies, str(tmp_path / "proxy_health.json"), failure_threshold=1),
+        stats=crawler.stats,
+        block_detector=BlockDetector.from_file(os.path.join(ROOT, "block_rules.json")),
+        cookie_store=CookieStore(str(tmp_path / "cookies.json"), "https://www.agoda.com/"),
+        lifecycle=BrowserLifecycle(crawler, sample_interval=0),
+    )
+
+
+def test_captcha_retry_gets_a_new_context(tmp_path):
+    middleware = captcha_middleware(tmp_path)
+    spider = Spider("hotels")
+    request = Request(HOTEL_URL, meta={"playwright": True, "page_type": "hotel", "worker_id": 0})
+    middleware.process_request(request, spider)
+    blocked_proxy = request.meta["proxy"]
+    assert request.meta["playwright_context"] == "worker-0"
+    assert request.meta["playwright_context_kwargs"]["proxy"] == {"server": blocked_proxy}
+
+    response = HtmlResponse(HOTEL_URL, body=read_fixture("block_pages", "captcha_hard.html"), request=request)
+    retry = middleware.process_response(request, response, spider)
+    assert isinstance(retry, Request) and retry.meta["retry_times"] == 1
+    assert middleware.stats.get_value("browser/contexts_recycled") == 1
+
+    middleware.process_request(retry, spider)
+    assert retry.meta["proxy"] != blocked_proxy
+    # A fresh context, created with the new proxy (the old one stays bound to the blocked proxy)
+    assert retry.meta["playwright_context"] == "worker-0-gen-1"
+    assert retry.meta["playwright_context_kwargs"]["proxy"] == {"server": retry.meta["proxy"]}
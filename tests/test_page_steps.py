@@ -0,0 +1,54 @@
+import os
+import asyncio
+
+from scrapy.settings import Settings
+
+from conftest import ROOT, read_fixture
+from agoda.block_detector import BlockDetector, CAPTCHA
+from agoda.page_steps import capture_if_blocked, hotel_page_methods
+from agoda.screenshots import OFF, FAILURE, ScreenshotPolicy
+
+
+class FakePage:
+    url = "https://www.agoda.com/search?city=9395"
+
+    def __init__(self, body):
+        self.body = body
+        self.content_calls = 0
+
+    async def content(self):
+        self.content_calls += 1
+        return self.body.decode("utf-8")
+
+
+class RecordingScreenshots:
+    def __init__(self):
+        self.blocked = []
+
+    async def after_block(self, page, verdict):
+        self.blocked.append(verdict)
+
+
+def detector():
+    return BlockDetector.from_file(os.path.join(ROOT, "block_rules.json"))
+
+
+def test_no_block_step_when_screenshots_are_off(tmp_path):
+    screenshots = ScreenshotPolicy(mode=OFF, directory=str(tmp_path)).for_hotel("Hotel", sampled=False)
+    methods = hotel_page_methods({}, Settings(), screenshots, detector())
+    assert [m.method.__name__ for m in methods] == ["timed_step"]
+
+    screenshots = ScreenshotPolicy(mode=FAILURE, directory=str(tmp_path)).for_hotel("Hotel", sampled=False)
+    methods = hotel_page_methods({}, Settings(), screenshots, detector())
+    assert [m.method.__name__ for m in methods] == ["timed_step", "capture_if_blocked"]
+
+
+def test_block_check_only_snapshots_after_a_fallback():
+    page, screenshots = FakePage(read_fixture("block_pages", "captcha_hard.html")), RecordingScreenshots()
+    timings = {"consent": {"ms": 5, "fallback": False}, "search": {"ms": 900, "fallback": False}}
+    asyncio.run(capture_if_blocked(page, detector(), screenshots, timings))
+    assert page.content_calls == 0 and screenshots.blocked == []
+
+    timings["search"]["fallback"] = True
+    asyncio.run(capture_if_blocked(page, detector(), screenshots, timings))
+    assert page.content_calls == 1 and screenshots.blocked == [CAPTCHA]
@@ -0,0 +1,51 @@
+from agoda.pipelines import HotelDataPipeline, TRACKING_COLUMNS
+
+
+class FakeCursor:
+    def __init__(self, reloptions, columns):
+        self.catalog = (reloptions, columns)
+        self.statements = []
+
+    def execute(self, statement, params=None):
+        self.statements.append(" ".join(statement.split()))
+
+    def fetchone(self):
+        return self.catalog
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self.fake_cursor = cursor
+
+    def cursor(self):
+        return self.fake_cursor
+
+    def commit(self):
+        pass
+
+
+def alters(reloptions, columns):
+    cursor = FakeCursor(reloptions, columns)
+    HotelDataPipeline.create_tables(FakeConnection(cursor), "run-1")
+    return [s for s in cursor.statements if s.startswith("ALTER TABLE")]
+
+
+def test_migrated_table_is_not_altered():
+    columns = ["name", "url", "location", "description", "facilities", "image_urls", *TRACKING_COLUMNS]
+    assert alters(["fillfactor=90"], columns) == []
+
+
+def test_only_the_differences_are_altered():
+    columns = ["name", "url", "location", "description", "facilities", "image_urls", "content_hash"]
+    (statement,) = alters(None, columns)
+    assert "content_hash" not in statement and "ADD COLUMN IF NOT EXISTS last_changed_run TEXT" in statement
+    assert statement.endswith("SET (fillfactor = 90);")
+
+    (statement,) = alters(["fillfactor=70", "autovacuum_enabled=true"], columns + list(TRACKING_COLUMNS))
+    assert statement == "ALTER TABLE hotels SET (fillfactor = 90);"
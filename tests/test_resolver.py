@@ -0,0 +1,45 @@
+import pytest
+from scrapy import Request
+from scrapy.http import Response, TextResponse
+from scrapy.utils.test import get_crawler
+
+from agoda.resolver import find_property_url, names_match
+from agoda.spiders.hotel_search_browser import AgodaSearchSpider
+
+AUTOSUGGEST = "https://www.agoda.com/api/cronos/search/GetUnifiedSuggestResult/3/1/1/0/en-us/?searchText=x"
+
+
+@pytest.mark.parametrize("query, page_name, match", [
+    ("Riverside Boutique Hotel", "Riverside Boutique Hotel ", True),
+    ("Hotel Nikko Bangkok", "Nikko Bangkok Hotel", True),
+    ("Hilton", "Hilton Sukhumvit Bangkok", True),
+    ("Baan Chaweng Beach Resort & Spa", "Chaweng Regent Beach Resort", False),  # shares only generic words
+    ("Grand Hyatt Erawan Bangkok", "Novotel Bangkok Sukhumvit 20", False),
+])
+def test_names_match(query, page_name, match):
+    assert names_match(query, page_name) is match
+
+
+def test_find_property_url():
+    payload = {"ViewModelList": [{"Name": "Bangkok", "Url": "/city/bangkok-th.html"},
+                                 {"Name": "Hotel Nikko", "Url": "/hotel-nikko-bangkok/hotel/bangkok-th.html"}]}
+    assert find_property_url(payload) == "/hotel-nikko-bangkok/hotel/bangkok-th.html"
+
+
+@pytest.fixture
+def spider():
+    crawler = get_crawler(AgodaSearchSpider)
+    spider = AgodaSearchSpider.from_crawler(crawler)
+    spider.search_request = lambda meta: ("search", meta["hotel_query"])
+    return spider
+
+
+@pytest.mark.parametrize("response_cls, body", [
+    (Response, b"\x89PNG\r\n"),                                # binary: no .json()
+    (TextResponse, b"<html><body>Access denied</body></html>"),  # text, not JSON
+])
+def test_unusable_autosuggest_falls_back_to_search(spider, response_cls, body):
+    request = Request(AUTOSUGGEST, meta={"hotel_query": "Hotel Nikko Bangkok", "city": "Bangkok"})
+    result = spider.parse_autosuggest(response_cls(AUTOSUGGEST, body=body, request=request))
+    assert result == ("search", "Hotel Nikko Bangkok")
+    assert spider.crawler.stats.get_value("resolver/autosuggest_miss") == 1
@@ -0,0 +1,47 @@
+import time
+
+from agoda.failure_store import FailureStore, TIMEOUT
+from agoda.spiders.hotel_search_browser import AgodaSearchSpider
+from agoda.work_queue import SQLiteWorkQueue
+
+
+def queue(tmp_path, node_id="node-a"):
+    work_queue = SQLiteWorkQueue(str(tmp_path / "queue.sqlite"), "hotels.csv", node_id, lease_seconds=600)
+    work_queue.seed(row_count=50, chunk_size=25)
+    return work_queue
+
+
+def test_released_chunk_waits_out_its_delay(tmp_path):
+    work_queue = queue(tmp_path)
+    assert work_queue.lease(1) == [(0, 0, 25)]
+    work_queue.release([0], delay=0.2)
+    assert work_queue.lease(1) == [(1, 25, 50)]  # chunk 0 isn't offered during its backoff
+    assert work_queue.lease(1) == []
+    assert work_queue.remaining() == 2
+    time.sleep(0.25)
+    assert work_queue.lease(1) == [(0, 0, 25)]
+
+
+def test_release_without_delay_is_leasable_right_away(tmp_path):
+    work_queue = queue(tmp_path)
+    work_queue.lease(1)
+    work_queue.release([0])
+    assert queue(tmp_path, "node-b").lease(1) == [(0, 0, 25)]
+
+
+def test_pending_retries_only_lists_rows_not_due_yet(tmp_path):
+    failures = FailureStore(str(tmp_path / "failures.sqlite"), "hotels.csv", {TIMEOUT: {"max_attempts": 3, "backoff": 60}})
+    before = time.time()
+    failures.record(3, TIMEOUT, "Hotel A")
+    failures.record(30, TIMEOUT, "Hotel B")  # other chunk
+    pending = failures.pending_retries(0, 25)
+    assert list(pending) == [3] and pending[3] >= before + 60
+    assert failures.pending_retries(0, 25, now=pending[3] + 1) == {}
+
+
+def test_retry_delay():
+    retry_delay = AgodaSearchSpider.retry_delay
+    now = time.time()
+    assert retry_delay([3, 4], {3: now + 600}) == 0  # row 4 has no backoff: lease again right away
+    assert 290 < retry_delay([3, 4], {3: now + 600, 4: now + 300}) <= 300
+    assert retry_delay([3], {3: now - 5}) == 0